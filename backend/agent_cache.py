@@ -0,0 +1,159 @@
+"""
+Turn-level response cache for the agent
+
+Repeated read-only turns ("show my tasks", "what's pending?") are answered
+from memory. Entries are keyed by the normalized utterance, the user's
+task-list version, the agent configuration and, for a model, what else its
+prompt holds: the earlier messages and the minute of the clock. The
+version is the user's task change counter (TaskSequence.last_seq), which
+every task change in any worker advances, so a cached answer is never
+served after a write; mutations in this process also bump
+`task_versions`, which drops the user's entries right away.
+"""
+
+import copy
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+from sqlmodel import Session, select
+
+from models import TaskSequence, db_router, settings
+
+
+READ_ONLY_TOOLS = {"list_tasks", "get_task_stats"}
+
+_PUNCTUATION = re.compile(r"[^\w#\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_utterance(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", text.lower())).strip()
+
+
+def is_cacheable(result: Dict[str, Any]) -> bool:
+    """Only turns that successfully read tasks, and nothing else, may be replayed"""
+    tool_calls = result.get("tool_calls") or []
+    return bool(tool_calls) and all(
+        call.get("name") in READ_ONLY_TOOLS and "error" not in call for call in tool_calls
+    )
+
+
+def task_list_version(user_id) -> int:
+    """
+    The user's task change counter, shared by every worker. Read where the
+    tools read the task list, so a cached answer is never staler than a
+    fresh one.
+    """
+    with Session(db_router.reader(user_id)) as session:
+        last_seq = session.exec(select(TaskSequence.last_seq).where(TaskSequence.user_id == int(user_id))).first()
+        return last_seq or 0
+
+
+class TaskListVersions:
+    """Per-user task-list version, bumped by every mutating tool"""
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def get(self, user_id) -> int:
+        return self._versions.get(str(user_id), 0)
+
+    def bump(self, user_id) -> int:
+        with self._lock:
+            version = self._versions.get(str(user_id), 0) + 1
+            self._versions[str(user_id)] = version
+        for listener in self._listeners:
+            listener(str(user_id))
+        return version
+
+    def on_bump(self, listener):
+        self._listeners.append(listener)
+
+
+class TurnCache:
+    """LRU cache with a TTL, an entry cap and a byte cap"""
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 16 * 1024 * 1024,
+                 ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # key -> (expires_at, size, compute_seconds, value)
+        self._entries: "OrderedDict[Tuple, Tuple[float, int, float, Dict[str, Any]]]" = OrderedDict()
+        self._by_user: Dict[str, Set[Tuple]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved_seconds = 0.0
+
+    @staticmethod
+    def key(user_id, utterance: str, version: int, agent_config: str, context: str = "") -> Tuple:
+        return (str(user_id), normalize_utterance(utterance), version, agent_config, context)
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.latency_saved_seconds += entry[2]
+            return copy.deepcopy(entry[3])
+
+    def put(self, key: Tuple, value: Dict[str, Any], compute_seconds: float = 0.0):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, size, compute_seconds, copy.deepcopy(value))
+            self._by_user.setdefault(key[0], set()).add(key)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in list(self._by_user.get(str(user_id), ())):
+                self._remove(key)
+
+    def _remove(self, key: Tuple):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[1]
+        keys = self._by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[key[0]]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "latency_saved_seconds": round(self.latency_saved_seconds, 6),
+        }
+
+
+task_versions = TaskListVersions()
+turn_cache = TurnCache(
+    max_entries=settings.agent_cache_max_entries,
+    max_bytes=settings.agent_cache_max_bytes,
+    ttl_seconds=settings.agent_cache_ttl_seconds,
+)
+task_versions.on_bump(turn_cache.invalidate_user)
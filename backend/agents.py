@@ -1,22 +1,71 @@
 import asyncio
+import hashlib
 import json
-import websockets
+import re
 import os
+import time
+from datetime import datetime
 
-# Global counter for request IDs
-request_id_counter = 0
-
-
-# Instead of using WebSocket communication, let's directly import and call the MCP server functions
-from mcp_server import MCPServer
+from mcp_server import MCPServer, ListTasksParams, ToolResult
+from mcp_client import MCPClientPool, MCPUnavailable
+from models import settings
+from llm import LLMError, get_llm_client
+from agent_cache import is_cacheable, task_list_version, task_versions, turn_cache
+from prompt_codec import TaskContext, encode_tasks, trim_history
+from profiling import to_thread
+from tracing import span
 
 # Create a single instance of the MCP server
 mcp_server_instance = MCPServer()
 
+# With MCP_TRANSPORT=websocket the tools run on the remote MCP server instead
+mcp_pool = MCPClientPool.from_settings(settings) if settings.mcp_transport == "websocket" else None
+
+# Base task snapshots that LLM prompts are built on
+task_context = TaskContext()
+
 async def send_mcp_request(method: str, params: dict) -> dict:
     """
-    Send a request to the MCP server by directly calling the function
+    Send a request to the MCP server: over the connection pool when it is
+    remote, otherwise by directly calling the function
     """
+    with span("mcp.request", method=method):
+        if mcp_pool is not None:
+            return await _call_remote_mcp_server(method, params)
+        return await _call_mcp_server(method, params)
+
+
+async def execute_mcp_tool(name: str, arguments: dict) -> ToolResult:
+    """Run one of the model's tool calls, in-process or on the remote MCP server"""
+    if mcp_pool is None:
+        return await mcp_server_instance.execute_tool(name, arguments)
+    output = await send_mcp_request(name, arguments)
+    return ToolResult(tool_name=name, output=output, is_error=_call_error(output) is not None)
+
+
+def open_mcp_client():
+    """Start connecting to the remote MCP server, if there is one, before the first turn needs it"""
+    if mcp_pool is not None:
+        mcp_pool.start()
+
+
+async def close_mcp_client():
+    if mcp_pool is not None:
+        await mcp_pool.close()
+
+
+async def _call_remote_mcp_server(method: str, params: dict) -> dict:
+    try:
+        response = await mcp_pool.call(method, params)
+    except MCPUnavailable as e:
+        return {"error": str(e)}
+    if method not in READ_TOOLS and response["error"] is None:
+        # The server bumped the version in its own process; cached turns here must see the change too
+        task_versions.bump(params["user_id"])
+    return response["result"]
+
+
+async def _call_mcp_server(method: str, params: dict) -> dict:
     try:
         # Map method names to the corresponding functions in the MCP server
         if method == "add_task":
@@ -29,6 +78,11 @@ async def send_mcp_request(method: str, params: dict) -> dict:
             validated_params = ListTasksParams(**params)
             result = await mcp_server_instance.list_tasks(validated_params)
             return result
+        elif method == "get_task_stats":
+            from mcp_server import GetTaskStatsParams
+            validated_params = GetTaskStatsParams(**params)
+            result = await mcp_server_instance.get_task_stats(validated_params)
+            return result
         elif method == "complete_task":
             from mcp_server import CompleteTaskParams
             validated_params = CompleteTaskParams(**params)
@@ -44,6 +98,16 @@ async def send_mcp_request(method: str, params: dict) -> dict:
             validated_params = UpdateTaskParams(**params)
             result = await mcp_server_instance.update_task(validated_params)
             return result
+        elif method == "set_due_date":
+            from mcp_server import SetDueDateParams
+            validated_params = SetDueDateParams(**params)
+            result = await mcp_server_instance.set_due_date(validated_params)
+            return result
+        elif method == "set_reminder":
+            from mcp_server import SetReminderParams
+            validated_params = SetReminderParams(**params)
+            result = await mcp_server_instance.set_reminder(validated_params)
+            return result
         else:
             return {"error": f"Unknown method: {method}"}
     except Exception as e:
@@ -51,21 +115,193 @@ async def send_mcp_request(method: str, params: dict) -> dict:
         return {"error": repr(e)}
 
 
-async def run_agent(user_id: str, messages: list):
+SYSTEM_PROMPT = (
+    "You are a todo list assistant. Use the provided tools to add, list, count, complete, "
+    "delete and update the user's tasks, then answer briefly in plain language."
+)
+
+
+async def run_llm_agent(user_id: int, messages: list):
+    """
+    Run the agent against the configured OpenAI-compatible model, dispatching
+    the model's tool calls into the MCP server until it produces an answer
+    """
+    client = get_llm_client(settings)
+    tools = mcp_server_instance.tool_definitions()
+
+    # Stable system prefix (prompt + base task snapshot), trimmed history,
+    # then only the task changes since the snapshot
+    if mcp_pool is None:
+        tasks = await mcp_server_instance.list_tasks(ListTasksParams(user_id=user_id))
+    else:
+        tasks = await send_mcp_request("list_tasks", {"user_id": user_id})
+    base, delta = task_context.render(user_id, tasks if isinstance(tasks, list) else [],
+                                      settings.llm_task_token_budget)
+    conversation = [{"role": "system", "content": f"{SYSTEM_PROMPT}\n\n{base}"}]
+    history = trim_history(messages, settings.llm_history_token_budget)
+    conversation.extend({"role": m["role"], "content": m["content"]} for m in history)
+    if delta:
+        conversation.append({"role": "system", "content": delta})
+    # After the cached prefix, so the clock does not invalidate it; needed for due dates and reminders
+    conversation.append({"role": "system", "content": f"Current time: {datetime.utcnow():%Y-%m-%d %H:%M} UTC"})
+    tool_calls = []
+
+    try:
+        for _ in range(settings.llm_max_tool_rounds):
+            with span("llm.chat_completion", model=settings.llm_model):
+                reply = await client.chat_completion(conversation, tools)
+            requested = reply.get("tool_calls") or []
+            if not requested:
+                return {"response": reply.get("content") or "", "tool_calls": tool_calls}
+
+            conversation.append({"role": "assistant", "content": reply.get("content"), "tool_calls": requested})
+            calls, runnable, results = [], [], []
+            for index, call in enumerate(requested):
+                try:
+                    arguments = json.loads(call["function"].get("arguments") or "{}")
+                except json.JSONDecodeError:
+                    arguments = {}
+                name = call["function"]["name"]
+                if isinstance(arguments, dict):
+                    runnable.append(index)
+                    results.append(None)
+                else:
+                    # Not run; the error goes back to the model for this call only
+                    arguments = {}
+                    results.append(ToolResult(tool_name=name, output={"error": "Tool arguments must be a JSON object"},
+                                              is_error=True))
+                # Always act as the authenticated user, whatever the model asked for
+                arguments["user_id"] = user_id
+                calls.append({"name": name, "arguments": arguments})
+
+            outcomes = await execute_plan([calls[index] for index in runnable], execute_mcp_tool)
+            for index, outcome in zip(runnable, outcomes):
+                results[index] = outcome
+            for call, planned, result in zip(requested, calls, results):
+                if isinstance(result, Exception):
+                    output = {"error": repr(result)}
+                else:
+                    output = result.output
+                error = _call_error(output)
+                tool_calls.append(dict(planned, error=error) if error is not None else planned)
+                if planned["name"] == "list_tasks" and isinstance(output, list):
+                    content = encode_tasks(output, settings.llm_task_token_budget)
+                else:
+                    content = json.dumps(output, default=str, separators=(",", ":"))
+                conversation.append({
+                    "role": "tool",
+                    "tool_call_id": call.get("id"),
+                    "content": content,
+                })
+    except LLMError as e:
+        return {
+            "response": f"Sorry, I encountered an error: {str(e)}",
+            "tool_calls": tool_calls
+        }
+
+    return {
+        "response": "Sorry, I couldn't finish that request.",
+        "tool_calls": tool_calls
+    }
+
+
+def agent_config() -> str:
+    """Identify the agent configuration, so cached turns never cross backends"""
+    if settings.llm_api_key:
+        return f"llm:{settings.llm_base_url}:{settings.llm_model}"
+    return "rules"
+
+
+def prompt_context(messages: list) -> str:
+    """
+    What else a model's answer depends on: the earlier messages ("yes",
+    "delete it" mean something else in another conversation) and the clock
+    in the prompt. The rules agent only reads the last message.
+    """
+    if not settings.llm_api_key:
+        return ""
+    history = json.dumps([(m["role"], m["content"]) for m in messages[:-1]], separators=(",", ":"))
+    return f"{hashlib.sha256(history.encode('utf-8')).hexdigest()}:{datetime.utcnow():%Y-%m-%d %H:%M}"
+
+
+async def run_agent(user_id: int, messages: list):
+    """
+    Run the agent with MCP tools to process user messages, replaying cached
+    answers for repeated read-only turns
+    """
+    with span("agent.run", agent=agent_config()) as agent_span:
+        if not settings.agent_cache_enabled or not messages:
+            return await run_uncached_agent(user_id, messages)
+
+        version = await to_thread(task_list_version, user_id)
+        key = turn_cache.key(user_id, messages[-1]["content"], version, agent_config(), prompt_context(messages))
+        cached = turn_cache.get(key)
+        agent_span.set_attribute("cache_hit", cached is not None)
+        if cached is not None:
+            return cached
+
+        started = time.perf_counter()
+        result = await run_uncached_agent(user_id, messages)
+        # Skip the store if a write landed while the agent was running
+        if is_cacheable(result) and await to_thread(task_list_version, user_id) == version:
+            turn_cache.put(key, result, time.perf_counter() - started)
+        return result
+
+
+async def run_uncached_agent(user_id: int, messages: list):
     """
     Run the agent with MCP tools to process user messages
     """
-    # Check if GEMINI_API_KEY is set
-    api_key = os.getenv("GEMINI_API_KEY")
+    if settings.llm_api_key:
+        return await run_llm_agent(user_id, messages)
 
-    # For now, we'll use a simple rule-based approach to simulate the AI
-    # In a real implementation with a working Gemini API, we would use the code below
+    # Without a model configured, fall back to a simple rule-based approach
     last_message = messages[-1]['content'].lower() if messages else ""
+    return await run_rules_agent(user_id, last_message)
+
+
+DEFAULT_RESPONSE = "I'm your AI assistant for managing todos. You can ask me to add, list, complete, delete, or update tasks."
 
+READ_TOOLS = {"list_tasks", "get_task_stats"}
+
+# Split compound requests ("add milk, add eggs and show my pending tasks") only
+# where the next clause starts with a command, so "add bread and butter" stays whole
+_CLAUSE_SPLIT = re.compile(
+    r"\s*(?:[,;]\s*(?:and\s+)?(?:then\s+)?|\s+(?:and\s+then|and|then)\s+)"
+    r"(?=(?:add|create|show|list|display|what|how|complete|finish|mark|delete|remove|update|change|rename)\b)"
+)
+
+
+def split_utterance(text: str) -> list:
+    """Split a compound request into its individual commands"""
+    return [clause.strip() for clause in _CLAUSE_SPLIT.split(text) if clause.strip()]
+
+
+# One utterance per command, so planning them compiles every pattern the planner uses
+WARMUP_UTTERANCES = [
+    "how many tasks, add task to warm up and show my pending tasks",
+    "complete task 1", "delete task 1", "update task 1 to warm up",
+]
+
+
+def warm_up_rules():
+    """Compile the rule-based planner's regular expressions before the first turn"""
+    for utterance in WARMUP_UTTERANCES:
+        for clause in split_utterance(utterance):
+            plan_clause(0, clause)
+
+
+def plan_clause(user_id: int, last_message: str) -> dict:
+    """
+    Map one command to a tool call ({"name", "arguments"}), or to a direct
+    {"response"} when the command cannot be turned into a call
+    """
     # Simple rule-based processing to simulate AI behavior
-    if "add" in last_message or "create" in last_message or "new" in last_message:
+    if "how many" in last_message or "stats" in last_message or "statistics" in last_message:
+        return {"name": "get_task_stats", "arguments": {"user_id": user_id}}
+
+    elif "add" in last_message or "create" in last_message or "new" in last_message:
         # Extract task title from the message
-        import re
         # Look for various patterns like "add task to go to school", "create a task i am going to school", etc.
         match = None
         # Pattern 1: "add task to ..." or "add task ..."
@@ -83,22 +319,7 @@ async def run_agent(user_id: str, messages: list):
         if len(task_title) < 2:
             task_title = last_message.replace("add", "").replace("create", "").replace("task", "").replace("please", "").strip()
 
-        # Call add_task MCP tool
-        result = await send_mcp_request("add_task", {
-            "user_id": user_id,
-            "title": task_title
-        })
-
-        if "error" in result:
-            return {
-                "response": f"Sorry, I encountered an error: {result['error']}",
-                "tool_calls": []
-            }
-        else:
-            return {
-                "response": f"I've added the task '{result.get('title', task_title)}' to your list.",
-                "tool_calls": [{"name": "add_task", "arguments": {"user_id": user_id, "title": task_title}}]
-            }
+        return {"name": "add_task", "arguments": {"user_id": user_id, "title": task_title}}
 
     elif ("show" in last_message or "list" in last_message or "display" in last_message or
           "all my tasks" in last_message or
@@ -114,130 +335,154 @@ async def run_agent(user_id: str, messages: list):
         elif "complete" in last_message or "done" in last_message:
             status = "completed"
 
-        # Call list_tasks MCP tool
-        result = await send_mcp_request("list_tasks", {
-            "user_id": user_id,
-            "status": status
-        })
-
-        if "error" in result:
-            return {
-                "response": f"Sorry, I encountered an error: {result['error']}",
-                "tool_calls": []
-            }
-        else:
-            if result:
-                task_descriptions = []
-                for task in result:
-                    status_text = 'completed' if task.get('completed', False) else 'pending'
-                    # Format as expected by frontend for parsing
-                    task_descriptions.append(f"Task #{task['id']}: '{task['title']}' ({status_text})")
-
-                tasks_text = "\n".join(task_descriptions)
-                response = f"Here are your {status} tasks:\n{tasks_text}"
-            else:
-                response = f"You don't have any {status} tasks."
-
-            return {
-                "response": response,
-                "tool_calls": [{"name": "list_tasks", "arguments": {"user_id": user_id, "status": status}}]
-            }
+        return {"name": "list_tasks", "arguments": {"user_id": user_id, "status": status}}
 
     elif ("complete" in last_message or "done" in last_message or "finish" in last_message) and ("task" in last_message):
         # Extract task ID from the message - handle variations like "task no 8", "task #8", "task 8"
-        import re
         # Look for patterns like "task 8", "task no 8", "task No 9", "task #8", etc.
         match = re.search(r'task\s+(?:[Nn]o\s+|#)?(\d+)', last_message)
         if match:
-            task_id = int(match.group(1))
-
-            # Call complete_task MCP tool
-            result = await send_mcp_request("complete_task", {
-                "user_id": user_id,
-                "task_id": task_id
-            })
-
-            if "error" in result:
-                return {
-                    "response": f"Sorry, I encountered an error: {result['error']}",
-                    "tool_calls": []
-                }
-            else:
-                return {
-                    "response": f"I've marked the task '{result.get('title', 'unnamed')}' as completed.",
-                    "tool_calls": [{"name": "complete_task", "arguments": {"user_id": user_id, "task_id": task_id}}]
-                }
-        else:
-            return {
-                "response": "I couldn't identify which task to complete. Please specify the task number.",
-                "tool_calls": []
-            }
+            return {"name": "complete_task", "arguments": {"user_id": user_id, "task_id": int(match.group(1))}}
+        return {"response": "I couldn't identify which task to complete. Please specify the task number."}
 
     elif "delete" in last_message or "remove" in last_message:
         # Extract task ID from the message
-        import re
         match = re.search(r'task\s+(\d+)', last_message)
         if match:
-            task_id = int(match.group(1))
-
-            # Call delete_task MCP tool
-            result = await send_mcp_request("delete_task", {
-                "user_id": user_id,
-                "task_id": task_id
-            })
-
-            if "error" in result:
-                return {
-                    "response": f"Sorry, I encountered an error: {result['error']}",
-                    "tool_calls": []
-                }
-            else:
-                return {
-                    "response": f"I've deleted the task '{result.get('title', 'unnamed')}'.",
-                    "tool_calls": [{"name": "delete_task", "arguments": {"user_id": user_id, "task_id": task_id}}]
-                }
-        else:
-            return {
-                "response": "I couldn't identify which task to delete. Please specify the task number.",
-                "tool_calls": []
-            }
+            return {"name": "delete_task", "arguments": {"user_id": user_id, "task_id": int(match.group(1))}}
+        return {"response": "I couldn't identify which task to delete. Please specify the task number."}
 
     elif "update" in last_message or "change" in last_message or "rename" in last_message:
         # Extract task ID and new title from the message
-        import re
         task_match = re.search(r'task\s+(\d+)', last_message)
         title_match = re.search(r'(?:to|as)\s+(.+?)(?:\.|$)', last_message)
 
         if task_match and title_match:
-            task_id = int(task_match.group(1))
-            new_title = title_match.group(1).strip()
-
-            # Call update_task MCP tool
-            result = await send_mcp_request("update_task", {
+            return {"name": "update_task", "arguments": {
                 "user_id": user_id,
-                "task_id": task_id,
-                "title": new_title
-            })
-
-            if "error" in result:
-                return {
-                    "response": f"Sorry, I encountered an error: {result['error']}",
-                    "tool_calls": []
-                }
-            else:
-                return {
-                    "response": f"I've updated the task to '{result.get('title', new_title)}'.",
-                    "tool_calls": [{"name": "update_task", "arguments": {"user_id": user_id, "task_id": task_id, "title": new_title}}]
-                }
+                "task_id": int(task_match.group(1)),
+                "title": title_match.group(1).strip()
+            }}
+        return {"response": "I couldn't identify which task to update or what to change it to. Please specify both the task number and the new title."}
+
+    # Default response for unrecognized commands
+    return {"response": DEFAULT_RESPONSE}
+
+
+def describe_result(call: dict, result) -> str:
+    """Phrase a successful tool result for the user"""
+    name = call["name"]
+    arguments = call["arguments"]
+    if name == "add_task":
+        return f"I've added the task '{result.get('title', arguments['title'])}' to your list."
+    if name == "list_tasks":
+        status = arguments["status"]
+        if not result:
+            return f"You don't have any {status} tasks."
+        task_descriptions = []
+        for task in result:
+            status_text = 'completed' if task.get('completed', False) else 'pending'
+            # Format as expected by frontend for parsing
+            task_descriptions.append(f"Task #{task['id']}: '{task['title']}' ({status_text})")
+        tasks_text = "\n".join(task_descriptions)
+        return f"Here are your {status} tasks:\n{tasks_text}"
+    if name == "get_task_stats":
+        return (f"You have {result['total']} tasks: {result['pending']} pending and "
+                f"{result['completed']} completed, {result['completed_today']} of them today.")
+    if name == "complete_task":
+        return f"I've marked the task '{result.get('title', 'unnamed')}' as completed."
+    if name == "delete_task":
+        return f"I've deleted the task '{result.get('title', 'unnamed')}'."
+    if name == "update_task":
+        return f"I've updated the task to '{result.get('title', arguments['title'])}'."
+    if name == "set_due_date":
+        if result.get("due_at") is None:
+            return f"I've cleared the due date of '{result.get('title', 'unnamed')}'."
+        return f"'{result.get('title', 'unnamed')}' is now due {result['due_at']} UTC."
+    if name == "set_reminder":
+        if result.get("remind_at") is None:
+            return f"I've cancelled the reminder for '{result.get('title', 'unnamed')}'."
+        return f"I'll remind you about '{result.get('title', 'unnamed')}' at {result['remind_at']} UTC."
+    return json.dumps(result, default=str)
+
+
+def _conflicts(call: dict, other: dict) -> bool:
+    """Two calls must run in order if either reads what the other writes, or both write one task"""
+    call_reads = call["name"] in READ_TOOLS
+    other_reads = other["name"] in READ_TOOLS
+    if call_reads and other_reads:
+        return False
+    if call_reads or other_reads:
+        return True
+    task_id = call["arguments"].get("task_id")
+    return task_id is not None and task_id == other["arguments"].get("task_id")
+
+
+def plan_stages(calls: list) -> list:
+    """
+    Group calls into stages that run one after another; calls within a stage
+    are independent and run concurrently. The user's order is kept for any
+    pair of calls that depend on each other.
+    """
+    stages = []
+    for index, call in enumerate(calls):
+        if stages and not any(_conflicts(call, calls[other]) for other in stages[-1]):
+            stages[-1].append(index)
         else:
-            return {
-                "response": "I couldn't identify which task to update or what to change it to. Please specify both the task number and the new title.",
-                "tool_calls": []
-            }
+            stages.append([index])
+    return stages
 
-    else:
-        # Default response for unrecognized commands
-        return {
-            "response": "I'm your AI assistant for managing todos. You can ask me to add, list, complete, delete, or update tasks.",
-            "tool_calls": []
-        }
\ No newline at end of file
+
+async def execute_plan(calls: list, execute) -> list:
+    """
+    Run tool calls stage by stage with `execute(name, arguments)`; returns
+    one result (or raised exception) per call, in call order
+    """
+    results = [None] * len(calls)
+    for stage in plan_stages(calls):
+        outcomes = await asyncio.gather(
+            *(execute(calls[index]["name"], calls[index]["arguments"]) for index in stage),
+            return_exceptions=True
+        )
+        for index, outcome in zip(stage, outcomes):
+            results[index] = outcome
+    return results
+
+
+def _call_error(result):
+    if isinstance(result, Exception):
+        return repr(result)
+    if isinstance(result, dict) and "error" in result:
+        return result["error"]
+    return None
+
+
+async def run_rules_agent(user_id: int, last_message: str):
+    """
+    Plan every command in the message, run the tool calls (independent ones
+    concurrently) and report each call's outcome
+    """
+    steps = [plan_clause(user_id, clause) for clause in split_utterance(last_message)] or [{"response": DEFAULT_RESPONSE}]
+    calls = [step for step in steps if "name" in step]
+    results = iter(await execute_plan(calls, send_mcp_request))
+
+    responses = []
+    tool_calls = []
+    for step in steps:
+        if "name" not in step:
+            responses.append(step["response"])
+            continue
+
+        result = next(results)
+        error = _call_error(result)
+        if error is not None:
+            responses.append(f"Sorry, I encountered an error: {error}")
+            tool_calls.append({"name": step["name"], "arguments": step["arguments"], "error": error})
+        else:
+            responses.append(describe_result(step, result))
+            tool_calls.append({"name": step["name"], "arguments": step["arguments"]})
+
+    return {
+        "response": "\n".join(responses),
+        "tool_calls": tool_calls
+    }
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Cold-storage archive for old conversation messages
+
+Moves messages that are older than a cutoff, or beyond the last N of their
+conversation, out of the hot `message` table into compressed per-conversation
+blocks in `messagearchive`. Each block is written and its source rows deleted
+in one transaction, so an interrupted pass simply resumes where it stopped.
+"""
+
+import json
+import logging
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, tuple_
+from sqlmodel import Session, select
+
+from models import Message, MessageArchive, db_router, settings
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; zlib is always available
+    zstandard = None
+
+
+logger = logging.getLogger(__name__)
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd codec requested but the zstandard package is not installed")
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return zlib.compress(data, 9)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd archive block found but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def encode_block(messages: List[Message], codec: str) -> tuple:
+    """Serialize messages as compact JSON rows and compress; returns (payload, raw_size)"""
+    rows = [[m.id, m.role, m.content, m.created_at.isoformat()] for m in messages]
+    raw = json.dumps(rows, separators=(",", ":")).encode("utf-8")
+    return compress(raw, codec), len(raw)
+
+
+def decode_block(block) -> List[Dict[str, Any]]:
+    """Messages of an archived block (anything with .codec and .payload)"""
+    rows = json.loads(decompress(block.payload, block.codec))
+    return [
+        {
+            "id": message_id,
+            "role": role,
+            "content": content,
+            "created_at": datetime.fromisoformat(created_at),
+        }
+        for message_id, role, content, created_at in rows
+    ]
+
+
+def load_history(session: Session, conversation_id: int) -> List[Dict[str, Any]]:
+    """Return the full history of a conversation, archived blocks first"""
+    history = []
+    blocks = session.exec(
+        select(MessageArchive.codec, MessageArchive.payload)
+        .where(MessageArchive.conversation_id == conversation_id)
+        .order_by(MessageArchive.first_message_id)
+    ).all()
+    for block in blocks:
+        history.extend(decode_block(block))
+
+    rows = session.exec(
+        select(Message.id, Message.role, Message.content, Message.created_at)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.created_at)
+    ).all()
+    history.extend(
+        {"id": message_id, "role": role, "content": content, "created_at": created_at}
+        for message_id, role, content, created_at in rows
+    )
+    return history
+
+
+def load_turns(session: Session, conversation_id: int, limit: Optional[int] = None) -> List[Dict[str, str]]:
+    """
+    The conversation as the agent sees it, {"role", "content"} per message,
+    oldest first; only the newest `limit` messages when given. Only the
+    columns needed are read, and each row goes straight from the result
+    tuple to its dict.
+    """
+    if limit is not None:
+        rows = read_backwards(session, conversation_id, limit)
+        return [{"role": role, "content": content} for _, role, content, _ in reversed(rows)]
+
+    turns = []
+    blocks = session.exec(
+        select(MessageArchive.codec, MessageArchive.payload)
+        .where(MessageArchive.conversation_id == conversation_id)
+        .order_by(MessageArchive.first_message_id)
+    ).all()
+    for codec, payload in blocks:
+        turns.extend(
+            {"role": role, "content": content}
+            for _, role, content, _ in json.loads(decompress(payload, codec))
+        )
+
+    rows = session.exec(
+        select(Message.role, Message.content)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.created_at)
+    ).all()
+    turns.extend({"role": role, "content": content} for role, content in rows)
+    return turns
+
+
+def read_backwards(session: Session, conversation_id: int, limit: int,
+                   before: Optional[Tuple[datetime, int]] = None) -> List[Tuple[int, str, str, datetime]]:
+    """
+    Up to `limit` messages older than `before` ((created_at, id)), newest
+    first, as (id, role, content, created_at). Hot rows come from a range
+    scan of the (conversation_id, created_at, id) index; archived messages
+    are always older than hot ones, so blocks are only decoded once the hot
+    rows run out.
+    """
+    statement = (
+        select(Message.id, Message.role, Message.content, Message.created_at)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(limit)
+    )
+    if before is not None:
+        statement = statement.where(tuple_(Message.created_at, Message.id) < tuple_(*before))
+    rows = [tuple(row) for row in session.exec(statement)]
+    if len(rows) == limit:
+        return rows
+
+    blocks = select(MessageArchive.codec, MessageArchive.payload).where(
+        MessageArchive.conversation_id == conversation_id
+    ).order_by(MessageArchive.first_message_id.desc())
+    if before is not None:
+        blocks = blocks.where(MessageArchive.first_message_id < before[1])
+    for codec, payload in session.exec(blocks):
+        archived = [
+            (message_id, role, content, datetime.fromisoformat(created_at))
+            for message_id, role, content, created_at in reversed(json.loads(decompress(payload, codec)))
+        ]
+        if before is not None:
+            archived = [row for row in archived if (row[3], row[0]) < before]
+        rows.extend(archived[:limit - len(rows)])
+        if len(rows) == limit:
+            break
+    return rows
+
+
+def _archive_boundary(session: Session, conversation_id: int, cutoff: Optional[datetime],
+                      keep_last: Optional[int]) -> Optional[int]:
+    """Highest message id of the conversation prefix that should be archived"""
+    boundary = None
+    if cutoff is not None:
+        boundary = session.exec(
+            select(func.max(Message.id))
+            .where(Message.conversation_id == conversation_id, Message.created_at < cutoff)
+        ).one()
+    if keep_last is not None:
+        beyond_last = session.exec(
+            select(Message.id)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.id.desc())
+            .offset(keep_last)
+            .limit(1)
+        ).first()
+        if beyond_last is not None and (boundary is None or beyond_last > boundary):
+            boundary = beyond_last
+    return boundary
+
+
+def archive_conversation(conversation_id: int, boundary: int, batch_size: int, codec: str,
+                         stats: Dict[str, int], shard=None):
+    """Archive messages up to `boundary` one block (one transaction) at a time, on the given shard"""
+    shard = db_router if shard is None else shard
+    while True:
+        with Session(shard.writer()) as session:
+            messages = session.exec(
+                select(Message)
+                .where(Message.conversation_id == conversation_id, Message.id <= boundary)
+                .order_by(Message.id)
+                .limit(batch_size)
+            ).all()
+            if not messages:
+                return
+
+            payload, raw_size = encode_block(messages, codec)
+            session.add(MessageArchive(
+                conversation_id=conversation_id,
+                user_id=messages[0].user_id,
+                first_message_id=messages[0].id,
+                last_message_id=messages[-1].id,
+                message_count=len(messages),
+                codec=codec,
+                raw_size=raw_size,
+                payload=payload,
+            ))
+            session.execute(delete(Message).where(Message.id.in_([m.id for m in messages])))
+            session.commit()
+
+        stats["messages"] += len(messages)
+        stats["blocks"] += 1
+        stats["raw_bytes"] += raw_size
+        stats["archived_bytes"] += len(payload)
+
+
+def archive_messages(cutoff: Optional[datetime] = None, keep_last: Optional[int] = None,
+                     batch_size: int = 500, codec: str = "zlib") -> Dict[str, int]:
+    """
+    Run one archival pass over all conversations, shard by shard, and report
+    what was moved.
+
+    A message is archived when it is older than `cutoff` or is not among the
+    last `keep_last` messages of its conversation.
+    """
+    if cutoff is None and keep_last is None:
+        raise ValueError("archive_messages needs a cutoff, keep_last, or both")
+
+    stats = {"conversations": 0, "messages": 0, "blocks": 0, "raw_bytes": 0, "archived_bytes": 0}
+    for shard in db_router.shards:
+        last_conversation_id = 0
+        while True:
+            with Session(shard.reader()) as session:
+                statement = (
+                    select(Message.conversation_id)
+                    .where(Message.conversation_id > last_conversation_id)
+                    .group_by(Message.conversation_id)
+                    .order_by(Message.conversation_id)
+                    .limit(batch_size)
+                )
+                if keep_last is None:
+                    statement = statement.where(Message.created_at < cutoff)
+                conversation_ids = session.exec(statement).all()
+
+                boundaries = [
+                    (conversation_id, _archive_boundary(session, conversation_id, cutoff, keep_last))
+                    for conversation_id in conversation_ids
+                ]
+
+            if not conversation_ids:
+                break
+            last_conversation_id = conversation_ids[-1]
+
+            for conversation_id, boundary in boundaries:
+                if boundary is None:
+                    continue
+                archive_conversation(conversation_id, boundary, batch_size, codec, stats, shard)
+                stats["conversations"] += 1
+
+    stats["bytes_saved"] = stats["raw_bytes"] - stats["archived_bytes"]
+    logger.info(f"Archived {stats['messages']} messages from {stats['conversations']} conversations "
+                f"({stats['raw_bytes']} -> {stats['archived_bytes']} bytes)")
+    return stats
+
+
+def archive_from_settings() -> Dict[str, int]:
+    """Run one pass with the archive policy from the application settings"""
+    cutoff = None
+    if settings.archive_after_days is not None:
+        cutoff = datetime.utcnow() - timedelta(days=settings.archive_after_days)
+    return archive_messages(
+        cutoff=cutoff,
+        keep_last=settings.archive_keep_last,
+        batch_size=settings.archive_batch_size,
+        codec=settings.archive_codec,
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(archive_from_settings(), indent=2))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark: one planned multi-tool turn vs. several sequential turns
+
+Runs "add a, add b, add c and show my pending tasks" as a single planned
+turn and as four separate turns, against a temporary SQLite database. An
+optional per-call delay stands in for the round trip to a remote MCP server.
+
+Usage: python bench_agent_plan.py [rounds] [tool_latency_ms]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from sqlmodel import SQLModel
+
+import agents
+import mcp_server
+from database import EngineRouter, create_sqlite_engines
+from models import settings
+
+
+COMPOUND = "add buy milk, add buy eggs, add buy bread and show my pending tasks"
+SEPARATE = ["add buy milk", "add buy eggs", "add buy bread", "show my pending tasks"]
+
+
+async def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    tool_latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 5.0) / 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        reader, writer = create_sqlite_engines(f"sqlite:///{os.path.join(tmp, 'bench.db')}", settings)
+        SQLModel.metadata.create_all(bind=writer)
+        mcp_server.db_router = EngineRouter(reader, writer=writer)
+
+        send = agents.send_mcp_request
+
+        async def remote_send(method, params):
+            await asyncio.sleep(tool_latency)
+            return await send(method, params)
+
+        agents.send_mcp_request = remote_send
+
+        started = time.perf_counter()
+        for n in range(rounds):
+            for message in SEPARATE:
+                await agents.run_rules_agent(f"seq-{n}", message)
+        sequential = (time.perf_counter() - started) / rounds
+
+        started = time.perf_counter()
+        for n in range(rounds):
+            await agents.run_rules_agent(f"plan-{n}", COMPOUND)
+        planned = (time.perf_counter() - started) / rounds
+
+        print(f"tool latency {tool_latency * 1e3:.1f} ms, {rounds} rounds")
+        print(f"4 sequential turns  {sequential * 1e3:8.2f} ms")
+        print(f"1 planned turn      {planned * 1e3:8.2f} ms ({sequential / planned:.1f}x faster)")
+        reader.dispose()
+        writer.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Storage and hot-table query benchmark for the message archive
+
+Fills a temporary database with conversations, then measures the database
+size and the latency of the chat history query before and after one archive
+pass that keeps the last N messages of every conversation.
+
+Usage: python bench_archive.py [conversations] [messages_per_conversation] [keep_last]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, text
+from sqlmodel import SQLModel, Session, select
+
+import archive
+from database import EngineRouter, create_sqlite_engines
+from models import Message, settings
+
+
+def history_query_seconds(router, conversation_ids, repeat: int = 3) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        with Session(router.reader()) as session:
+            for conversation_id in conversation_ids:
+                session.exec(
+                    select(Message).where(Message.conversation_id == conversation_id).order_by(Message.created_at)
+                ).all()
+    return (time.perf_counter() - start) / (repeat * len(conversation_ids))
+
+
+def database_bytes(router) -> int:
+    with router.writer().connect() as conn:
+        conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        conn.execute(text("VACUUM"))
+        return conn.execute(text("PRAGMA page_count")).scalar() * conn.execute(text("PRAGMA page_size")).scalar()
+
+
+def main():
+    conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    per_conversation = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    keep_last = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+    with tempfile.TemporaryDirectory() as tmp:
+        reader, writer = create_sqlite_engines(f"sqlite:///{os.path.join(tmp, 'bench.db')}", settings)
+        SQLModel.metadata.create_all(bind=writer)
+        router = EngineRouter(reader, writer=writer)
+        archive.db_router = router
+
+        start = datetime.utcnow() - timedelta(days=365)
+        with Session(writer) as session:
+            for conversation_id in range(1, conversations + 1):
+                session.execute(insert(Message), [
+                    {
+                        "user_id": conversation_id % 50,
+                        "conversation_id": conversation_id,
+                        "role": "user" if i % 2 == 0 else "assistant",
+                        "content": f"Please add a task to buy item number {i} before the weekend",
+                        "created_at": start + timedelta(minutes=i),
+                    }
+                    for i in range(per_conversation)
+                ])
+            session.commit()
+
+        sample = list(range(1, conversations + 1, max(conversations // 50, 1)))
+        size_before = database_bytes(router)
+        query_before = history_query_seconds(router, sample)
+
+        started = time.perf_counter()
+        stats = archive.archive_messages(keep_last=keep_last)
+        archive_seconds = time.perf_counter() - started
+
+        size_after = database_bytes(router)
+        query_after = history_query_seconds(router, sample)
+
+        print(f"archived {stats['messages']} messages in {stats['blocks']} blocks ({archive_seconds:.2f}s)")
+        print(f"payload  {stats['raw_bytes'] / 1e6:8.2f} MB raw -> {stats['archived_bytes'] / 1e6:8.2f} MB compressed")
+        print(f"database {size_before / 1e6:8.2f} MB -> {size_after / 1e6:8.2f} MB")
+        print(f"hot history query {query_before * 1e3:.3f} ms -> {query_after * 1e3:.3f} ms "
+              f"({query_before / query_after:.1f}x)")
+        reader.dispose()
+        writer.dispose()
+
+
+if __name__ == "__main__":
+    main()
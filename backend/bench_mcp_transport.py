@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+MCP call latency: stdio child process vs. WebSocket on localhost
+
+Starts mcp_server.app with uvicorn on a local port and mcp_stdio.py, each
+as a child process against the same temporary SQLite database, and times
+the same calls over each transport, with the direct in-process call as the
+floor:
+
+  no-op       - an unknown method, answered without touching the database,
+                so the time is the transport's own round trip
+  list_tasks  - a user's 20 tasks
+
+Sequential calls give the per-call latency; then 32 calls are kept in
+flight on one connection, which both servers run concurrently. The
+WebSocket side uses the agent's pooled client (mcp_client.py) with a
+single connection.
+
+Usage: python bench_mcp_transport.py [calls]
+"""
+
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import subprocess
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'bench.db')}"
+
+from sqlmodel import Session, SQLModel
+
+from mcp_client import MCPClientPool
+from mcp_server import mcp_server
+from mcp_stdio import StdioMCPClient
+from models import Task, User, write_engine
+
+IN_FLIGHT = 32
+CALLS = [("no-op", "ping", {}), ("list_tasks", "list_tasks", {"user_id": 1})]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int) -> subprocess.Popen:
+    """The WebSocket server in its own process, like the stdio one, so neither shares the client's GIL"""
+    server = subprocess.Popen([
+        sys.executable, "-c",
+        f"import uvicorn; from mcp_server import app; "
+        f"uvicorn.run(app, host='127.0.0.1', port={port}, log_level='warning')",
+    ], cwd=os.path.dirname(os.path.abspath(__file__)))
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return server
+        except OSError:
+            time.sleep(0.05)
+
+
+def report(label: str, samples):
+    samples = sorted(samples)
+    print(f"{label:28s} median {statistics.median(samples) * 1e6:8.1f} us   "
+          f"p95 {samples[int(len(samples) * 0.95) - 1] * 1e6:8.1f} us")
+
+
+async def timed(call, calls: int):
+    for _ in range(20):
+        await call()
+    samples = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def throughput(call, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls // IN_FLIGHT):
+        await asyncio.gather(*[call() for _ in range(IN_FLIGHT)])
+    return calls // IN_FLIGHT * IN_FLIGHT / (time.perf_counter() - started)
+
+
+async def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    SQLModel.metadata.create_all(bind=write_engine)
+    with Session(write_engine) as session:
+        session.add(User(email="bench@example.com", username="bench", hashed_password="x"))
+        session.add_all([Task(user_id=1, title=f"task {n}", seq=n + 1) for n in range(20)])
+        session.commit()
+
+    port = free_port()
+    server = start_server(port)
+    websocket = MCPClientPool(f"ws://127.0.0.1:{port}/ws", size=1)
+
+    async with StdioMCPClient() as stdio:
+        transports = [
+            ("in-process", lambda method, params: mcp_server.execute_tool(method, params)),
+            ("WebSocket", websocket.call),
+            ("stdio", stdio.call),
+        ]
+        for label, method, params in CALLS:
+            for transport, call in transports:
+                report(f"{label} {transport}", await timed(lambda: call(method, params), calls))
+        for transport, call in transports[1:]:
+            rate = await throughput(lambda: call("list_tasks", {"user_id": 1}), calls)
+            print(f"list_tasks {transport} x{IN_FLIGHT} in flight   {rate:8.0f} calls/s")
+
+    await websocket.close()
+    server.terminate()
+    server.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Prompt size and serialization time for task lists in model context
+
+Compares JSON, the verbose "Task #id: 'title' (status)" lines and the
+compact encoding (full list and a one-task delta) at several list sizes.
+
+Usage: python bench_prompt_codec.py [sizes...]
+"""
+
+import json
+import random
+import sys
+import time
+
+from prompt_codec import encode_delta, encode_tasks, estimate_tokens, snapshot
+
+
+WORDS = "buy milk call mom walk dog pay rent book flight fix bike email boss water plants".split()
+
+
+def make_tasks(count: int):
+    rng = random.Random(count)
+    return [
+        {"id": i, "title": " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))), "completed": rng.random() < 0.3}
+        for i in range(1, count + 1)
+    ]
+
+
+def verbose(tasks):
+    return "\n".join(
+        f"Task #{t['id']}: '{t['title']}' ({'completed' if t['completed'] else 'pending'})" for t in tasks
+    )
+
+
+def timed(func, *args, repeat: int = 20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(*args)
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10, 1000, 10000]
+    print(f"{'tasks':>6} {'format':10} {'bytes':>9} {'~tokens':>9} {'ms':>8}")
+    for size in sizes:
+        tasks = make_tasks(size)
+        before = snapshot(tasks)
+        changed = [dict(t, completed=not t["completed"]) if t["id"] == 1 else t for t in tasks]
+
+        rows = [
+            ("json",) + timed(json.dumps, tasks),
+            ("verbose",) + timed(verbose, tasks),
+            ("compact",) + timed(encode_tasks, tasks),
+            ("delta",) + timed(lambda: encode_delta(before, snapshot(changed))),
+        ]
+        for name, text, seconds in rows:
+            print(f"{size:6d} {name:10} {len(text):9d} {estimate_tokens(text):9d} {seconds * 1e3:8.3f}")
+
+
+if __name__ == "__main__":
+    main()
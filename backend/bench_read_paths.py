@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Read paths: ORM entities vs. column rows
+
+Times and measures the two hot read paths on 10k rows in a temporary
+SQLite database, each done the old way (select the entity, hydrate a
+SQLModel instance per row, copy it into a dict) and the current way
+(select only the needed columns, build the dict from the result tuple):
+
+  list_tasks  - one user's 10k tasks, through the tool body
+  history     - one conversation's 10k messages, as load_turns() reads it
+
+CPU is the median wall time per row; memory is the tracemalloc peak while
+materializing the result, per row.
+
+Usage: python bench_read_paths.py [rows]
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy import text
+from sqlmodel import Session, SQLModel, select
+
+import mcp_server
+from archive import load_turns
+from database import EngineRouter, create_sqlite_engines
+from mcp_server import ListTasksParams, MCPServer
+from models import Message, Task, settings
+
+
+def entity_tasks(session: Session):
+    tasks = session.exec(select(Task).where(Task.user_id == 1, Task.deleted == False)).all()
+    return [{"id": task.id, "title": task.title, "completed": task.completed} for task in tasks]
+
+
+def entity_turns(session: Session):
+    messages = session.exec(select(Message).where(Message.conversation_id == 1).order_by(Message.created_at)).all()
+    return [{"role": m.role, "content": m.content} for m in messages]
+
+
+def measure(func, rows: int, repeat: int = 15):
+    func()  # warm the statement cache
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - started)
+        assert len(result) == rows
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(samples) / rows * 1e6, peak / rows
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    with tempfile.TemporaryDirectory() as tmp:
+        reader, writer = create_sqlite_engines(f"sqlite:///{os.path.join(tmp, 'read.db')}", settings)
+        SQLModel.metadata.create_all(bind=writer)
+        with writer.begin() as conn:
+            conn.execute(
+                text("INSERT INTO task (user_id, title, description, completed, seq, deleted, created_at, updated_at) "
+                     "VALUES (1, :title, 'some description', :completed, :seq, 0, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"),
+                [{"title": f"task number {n}", "completed": n % 3 == 0, "seq": n + 1} for n in range(rows)],
+            )
+            conn.execute(
+                text("INSERT INTO message (user_id, conversation_id, role, content, created_at) "
+                     "VALUES (1, 1, :role, :content, datetime('now', :offset))"),
+                [{"role": "user" if n % 2 else "assistant", "content": f"message {n} " + "x" * 80,
+                  "offset": f"+{n} seconds"} for n in range(rows)],
+            )
+        mcp_server.db_router = EngineRouter(reader, writer=writer)
+        list_tasks = MCPServer.list_tasks.__wrapped__
+        server = MCPServer()
+
+        print(f"{'path':<12s} {'way':<8s} {'us/row':>8s} {'bytes/row':>10s}")
+        with Session(reader) as session:
+            for path, way, func in [
+                ("list_tasks", "entity", lambda: entity_tasks(session)),
+                ("list_tasks", "rows", lambda: list_tasks(server, ListTasksParams(user_id=1))),
+                ("history", "entity", lambda: entity_turns(session)),
+                ("history", "rows", lambda: load_turns(session, 1)),
+            ]:
+                per_row, memory = measure(func, rows)
+                print(f"{path:<12s} {way:<8s} {per_row:8.2f} {memory:10.0f}")
+        reader.dispose()
+        writer.dispose()
+
+
+if __name__ == "__main__":
+    main()
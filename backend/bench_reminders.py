@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Reminder scheduler throughput
+
+1. In memory: schedule() N reminders inside the window and pop them all
+   back in time order (the heap alone).
+2. Window load: with P pending reminders spread over 30 days in a temporary
+   SQLite database, time load_window() for the default 5-minute window. It
+   reads only the window's rows through ix_task_remind_at, so it should
+   barely move as P grows.
+3. Firing: make B of the reminders due at once and time pop_due() + fire()
+   (conditional clear, sequence numbers, events), in reminders/s.
+
+Usage: python bench_reminders.py [pending sizes] [burst]
+       e.g. python bench_reminders.py 100000,1000000 10000
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlmodel import SQLModel
+
+import reminders
+from database import EngineRouter, create_sqlite_engines
+from models import settings
+from reminders import ReminderScheduler
+
+USERS = 1000
+HORIZON = timedelta(days=30)
+
+
+def bench_heap(count: int):
+    scheduler = ReminderScheduler(window_seconds=HORIZON.total_seconds())
+    now = datetime.utcnow()
+    scheduler.horizon = now + HORIZON
+    offsets = [timedelta(seconds=random.random() * 300) for _ in range(count)]
+
+    started = time.perf_counter()
+    for task_id, offset in enumerate(offsets):
+        scheduler.schedule(task_id, task_id % USERS, now + offset)
+    scheduled = time.perf_counter() - started
+
+    started = time.perf_counter()
+    due = scheduler.pop_due(now + timedelta(seconds=300))
+    popped = time.perf_counter() - started
+    assert len(due) == count
+    print(f"heap: schedule {count / scheduled:,.0f}/s, pop {count / popped:,.0f}/s ({count:,} reminders)")
+
+
+def build(writer, pending: int, now: datetime):
+    with writer.begin() as conn:
+        conn.execute(text("INSERT INTO user (id, email, username, hashed_password, is_active, created_at) "
+                          "VALUES (:id, :email, :email, '', 1, CURRENT_TIMESTAMP)"),
+                     [{"id": n, "email": f"user{n}"} for n in range(USERS)])
+        for start in range(0, pending, 100_000):
+            conn.execute(
+                text("INSERT INTO task (user_id, title, completed, seq, deleted, remind_at, created_at, updated_at) "
+                     "VALUES (:user_id, 'task', 0, :seq, 0, :remind_at, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"),
+                [{"user_id": n % USERS, "seq": n // USERS + 1,
+                  "remind_at": now + timedelta(seconds=random.random() * HORIZON.total_seconds())}
+                 for n in range(start, min(start + 100_000, pending))],
+            )
+        conn.execute(text("INSERT INTO tasksequence (user_id, last_seq, compacted_seq, total, completed, completed_today) "
+                          "SELECT user_id, MAX(seq), 0, COUNT(*), 0, 0 FROM task GROUP BY user_id"))
+
+
+def main():
+    sizes = [int(n) for n in (sys.argv[1] if len(sys.argv) > 1 else "100000,1000000").split(",")]
+    burst = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+
+    bench_heap(1_000_000)
+    print(f"{'pending':>10s} {'in window':>10s} {'load ms':>9s} {'burst':>7s} {'fire/s':>10s}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for pending in sizes:
+            reader, writer = create_sqlite_engines(f"sqlite:///{os.path.join(tmp, f'rem{pending}.db')}", settings)
+            SQLModel.metadata.create_all(bind=writer)
+            reminders.db_router = EngineRouter(reader, writer=writer)
+            now = datetime.utcnow()
+            build(writer, pending, now)
+
+            scheduler = ReminderScheduler(window_seconds=300, max_loaded=burst * 2)
+            samples = []
+            for _ in range(20):
+                scheduler = ReminderScheduler(window_seconds=300, max_loaded=burst * 2)
+                started = time.perf_counter()
+                scheduler.load_window(now)
+                samples.append(time.perf_counter() - started)
+            in_window = len(scheduler)
+
+            # A burst: `burst` reminders all due now
+            with writer.begin() as conn:
+                conn.execute(text("UPDATE task SET remind_at = :now WHERE id IN "
+                                  "(SELECT id FROM task ORDER BY random() LIMIT :burst)"),
+                             {"now": now - timedelta(seconds=1), "burst": burst})
+            scheduler = ReminderScheduler(window_seconds=300, max_loaded=burst * 2)
+            scheduler.load_window(now)
+            started = time.perf_counter()
+            fired = scheduler.fire(scheduler.pop_due(now), now)
+            elapsed = time.perf_counter() - started
+            assert fired == burst
+
+            print(f"{pending:10,d} {in_window:10,d} {statistics.median(samples) * 1e3:9.3f} "
+                  f"{burst:7,d} {fired / elapsed:10,.0f}")
+            reader.dispose()
+            writer.dispose()
+
+
+if __name__ == "__main__":
+    main()
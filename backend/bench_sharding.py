@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Sharding: write throughput over several SQLite files, routing cost, moves
+
+  writes   - PROCESSES workers, each for its own users, call the add_task
+             tool body for a few seconds against one SQLite database and
+             against SHARDS SQLite files behind a ShardRouter; SQLite has
+             one writer per database, so one file serializes every commit
+  routing  - cost of ShardRouter.writer() (hash ring plus directory)
+  move     - move_user() of a user with 10k tasks and 10k messages, with
+             no drain wait, i.e. the copy and the delete
+
+Usage: python bench_sharding.py [processes] [shards]
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlmodel import Session
+
+import mcp_server
+import sharding
+from database import EngineRouter, ShardRouter, create_sqlite_engines
+from mcp_server import AddTaskParams, MCPServer
+from models import Message, Task, User, settings
+from sharding import create_tables, move_user
+
+SECONDS = 3.0
+
+
+def make_router(directory: str, count: int) -> ShardRouter:
+    shards = []
+    for index in range(count):
+        reader, writer = create_sqlite_engines(f"sqlite:///{os.path.join(directory, f'shard{index}.db')}", settings)
+        shards.append(EngineRouter(reader, writer=writer))
+    return ShardRouter(shards, directory_seconds=0 if count == 1 else settings.shard_directory_seconds)
+
+
+def use(router):
+    mcp_server.db_router = router
+    sharding.db_router = router
+    create_tables()
+
+
+def write_for(args) -> int:
+    """One worker process: add_task calls for its own users until the deadline"""
+    directory, count, worker, deadline = args
+    router = make_router(directory, count)
+    mcp_server.db_router = router
+    server = MCPServer()
+    add_task = MCPServer.add_task.__wrapped__
+    calls = 0
+    while time.time() < deadline:
+        result = add_task(server, AddTaskParams(user_id=worker + 1 + 1000 * (calls % 8), title="task"))
+        assert "error" not in result, result
+        calls += 1
+    return calls
+
+
+def writes(directory: str, count: int, processes: int) -> float:
+    """add_task calls per second over all worker processes"""
+    use(make_router(directory, count))
+    deadline = time.time() + 1.0 + SECONDS
+    with multiprocessing.get_context("fork").Pool(processes) as pool:
+        calls = pool.map(write_for, [(directory, count, worker, deadline) for worker in range(processes)])
+    return sum(calls) / SECONDS
+
+
+def routing(router, calls: int = 200000) -> float:
+    """Microseconds per writer() call"""
+    router.writer(1)
+    started = time.perf_counter()
+    for n in range(calls):
+        router.writer(n % 1000)
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def move(router, rows: int = 10000) -> float:
+    use(router)
+    user_id = 10 ** 6
+    with Session(router.shards[0].writer()) as session:
+        session.add(User(id=user_id, email="move@example.com", username="move", hashed_password="x"))
+        session.commit()
+    source = router.shard_for(user_id)
+    now = datetime.utcnow()
+    with router.shards[source].writer().begin() as conn:
+        conn.execute(insert(Task), [{"user_id": user_id, "title": f"task {n}", "seq": n + 1, "created_at": now,
+                                     "updated_at": now} for n in range(rows)])
+        conn.execute(insert(Message), [{"user_id": user_id, "conversation_id": 1, "role": "user",
+                                        "content": f"message {n} " * 8, "created_at": now} for n in range(rows)])
+    started = time.perf_counter()
+    router.directory_seconds = 0
+    move_user(user_id, (source + 1) % len(router.shards), drain_seconds=0)
+    return (time.perf_counter() - started) * 1e3
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    shards = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    with tempfile.TemporaryDirectory() as single_dir, tempfile.TemporaryDirectory() as sharded_dir:
+        print(f"writes, {processes} processes:  1 database {writes(single_dir, 1, processes):6.0f}/s   "
+              f"{shards} shards {writes(sharded_dir, shards, processes):6.0f}/s")
+        single = make_router(single_dir, 1)
+        sharded = make_router(sharded_dir, shards)
+        print(f"routing: writer() {routing(single.shards[0]):.2f} us unsharded, {routing(sharded):.2f} us sharded")
+        print(f"move of 10k tasks + 10k messages: {move(sharded):.0f} ms")
+        for engine in single.engines() + sharded.engines():
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
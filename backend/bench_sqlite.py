@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Concurrent-writer benchmark for the SQLite performance profile
+
+Runs the same multi-threaded insert workload against a stock SQLite engine
+(rollback journal, full sync, default busy handling) and against the tuned
+reader/writer engine pair from database.py.
+
+Usage: python bench_sqlite.py [threads] [inserts_per_thread]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlmodel import SQLModel, Session, create_engine
+
+from models import Task, settings
+from database import create_sqlite_engines
+
+
+def run_writers(write_engine, threads: int, inserts: int):
+    errors = []
+
+    def worker(n: int):
+        for i in range(inserts):
+            try:
+                with Session(write_engine) as session:
+                    session.add(Task(user_id=n, title=f"task {n}-{i}", seq=i + 1))
+                    session.commit()
+            except Exception as e:
+                errors.append(e)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    return elapsed, len(errors)
+
+
+def bench(label: str, url: str, engines, threads: int, inserts: int):
+    reader, writer = engines
+    SQLModel.metadata.create_all(bind=writer)
+    elapsed, errors = run_writers(writer, threads, inserts)
+    ok = threads * inserts - errors
+    print(f"{label:8s} {ok:6d} commits in {elapsed:6.2f}s "
+          f"-> {ok / elapsed:8.0f} commits/s ({errors} errors)")
+    reader.dispose()
+    writer.dispose()
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    inserts = int(sys.argv[2]) if len(sys.argv) > 2 else 250
+
+    with tempfile.TemporaryDirectory() as tmp:
+        default_url = f"sqlite:///{os.path.join(tmp, 'default.db')}"
+        default_engine = create_engine(default_url)
+        bench("default", default_url, (default_engine, default_engine), threads, inserts)
+
+        tuned_url = f"sqlite:///{os.path.join(tmp, 'tuned.db')}"
+        bench("tuned", tuned_url, create_sqlite_engines(tuned_url, settings), threads, inserts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Task mutations: database round trips and latency per tool call
+
+Runs complete_task, update_task and delete_task (the tool bodies) on
+fresh tasks in a temporary SQLite database and reports, per call:
+
+  round trips - statements executed plus COMMIT/ROLLBACK, counted with
+                engine events (what a networked database would wait on)
+  local       - median wall time against the SQLite file
+  at RTT      - median wall time with RTT_MS of sleep added to every round
+                trip, a stand-in for a database across the network
+
+Each call is 3 round trips, on SQLite and PostgreSQL alike: the counter
+UPDATE, the task UPDATE ... RETURNING and the COMMIT (down from 7). It is
+not one statement. SQLite has no data-modifying CTEs, and the counter row
+has to be locked before the task's version is read, so the two UPDATEs
+stay separate and keep every writer's lock order.
+
+Usage: python bench_task_mutations.py [calls] [rtt_ms]
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event
+from sqlmodel import SQLModel
+
+import mcp_server
+from database import EngineRouter, create_sqlite_engines
+from mcp_server import AddTaskParams, CompleteTaskParams, DeleteTaskParams, MCPServer, UpdateTaskParams
+from models import settings
+
+
+class RoundTrips:
+    """Counts (and optionally delays) every statement, commit and rollback on an engine"""
+
+    def __init__(self, engine):
+        self.count = 0
+        self.delay = 0.0
+        for name in ("before_cursor_execute", "commit", "rollback"):
+            event.listen(engine, name, self._round_trip)
+
+    def _round_trip(self, *args, **kwargs):
+        self.count += 1
+        if self.delay:
+            time.sleep(self.delay)
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    rtt_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    with tempfile.TemporaryDirectory() as tmp:
+        reader, writer = create_sqlite_engines(f"sqlite:///{os.path.join(tmp, 'bench.db')}", settings)
+        SQLModel.metadata.create_all(bind=writer)
+        mcp_server.db_router = EngineRouter(reader, writer=writer)
+        round_trips = RoundTrips(writer)
+
+        server = MCPServer()
+        add_task = MCPServer.add_task.__wrapped__
+        tools = {
+            "complete_task": lambda task_id: MCPServer.complete_task.__wrapped__(
+                server, CompleteTaskParams(user_id=1, task_id=task_id)),
+            "update_task": lambda task_id: MCPServer.update_task.__wrapped__(
+                server, UpdateTaskParams(user_id=1, task_id=task_id, title="renamed")),
+            "delete_task": lambda task_id: MCPServer.delete_task.__wrapped__(
+                server, DeleteTaskParams(user_id=1, task_id=task_id)),
+        }
+
+        print(f"{'':14s} {'round trips':>11s} {'local ms':>9s} {f'at {rtt_ms:g} ms RTT':>14s}")
+        for name, tool in tools.items():
+            results = []
+            for delay in (0.0, rtt_ms / 1e3):
+                task_ids = [add_task(server, AddTaskParams(user_id=1, title="task"))["task_id"]
+                            for _ in range(calls + 5)]
+                for task_id in task_ids[:5]:
+                    tool(task_id)  # warm the statement cache
+                round_trips.delay = delay
+                samples = []
+                count = round_trips.count
+                for task_id in task_ids[5:]:
+                    started = time.perf_counter()
+                    result = tool(task_id)
+                    samples.append(time.perf_counter() - started)
+                    assert "error" not in result, result
+                per_call = (round_trips.count - count) / calls
+                round_trips.delay = 0.0
+                results.append(statistics.median(samples) * 1e3)
+            print(f"{name:14s} {per_call:11.1f} {results[0]:9.2f} {results[1]:14.2f}")
+            assert per_call == 3, f"{name} took {per_call:g} round trips, expected 3"
+        reader.dispose()
+        writer.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Delta sync cost: list size vs. number of changes
+
+For each list size, fills a temporary SQLite database with one user's tasks
+(interleaved with other users' rows), then touches a number of them and
+times changes_since() from the cursor taken before the touches. A full
+list_tasks-style fetch is timed alongside for comparison: it grows with the
+list, while the delta grows only with the changes.
+
+Usage: python bench_task_sync.py [sizes] [changes]
+       e.g. python bench_task_sync.py 1000,10000,100000 10,100,1000
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import text
+from sqlmodel import Session, SQLModel, select
+
+from database import create_sqlite_engines
+from models import Task, TaskSequence, settings
+from task_sync import changes_since
+
+USER_ID = 1
+OTHER_USERS = 9
+
+
+def build(writer, size: int):
+    rows = []
+    for i in range(size):
+        for user_id in range(1, OTHER_USERS + 2):
+            rows.append({"user_id": user_id, "title": f"task {i}", "completed": False, "seq": i + 1})
+    with writer.begin() as conn:
+        conn.execute(
+            text("INSERT INTO task (user_id, title, completed, seq, deleted, created_at, updated_at) "
+                 "VALUES (:user_id, :title, :completed, :seq, 0, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"),
+            rows,
+        )
+        conn.execute(
+            text("INSERT INTO tasksequence (user_id, last_seq, compacted_seq) VALUES (:user_id, :last_seq, 0)"),
+            [{"user_id": user_id, "last_seq": size} for user_id in range(1, OTHER_USERS + 2)],
+        )
+
+
+def touch(writer, count: int, base: int):
+    """Re-stamp `count` of the user's tasks as changed, as complete_task would"""
+    with writer.begin() as conn:
+        ids = conn.execute(
+            text("SELECT id FROM task WHERE user_id = :user_id ORDER BY seq LIMIT :count"),
+            {"user_id": USER_ID, "count": count},
+        ).scalars().all()
+        for n, task_id in enumerate(ids, start=1):
+            conn.execute(text("UPDATE task SET completed = 1, seq = :seq WHERE id = :id"), {"seq": base + n, "id": task_id})
+        conn.execute(text("UPDATE tasksequence SET last_seq = :seq WHERE user_id = :user_id"),
+                     {"seq": base + len(ids), "user_id": USER_ID})
+
+
+def median_ms(func, repeat: int = 20) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1e3
+
+
+def main():
+    sizes = [int(n) for n in (sys.argv[1] if len(sys.argv) > 1 else "1000,10000,100000").split(",")]
+    touched = [int(n) for n in (sys.argv[2] if len(sys.argv) > 2 else "10,100,1000").split(",")]
+    print(f"{'tasks':>8s} {'changes':>8s} {'delta ms':>10s} {'full list ms':>13s}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            path = os.path.join(tmp, f"sync{size}.db")
+            reader, writer = create_sqlite_engines(f"sqlite:///{path}", settings)
+            SQLModel.metadata.create_all(bind=writer)
+            build(writer, size)
+
+            with Session(reader) as session:
+                full = median_ms(lambda: session.exec(
+                    select(Task).where(Task.user_id == USER_ID, Task.deleted == False)
+                ).all(), repeat=5)
+
+            cursor = size
+            for count in touched:
+                if count > size:
+                    continue
+                touch(writer, count, cursor)
+                with Session(reader) as session:
+                    delta = median_ms(lambda: changes_since(session, USER_ID, cursor, count))
+                    assert len(changes_since(session, USER_ID, cursor, count)["changes"]) == count
+                print(f"{size:8d} {count:8d} {delta:10.3f} {full:13.3f}")
+                with Session(reader) as session:
+                    cursor = session.get(TaskSequence, USER_ID).last_seq
+
+            reader.dispose()
+            writer.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Throughput and memory of the NDJSON bulk import and streaming export
+
+Writes an NDJSON file of N tasks, imports it in IMPORT_BATCH_SIZE batches
+(executemany INSERT on SQLite), then streams the export back to a file and
+reports rows/s for both directions. A second export pass runs under
+tracemalloc to show that the Python heap stays flat (RSS is not used: the
+SQLite mmap pages the database file into it).
+
+Usage: python bench_transfer.py [tasks] [batch_size]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from sqlmodel import SQLModel
+
+from database import create_sqlite_engines
+from models import settings
+from transfer import BulkImporter, export_tasks
+
+
+def export_to(path: str, reader) -> int:
+    with open(path, "wb") as f:
+        for chunk in export_tasks(reader, 1, settings.export_fetch_size):
+            f.write(chunk)
+    return os.path.getsize(path)
+
+
+def main():
+    tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else settings.import_batch_size
+
+    with tempfile.TemporaryDirectory() as tmp:
+        reader, writer = create_sqlite_engines(f"sqlite:///{os.path.join(tmp, 'bench.db')}", settings)
+        SQLModel.metadata.create_all(bind=writer)
+
+        source = os.path.join(tmp, "tasks.ndjson")
+        with open(source, "w") as f:
+            for n in range(tasks):
+                f.write(json.dumps({
+                    "type": "task",
+                    "title": f"Buy item number {n} before the weekend",
+                    "description": None,
+                    "completed": n % 3 == 0,
+                    "created_at": "2024-05-01T12:00:00",
+                }) + "\n")
+        print(f"{tasks} tasks, {os.path.getsize(source) / 1e6:.1f} MB NDJSON, batch {batch_size}")
+
+        importer = BulkImporter(writer, 1)
+        started = time.perf_counter()
+        with open(source, "rb") as f:
+            batch = []
+            for line in f:
+                batch.append(line)
+                if len(batch) >= batch_size:
+                    importer.write_lines(batch)
+                    batch = []
+            if batch:
+                importer.write_lines(batch)
+        import_seconds = time.perf_counter() - started
+
+        target = os.path.join(tmp, "export.ndjson")
+        started = time.perf_counter()
+        written = export_to(target, reader)
+        export_seconds = time.perf_counter() - started
+
+        tracemalloc.start()
+        export_to(target, reader)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f"import {importer.counts['task'] / import_seconds:10,.0f} rows/s  ({import_seconds:.1f}s)")
+        print(f"export {tasks / export_seconds:10,.0f} rows/s  ({export_seconds:.1f}s)  "
+              f"{written / 1e6:.1f} MB written, peak Python heap {peak / 1e6:.2f} MB")
+        reader.dispose()
+        writer.dispose()
+
+
+if __name__ == "__main__":
+    main()
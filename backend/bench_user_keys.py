@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Index size and per-user lookup time: string vs. integer user_id
+
+Builds the same task table three ways in temporary SQLite databases: the
+old schema (stringified user id, no index), a string column with an index,
+and the integer foreign key with an index. Reports the index size and the
+median time of the list_tasks lookup for random users.
+
+Usage: python bench_user_keys.py [users] [tasks_per_user]
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+
+VARIANTS = [
+    ("str, no index (before)", "VARCHAR", False),
+    ("str, indexed", "VARCHAR", True),
+    ("int FK, indexed (after)", "INTEGER", True),
+]
+
+
+def page_bytes(conn) -> int:
+    return conn.execute(text("PRAGMA page_count")).scalar() * conn.execute(text("PRAGMA page_size")).scalar()
+
+
+def build(path: str, column_type: str, indexed: bool, users: int, per_user: int) -> int:
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE task (id INTEGER PRIMARY KEY, user_id {column_type} NOT NULL, "
+            f"title VARCHAR NOT NULL, completed BOOLEAN NOT NULL)"
+        ))
+        # Tasks of different users are interleaved, as they are in production
+        rows = [
+            {"user_id": str(u) if column_type == "VARCHAR" else u, "title": f"task {i} of user {u}", "completed": i % 3 == 0}
+            for i in range(per_user) for u in range(1, users + 1)
+        ]
+        conn.execute(text("INSERT INTO task (user_id, title, completed) VALUES (:user_id, :title, :completed)"), rows)
+
+    index_bytes = 0
+    with engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+        if indexed:
+            before = page_bytes(conn)
+            conn.execute(text("CREATE INDEX ix_task_user_id ON task (user_id)"))
+            conn.commit()
+            conn.execute(text("VACUUM"))
+            index_bytes = page_bytes(conn) - before
+    engine.dispose()
+    return index_bytes
+
+
+def lookup_seconds(path: str, column_type: str, users: int, lookups: int) -> float:
+    engine = create_engine(f"sqlite:///{path}")
+    samples = []
+    with engine.connect() as conn:
+        for _ in range(lookups):
+            user = random.randint(1, users)
+            started = time.perf_counter()
+            conn.execute(
+                text("SELECT id, title, completed FROM task WHERE user_id = :user_id"),
+                {"user_id": str(user) if column_type == "VARCHAR" else user},
+            ).all()
+            samples.append(time.perf_counter() - started)
+    engine.dispose()
+    return statistics.median(samples)
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    random.seed(7)
+    print(f"{users} users x {per_user} tasks = {users * per_user} rows")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n, (label, column_type, indexed) in enumerate(VARIANTS):
+            path = os.path.join(tmp, f"variant{n}.db")
+            index_bytes = build(path, column_type, indexed, users, per_user)
+            median = lookup_seconds(path, column_type, users, 2000 if indexed else 50)
+            size = f"{index_bytes / 1e6:6.2f} MB" if indexed else "     -   "
+            print(f"{label:26s} index {size}   lookup median {median * 1e3:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Restart: first-request latency with and without the warm-up stage
+
+Seeds a temporary SQLite database with a user, starts the app on it with
+uvicorn in a fresh process and times the first requests, then repeats them
+for the steady state:
+
+  tasks  - GET /api/tasks/stats (token check, user lookup, one read)
+  chat   - POST /api/chat "show my tasks" (new conversation, two messages,
+           history read, one tool call)
+
+With warm-up the requests wait for /ready first, as a load balancer would;
+without it (WARMUP_ENABLED=false) they go out as soon as /health answers.
+Each configuration is started several times and the medians are reported.
+
+Usage: python bench_warmup.py [starts]
+"""
+
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'unused.db')}"
+
+import httpx
+from sqlmodel import Session, SQLModel, create_engine
+
+from auth import create_access_token
+from models import User
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def timed(func):
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def seed(url: str):
+    engine = create_engine(url)
+    SQLModel.metadata.create_all(bind=engine)
+    with Session(engine) as session:
+        session.add(User(email="bench@example.com", username="bench", hashed_password="x"))
+        session.commit()
+    engine.dispose()
+
+
+def restart(warmup: bool):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        seed(url)
+        env = dict(os.environ, DATABASE_URL=url, WARMUP_ENABLED=str(warmup).lower(), AGENT_CACHE_ENABLED="false")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        )
+        try:
+            started = time.perf_counter()
+            with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+                while True:
+                    try:
+                        if client.get("/ready" if warmup else "/health").status_code == 200:
+                            break
+                    except httpx.TransportError:
+                        pass
+                    time.sleep(0.01)
+                until_ready = time.perf_counter() - started
+
+                headers = {"Authorization": f"Bearer {create_access_token({'sub': 'bench'})}"}
+                tasks = lambda: client.get("/api/tasks/stats", headers=headers)
+                chat = lambda: client.post("/api/chat", json={"message": "show my tasks"}, headers=headers)
+                first_tasks, first_chat = timed(tasks), timed(chat)
+                steady_tasks = statistics.median(timed(tasks) for _ in range(20))
+                steady_chat = statistics.median(timed(chat) for _ in range(20))
+        finally:
+            server.terminate()
+            server.wait()
+    return until_ready, first_tasks, steady_tasks, first_chat, steady_chat
+
+
+def main():
+    starts = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'':10s} {'to ready':>9s} {'1st tasks':>10s} {'steady':>8s} {'1st chat':>9s} {'steady':>8s}  (ms)")
+    for warmup in (False, True):
+        runs = [restart(warmup) for _ in range(starts)]
+        medians = [statistics.median(run[i] for run in runs) * 1e3 for i in range(5)]
+        print(f"{'warm-up' if warmup else 'cold':10s} "
+              + " ".join(f"{m:{w}.1f}" for m, w in zip(medians, (9, 10, 8, 9, 8))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Per-turn latency: POST /api/chat vs. turns on one /ws/chat connection
+
+Starts the app with uvicorn on a local port against a temporary SQLite
+database, registers a user and sends the same read-only turn repeatedly over
+HTTP (new connection per turn, and keep-alive) and over a single WebSocket.
+TLS is not included, so the HTTP numbers are a lower bound.
+
+Usage: python bench_ws_chat.py [turns]
+"""
+
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+_tmp = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'bench.db')}"
+os.environ.setdefault("AGENT_CACHE_ENABLED", "false")
+
+import httpx
+import uvicorn
+import websockets
+
+from main import app
+
+MESSAGE = "show my tasks"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def report(label: str, samples):
+    samples = sorted(samples)
+    print(f"{label:24s} median {statistics.median(samples) * 1e3:7.2f} ms   "
+          f"p95 {samples[int(len(samples) * 0.95) - 1] * 1e3:7.2f} ms")
+
+
+async def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    port = free_port()
+    server = start_server(port)
+    base = f"http://127.0.0.1:{port}"
+
+    async with httpx.AsyncClient(base_url=base) as client:
+        response = await client.post("/auth/register", json={
+            "email": "bench@example.com", "username": "bench", "password": "bench-password"
+        })
+        token = response.json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        await client.post("/api/chat", json={"message": "add task to run the benchmark"}, headers=headers)
+
+        samples = []
+        for _ in range(turns):
+            started = time.perf_counter()
+            await client.post("/api/chat", json={"message": MESSAGE}, headers=headers)
+            samples.append(time.perf_counter() - started)
+        report("HTTP keep-alive", samples)
+
+    samples = []
+    for _ in range(turns):
+        started = time.perf_counter()
+        async with httpx.AsyncClient(base_url=base) as client:
+            await client.post("/api/chat", json={"message": MESSAGE}, headers=headers)
+        samples.append(time.perf_counter() - started)
+    report("HTTP new connection", samples)
+
+    samples = []
+    async with websockets.connect(f"ws://127.0.0.1:{port}/ws/chat?token={token}") as websocket:
+        json.loads(await websocket.recv())  # ready
+        for n in range(turns):
+            started = time.perf_counter()
+            await websocket.send(json.dumps({"type": "message", "id": n, "message": MESSAGE}))
+            while json.loads(await websocket.recv())["type"] != "done":
+                pass
+            samples.append(time.perf_counter() - started)
+    report("WebSocket", samples)
+
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
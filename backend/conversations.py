@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Conversation and message browsing
+
+Listing a user's conversations must not touch their messages, so each
+conversation row carries its message count and a preview of its last
+message, kept up to date by record_message() in the same transaction as
+every message insert; the list is then a range scan of the
+(user_id, updated_at, id) index. Messages are paged backwards from the
+newest with a (created_at, id) keyset on the
+(conversation_id, created_at, id) index, continuing into the archive once
+the hot rows run out (see archive.read_backwards).
+
+Cursors are opaque to clients: "<iso timestamp>_<id>" of the last row
+returned, passed back as `before`.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import tuple_, update
+from sqlmodel import Session, select
+
+from archive import read_backwards
+from models import Conversation
+
+PREVIEW_CHARS = 120
+
+
+class InvalidCursor(ValueError):
+    """A `before` cursor that was not produced by this API"""
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    return f"{timestamp.isoformat()}_{row_id}"
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    if not cursor:
+        return None
+    try:
+        timestamp, row_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+
+
+def preview(content: str) -> str:
+    content = " ".join(content.split())
+    return content if len(content) <= PREVIEW_CHARS else content[:PREVIEW_CHARS - 1] + "…"
+
+
+def record_message(session: Session, conversation_id: int, content: str, created_at: datetime):
+    """Count a new message on its conversation; call in the transaction that inserts it"""
+    session.execute(
+        update(Conversation)
+        .where(Conversation.id == conversation_id)
+        .values(
+            message_count=Conversation.message_count + 1,
+            last_message_preview=preview(content),
+            updated_at=created_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def list_conversations(session: Session, user_id: int, before: Optional[str], limit: int) -> Dict[str, Any]:
+    """The user's conversations, most recently active first"""
+    statement = (
+        select(Conversation.id, Conversation.message_count, Conversation.last_message_preview,
+               Conversation.created_at, Conversation.updated_at)
+        .where(Conversation.user_id == user_id)
+        .order_by(Conversation.updated_at.desc(), Conversation.id.desc())
+        .limit(limit + 1)
+    )
+    cursor = decode_cursor(before)
+    if cursor is not None:
+        statement = statement.where(tuple_(Conversation.updated_at, Conversation.id) < tuple_(*cursor))
+    rows = session.exec(statement).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "conversations": [
+            {
+                "id": conversation_id,
+                "message_count": message_count,
+                "last_message_preview": last_message_preview,
+                "created_at": created_at,
+                "updated_at": updated_at,
+            }
+            for conversation_id, message_count, last_message_preview, created_at, updated_at in rows
+        ],
+        "next": encode_cursor(rows[-1].updated_at, rows[-1].id) if has_more else None,
+    }
+
+
+def page_messages(session: Session, conversation_id: int, before: Optional[str], limit: int) -> Dict[str, Any]:
+    """
+    One page of a conversation's messages going back in time: the newest
+    `limit` messages older than the cursor, returned oldest first
+    """
+    rows = read_backwards(session, conversation_id, limit + 1, decode_cursor(before))
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    oldest = rows[-1] if rows else None
+    return {
+        "messages": [
+            {"id": message_id, "role": role, "content": content, "created_at": created_at}
+            for message_id, role, content, created_at in reversed(rows)
+        ],
+        "next": encode_cursor(oldest[3], oldest[0]) if has_more else None,
+    }
@@ -0,0 +1,372 @@
+"""
+Database engine construction and per-dialect tuning
+"""
+
+import bisect
+import hashlib
+import itertools
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import event, text
+from sqlalchemy.pool import QueuePool
+from sqlmodel import create_engine
+
+
+def apply_sqlite_pragmas(engine, settings):
+    """Apply the SQLite performance profile to every new DBAPI connection"""
+    pragmas = [
+        ("journal_mode", settings.sqlite_journal_mode),
+        ("synchronous", settings.sqlite_synchronous),
+        ("mmap_size", settings.sqlite_mmap_size),
+        ("cache_size", settings.sqlite_cache_size),
+        ("busy_timeout", settings.sqlite_busy_timeout_ms),
+        ("temp_store", settings.sqlite_temp_store),
+    ]
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    return engine
+
+
+def create_sqlite_engine(database_url: str, settings, echo: bool = False, writer: bool = False):
+    """Create a tuned SQLite engine; writer engines hold a single connection"""
+    if writer:
+        pool_args = {
+            "pool_size": 1,
+            "max_overflow": 0,
+            "pool_timeout": max(settings.sqlite_busy_timeout_ms / 1000, 1),
+        }
+    else:
+        pool_args = {
+            "pool_size": settings.sqlite_read_pool_size,
+            "max_overflow": settings.sqlite_read_pool_size,
+        }
+    engine = create_engine(
+        database_url,
+        echo=echo,
+        connect_args={"check_same_thread": False},
+        poolclass=QueuePool,
+        **pool_args,
+    )
+    return apply_sqlite_pragmas(engine, settings)
+
+
+def create_sqlite_engines(database_url: str, settings, echo: bool = False):
+    """
+    Build the (reader, writer) engine pair for a SQLite database.
+
+    SQLite only ever allows one writer, so the writer engine holds a single
+    pooled connection: concurrent writes queue on the pool instead of
+    spinning on SQLITE_BUSY. Reads go through a regular pool, which WAL lets
+    run alongside the writer.
+    """
+    reader = create_sqlite_engine(database_url, settings, echo=echo)
+    writer = create_sqlite_engine(database_url, settings, echo=echo, writer=True)
+    return reader, writer
+
+
+class EngineRouter:
+    """
+    Routes sessions between the primary database and its read replicas.
+
+    Writes always go to the primary. Reads are spread round-robin over the
+    healthy replicas, except for a user who wrote within the last
+    `read_your_writes_seconds`: they read from the primary so they never see
+    a replica that has not caught up with their own change. A replica that
+    fails a connection is taken out of rotation until check_replicas() (run
+    in the background) finds it healthy again; reader() never connects, so
+    it cannot block the event loop on a replica that is still down.
+    """
+
+    def __init__(self, primary, writer=None, replicas=(), read_your_writes_seconds: float = 2.0):
+        self.primary = primary
+        self.writer_engine = writer if writer is not None else primary
+        self.replicas = list(replicas)
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self.logger = logging.getLogger(__name__)
+        self._last_write: Dict[str, float] = {}
+        self._down: Set[int] = set()
+        self._rotation = itertools.count()
+        self._lock = threading.Lock()
+
+        for replica in self.replicas:
+            event.listen(replica, "handle_error", self._on_replica_error)
+
+    @property
+    def shards(self) -> List["EngineRouter"]:
+        """An unsharded database is a single shard"""
+        return [self]
+
+    def shard_for(self, user_id) -> int:
+        return 0
+
+    def moving(self, user_id) -> bool:
+        return False
+
+    def engines(self) -> list:
+        """Every distinct engine: primary, writer and replicas"""
+        return list({id(engine): engine for engine in (self.primary, self.writer_engine, *self.replicas)}.values())
+
+    def writer(self, user_id=None):
+        """Return the engine for a write, remembering who wrote and when"""
+        if user_id is not None:
+            now = time.monotonic()
+            with self._lock:
+                self._last_write[str(user_id)] = now
+                if len(self._last_write) > 10000:
+                    cutoff = now - self.read_your_writes_seconds
+                    self._last_write = {k: t for k, t in self._last_write.items() if t > cutoff}
+        return self.writer_engine
+
+    def reader(self, user_id=None):
+        """Return the engine for a read-only operation"""
+        if not self.replicas:
+            return self.primary
+
+        now = time.monotonic()
+        if user_id is not None:
+            last_write = self._last_write.get(str(user_id))
+            if last_write is not None and now - last_write < self.read_your_writes_seconds:
+                return self.primary
+
+        for _ in range(len(self.replicas)):
+            index = next(self._rotation) % len(self.replicas)
+            if index not in self._down:
+                return self.replicas[index]
+        return self.primary
+
+    def warm_up(self, connections: int):
+        """
+        Open up to `connections` connections per engine (no more than its pool
+        keeps idle) and run a trivial query on each, so the first requests
+        find them in the pool. A replica that fails is marked down; a primary
+        that fails raises.
+        """
+        for engine in dict.fromkeys([self.primary, self.writer_engine]):
+            self._open_connections(engine, connections)
+        for index, replica in enumerate(self.replicas):
+            try:
+                self._open_connections(replica, connections)
+            except Exception as e:
+                self.logger.warning(f"Read replica {index} warm-up failed: {str(e)}")
+                self.mark_down(index)
+
+    def ping(self):
+        """
+        Run a trivial query on the primary; raises if it is unreachable. Not
+        through the writer engine: SQLite's has one connection, which a long
+        write would hold.
+        """
+        with self.primary.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    @staticmethod
+    def _open_connections(engine, connections: int):
+        size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+        # Hold them all at once so each checkout opens a new connection
+        with ExitStack() as stack:
+            for _ in range(max(1, min(connections, size))):
+                stack.enter_context(engine.connect()).execute(text("SELECT 1"))
+
+    def check_replicas(self) -> Dict[int, bool]:
+        """Probe every replica and update its health; returns index -> healthy"""
+        return {index: self._probe(index) for index in range(len(self.replicas))}
+
+    def mark_down(self, index: int):
+        with self._lock:
+            self._down.add(index)
+        self.logger.warning(f"Read replica {index} marked unhealthy")
+
+    def _probe(self, index: int) -> bool:
+        try:
+            with self.replicas[index].connect() as conn:
+                conn.execute(text("SELECT 1"))
+        except Exception as e:
+            self.logger.warning(f"Read replica {index} health check failed: {str(e)}")
+            self.mark_down(index)
+            return False
+        with self._lock:
+            self._down.discard(index)
+        return True
+
+    def _on_replica_error(self, context):
+        # Connect failures have no Connection yet; dropped links are disconnects
+        if context.is_disconnect or context.connection is None:
+            for index, replica in enumerate(self.replicas):
+                if replica is context.engine:
+                    self.mark_down(index)
+
+
+# Each shard hands out row ids from its own range, so rows keep their ids
+# when a user moves between shards
+SHARD_ID_BITS = 40
+
+
+class ShardMoving(Exception):
+    """The user's data is being copied to another shard; writes must wait"""
+
+
+class HashRing:
+    """Consistent hashing of user ids onto shard indexes"""
+
+    def __init__(self, shard_count: int, virtual_nodes: int = 64):
+        points = sorted(
+            (self._hash(f"shard-{index}-{node}"), index)
+            for index in range(shard_count)
+            for node in range(virtual_nodes)
+        )
+        self._keys = [key for key, _ in points]
+        self._shards = [index for _, index in points]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+    def shard_for(self, user_id) -> int:
+        position = bisect.bisect(self._keys, self._hash(str(user_id))) % len(self._keys)
+        return self._shards[position]
+
+
+class ShardRouter:
+    """
+    Spreads users' data over several databases (shards), each behind its own
+    EngineRouter, with the same reader(user_id) / writer(user_id) interface.
+
+    A user lives on the shard the hash ring picks for their id unless the
+    shard directory (the shardassignment table on shard 0) says otherwise;
+    moving a user between shards (see sharding.py) records the new shard
+    there. The directory only holds the exceptions, so it is small: it is
+    reloaded whole, at most every `directory_seconds`. While a user is being
+    moved, writer() raises ShardMoving and reads stay on the old shard.
+
+    Work that is not for one user (accounts, idempotency keys, the directory
+    itself) goes to shard 0.
+    """
+
+    def __init__(self, shards: List[EngineRouter], directory_seconds: float = 2.0, virtual_nodes: int = 64):
+        self.shards = list(shards)
+        self.ring = HashRing(len(self.shards), virtual_nodes)
+        self.directory_seconds = directory_seconds
+        self.logger = logging.getLogger(__name__)
+        self._assignments: Dict[str, int] = {}
+        self._moving: Dict[str, int] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def shard_for(self, user_id) -> int:
+        """Index of the shard holding the user's data"""
+        if user_id is None or len(self.shards) == 1:
+            return 0
+        self._refresh_if_stale()
+        shard = self._assignments.get(str(user_id))
+        return self.ring.shard_for(user_id) if shard is None else shard
+
+    def reader(self, user_id=None):
+        return self.shards[self.shard_for(user_id)].reader(user_id)
+
+    def moving(self, user_id) -> bool:
+        """Whether the user's data is being moved to another shard"""
+        if user_id is None or len(self.shards) == 1:
+            return False
+        self._refresh_if_stale()
+        return str(user_id) in self._moving
+
+    def writer(self, user_id=None):
+        shard = self.shard_for(user_id)
+        if self.moving(user_id):
+            raise ShardMoving(f"User {user_id} is moving to another shard; try again shortly")
+        return self.shards[shard].writer(user_id)
+
+    def refresh_directory(self):
+        """Reload the shard directory from shard 0"""
+        with self.shards[0].primary.connect() as conn:
+            rows = conn.execute(text("SELECT user_id, shard, moving_to FROM shardassignment")).all()
+        self._assignments = {str(user_id): shard for user_id, shard, _ in rows}
+        self._moving = {str(user_id): moving_to for user_id, _, moving_to in rows if moving_to is not None}
+        self._loaded_at = time.monotonic()
+
+    def _refresh_if_stale(self):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.directory_seconds:
+            return
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.directory_seconds:
+                return
+            try:
+                self.refresh_directory()
+            except Exception as e:
+                # Routing without the directory would send moved users to the wrong shard
+                if self._loaded_at is None:
+                    raise
+                self.logger.warning(f"Shard directory reload failed, keeping the last one: {str(e)}")
+                self._loaded_at = time.monotonic()
+
+    @property
+    def primary(self):
+        return self.shards[0].primary
+
+    @property
+    def writer_engine(self):
+        return self.shards[0].writer_engine
+
+    @property
+    def replicas(self):
+        return [replica for shard in self.shards for replica in shard.replicas]
+
+    def engines(self) -> list:
+        return [engine for shard in self.shards for engine in shard.engines()]
+
+    def warm_up(self, connections: int):
+        for shard in self.shards:
+            shard.warm_up(connections)
+
+    def ping(self):
+        """Run a trivial query on every shard; raises if any is unreachable"""
+        for shard in self.shards:
+            shard.ping()
+
+    def check_replicas(self) -> Dict[str, bool]:
+        return {
+            f"{index}.{replica}": healthy
+            for index, shard in enumerate(self.shards)
+            for replica, healthy in shard.check_replicas().items()
+        }
+
+
+def reserve_id_range(engine, shard_index: int, tables: List[str]):
+    """
+    Start the shard's autoincrement ids at shard_index << SHARD_ID_BITS;
+    the id columns must be 64-bit (models.RowId).
+    Ids only ever move forward, so this is a no-op once the shard has
+    allocated past the start of its range.
+    """
+    start = shard_index << SHARD_ID_BITS
+    with engine.begin() as conn:
+        for table in tables:
+            if engine.dialect.name == "postgresql":
+                conn.execute(
+                    text(f"SELECT setval('{table}_id_seq', :start) WHERE (SELECT last_value FROM {table}_id_seq) < :start"),
+                    {"start": start},
+                )
+            else:
+                # Needs the table to be AUTOINCREMENT, which keeps its counter in sqlite_sequence
+                updated = conn.execute(
+                    text("UPDATE sqlite_sequence SET seq = :start WHERE name = :table AND seq < :start"),
+                    {"table": table, "start": start},
+                ).rowcount
+                if not updated:
+                    conn.execute(
+                        text("INSERT INTO sqlite_sequence (name, seq) SELECT :table, :start "
+                             "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :table)"),
+                        {"table": table, "start": start},
+                    )
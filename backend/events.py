@@ -0,0 +1,199 @@
+"""
+In-process pub/sub for task changes
+
+The MCP server's mutating tools publish one event per change; subscribers
+(SSE streams) receive the events for their own user. A subscriber is just a
+small bounded buffer plus an asyncio.Event, so idle subscribers cost no
+tasks or timers. When a consumer falls behind, pending events for the same
+task are coalesced to the latest one, and if the buffer is still full it is
+replaced by a single "resync" event telling the client to re-list.
+
+Delivery goes through a fan-out backend: LocalFanout for a single worker,
+PostgresFanout (LISTEN/NOTIFY) so every worker sees every change.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from models import db_router, settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """One subscriber's bounded buffer of pending events"""
+
+    def __init__(self, user_id: str, max_pending: int):
+        self.user_id = user_id
+        self.max_pending = max_pending
+        self.dropped = 0
+        # (task_id or sequence) -> event, oldest first
+        self._pending: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()
+        self._sequence = 0
+        self._resync = False
+        self._wakeup = asyncio.Event()
+
+    def push(self, event: Dict[str, Any]):
+        """Queue an event (event loop thread only)"""
+        if self._resync:
+            self.dropped += 1
+            return
+
+        task_id = event.get("task_id")
+        if task_id is not None and task_id in self._pending:
+            # Coalesce: only the latest state of a task matters
+            del self._pending[task_id]
+            self.dropped += 1
+        elif len(self._pending) >= self.max_pending:
+            self.dropped += len(self._pending) + 1
+            self._pending.clear()
+            self._resync = True
+            self._wakeup.set()
+            return
+
+        if task_id is None:
+            self._sequence += 1
+            task_id = ("event", self._sequence)
+        self._pending[task_id] = event
+        self._wakeup.set()
+
+    async def get(self) -> List[Dict[str, Any]]:
+        """Wait for and drain all pending events"""
+        await self._wakeup.wait()
+        self._wakeup.clear()
+        if self._resync:
+            self._resync = False
+            return [{"op": "resync"}]
+        events = list(self._pending.values())
+        self._pending.clear()
+        return events
+
+
+class TaskEventHub:
+    def __init__(self, max_pending: int = 100):
+        self.max_pending = max_pending
+        self.backend: "FanoutBackend" = LocalFanout(self)
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id) -> Subscription:
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(str(user_id), self.max_pending)
+        with self._lock:
+            self._subscribers.setdefault(subscription.user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, user_id, event: Dict[str, Any]):
+        """Publish a change for a user; safe to call from any thread"""
+        try:
+            self.backend.publish(str(user_id), event)
+        except Exception as e:
+            logger.error(f"Error publishing task event: {str(e)}")
+
+    def deliver(self, user_id: str, event: Dict[str, Any]):
+        """Hand an event to this process's subscribers; safe to call from any thread"""
+        if user_id not in self._subscribers or self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._deliver_local(user_id, event)
+        else:
+            self._loop.call_soon_threadsafe(self._deliver_local, user_id, event)
+
+    def _deliver_local(self, user_id: str, event: Dict[str, Any]):
+        for subscription in list(self._subscribers.get(user_id, ())):
+            subscription.push(event)
+
+
+class FanoutBackend:
+    """Moves published events to the hubs of every worker"""
+
+    def publish(self, user_id: str, event: Dict[str, Any]):
+        raise NotImplementedError
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class LocalFanout(FanoutBackend):
+    """Single-process deployments: deliver straight to the local hub"""
+
+    def __init__(self, hub: TaskEventHub):
+        self.hub = hub
+
+    def publish(self, user_id: str, event: Dict[str, Any]):
+        self.hub.deliver(user_id, event)
+
+
+class PostgresFanout(FanoutBackend):
+    """
+    Multi-worker deployments: publish with pg_notify and LISTEN in every
+    worker, so each worker's hub sees changes made by any of them
+    """
+
+    channel = "task_events"
+
+    def __init__(self, hub: TaskEventHub, engine, dsn: str):
+        self.hub = hub
+        self.engine = engine
+        self.dsn = dsn
+        self._connection = None
+
+    def publish(self, user_id: str, event: Dict[str, Any]):
+        payload = json.dumps({"user_id": user_id, "event": event}, separators=(",", ":"), default=str)
+        with self.engine.begin() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": self.channel, "payload": payload})
+
+    async def start(self):
+        import asyncpg
+
+        self._connection = await asyncpg.connect(self.dsn)
+        await self._connection.add_listener(self.channel, self._on_notify)
+
+    async def stop(self):
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        message = json.loads(payload)
+        self.hub.deliver(message["user_id"], message["event"])
+
+
+task_events = TaskEventHub(max_pending=settings.task_events_max_pending)
+
+
+def configure_task_events():
+    """Select the fan-out backend from settings; call once at startup"""
+    if settings.task_events_backend == "postgres":
+        dsn = make_url(settings.database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        task_events.backend = PostgresFanout(task_events, db_router.writer(), dsn)
+    else:
+        task_events.backend = LocalFanout(task_events)
+    return task_events.backend
@@ -0,0 +1,244 @@
+"""
+Idempotency keys for chat turns and task mutations
+
+A client may send the same request several times (a mobile retry after a
+timeout); with an idempotency key only the first attempt does the work and
+every retry gets the stored result. Results live in the `idempotencyrecord`
+table with a TTL, fronted by a small in-memory cache. Concurrent duplicates
+in this process await the first attempt; duplicates in other workers see
+its "pending" row and poll until it finishes. The running attempt keeps
+pushing its pending row's expiry forward, so only the claim of a worker
+that died lapses after IDEMPOTENCY_PENDING_TIMEOUT_SECONDS, however long
+the request itself takes; duplicates wait for as long as the claim lives.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+
+from models import IdempotencyRecord, db_router, settings
+from profiling import to_thread
+
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyConflict(Exception):
+    """The key is in use by a different request, or its first attempt is still running"""
+
+
+def fingerprint(payload: Any) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, ttl_seconds: float = 86400, pending_timeout_seconds: float = 60,
+                 memory_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.pending_timeout_seconds = pending_timeout_seconds
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, Tuple[datetime, str, Any]]" = OrderedDict()
+        # record key -> (fingerprint, future) of the attempt running in this process
+        self._inflight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self._lock = threading.Lock()
+
+    async def run(self, scope: str, user_id, key: str, payload: Any,
+                  func: Callable[[], Awaitable[Any]],
+                  should_store: Callable[[Any], bool] = lambda result: True) -> Any:
+        """
+        Run `func` once per (scope, user, key) within the TTL and return its
+        result; retries with the same key get the stored result instead.
+        `payload` must describe the request so a reused key is detected.
+        """
+        record_key = f"{scope}:{user_id}:{key}"
+        request_fingerprint = fingerprint(payload)
+
+        stored = self._remembered(record_key, request_fingerprint)
+        if stored is not None:
+            return stored[0]
+
+        inflight = self._inflight.get(record_key)
+        if inflight is not None:
+            inflight_fingerprint, inflight_future = inflight
+            if inflight_fingerprint != request_fingerprint:
+                raise IdempotencyConflict("Idempotency key was already used for a different request")
+            return await asyncio.shield(inflight_future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[record_key] = (request_fingerprint, future)
+        try:
+            claimed, stored = await to_thread(self._claim, record_key, int(user_id), request_fingerprint)
+            if not claimed:
+                if stored is None:
+                    stored = await self._wait_for_other_worker(record_key, request_fingerprint)
+                result = stored[0]
+            else:
+                holder = asyncio.create_task(self._hold_claim(record_key))
+                try:
+                    result = await func()
+                except BaseException:
+                    await to_thread(self._release, record_key)
+                    raise
+                finally:
+                    holder.cancel()
+                if should_store(result):
+                    await to_thread(self._complete, record_key, request_fingerprint, result)
+                else:
+                    await to_thread(self._release, record_key)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            self._inflight.pop(record_key, None)
+
+    def _remembered(self, record_key: str, request_fingerprint: str) -> Optional[Tuple[Any]]:
+        with self._lock:
+            entry = self._memory.get(record_key)
+            if entry is None:
+                return None
+            expires_at, stored_fingerprint, result = entry
+            if expires_at <= datetime.utcnow():
+                del self._memory[record_key]
+                return None
+            self._memory.move_to_end(record_key)
+        if stored_fingerprint != request_fingerprint:
+            raise IdempotencyConflict("Idempotency key was already used for a different request")
+        return (result,)
+
+    def _remember(self, record_key: str, expires_at: datetime, request_fingerprint: str, result: Any):
+        with self._lock:
+            self._memory[record_key] = (expires_at, request_fingerprint, result)
+            self._memory.move_to_end(record_key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _claim(self, record_key: str, user_id: int, request_fingerprint: str):
+        """
+        Insert a pending row for the key. Returns (True, None) when this
+        attempt owns the key, (False, (result,)) for a finished earlier
+        attempt, or (False, None) while another attempt is still pending.
+        """
+        now = datetime.utcnow()
+        with Session(db_router.writer()) as session:
+            record = session.get(IdempotencyRecord, record_key)
+            if record is not None and record.expires_at <= now:
+                # Expired results, and pending rows whose worker died, are reclaimed
+                session.delete(record)
+                session.commit()
+                record = None
+
+            if record is None:
+                session.add(IdempotencyRecord(
+                    key=record_key,
+                    user_id=user_id,
+                    fingerprint=request_fingerprint,
+                    status="pending",
+                    expires_at=now + timedelta(seconds=self.pending_timeout_seconds),
+                ))
+                try:
+                    session.commit()
+                    return True, None
+                except IntegrityError:
+                    session.rollback()
+                    record = session.get(IdempotencyRecord, record_key)
+                    if record is None:
+                        return False, None
+
+            return False, self._stored_result(record, request_fingerprint)
+
+    def _stored_result(self, record: IdempotencyRecord, request_fingerprint: str) -> Optional[Tuple[Any]]:
+        if record.fingerprint != request_fingerprint:
+            raise IdempotencyConflict("Idempotency key was already used for a different request")
+        if record.status != "done":
+            return None
+        result = json.loads(record.response)
+        self._remember(record.key, record.expires_at, record.fingerprint, result)
+        return (result,)
+
+    def _complete(self, record_key: str, request_fingerprint: str, result: Any):
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+        with Session(db_router.writer()) as session:
+            record = session.get(IdempotencyRecord, record_key)
+            if record is not None:
+                record.status = "done"
+                record.response = json.dumps(result, default=str, separators=(",", ":"))
+                record.expires_at = expires_at
+                session.add(record)
+                session.commit()
+        self._remember(record_key, expires_at, request_fingerprint, result)
+
+    async def _hold_claim(self, record_key: str):
+        """Extend this attempt's pending claim until cancelled, so no other worker reclaims the key"""
+        while True:
+            await asyncio.sleep(self.pending_timeout_seconds / 3)
+            try:
+                await to_thread(self._extend, record_key)
+            except Exception as e:
+                logger.warning(f"Could not extend the idempotency claim {record_key}: {str(e)}")
+
+    def _extend(self, record_key: str):
+        with Session(db_router.writer()) as session:
+            session.execute(
+                update(IdempotencyRecord)
+                .where(IdempotencyRecord.key == record_key, IdempotencyRecord.status == "pending")
+                .values(expires_at=datetime.utcnow() + timedelta(seconds=self.pending_timeout_seconds))
+            )
+            session.commit()
+
+    def _release(self, record_key: str):
+        """Drop a pending claim so a retry can run the request again"""
+        with Session(db_router.writer()) as session:
+            session.execute(delete(IdempotencyRecord).where(
+                IdempotencyRecord.key == record_key, IdempotencyRecord.status == "pending"
+            ))
+            session.commit()
+
+    async def _wait_for_other_worker(self, record_key: str, request_fingerprint: str) -> Tuple[Any]:
+        """Poll for the other attempt's result for as long as it keeps extending its claim"""
+        delay = 0.05
+        while True:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+            stored, expires_at = await to_thread(self._lookup, record_key, request_fingerprint)
+            if stored is not None:
+                return stored
+            if expires_at <= datetime.utcnow():
+                # Its worker stopped extending the claim; a retry reclaims the key
+                raise IdempotencyConflict("The earlier request with this idempotency key did not finish; retry it")
+
+    def _lookup(self, record_key: str, request_fingerprint: str) -> Tuple[Optional[Tuple[Any]], Optional[datetime]]:
+        """(result,) once the attempt is done, else (None, expiry of its pending claim)"""
+        # The writer, as for the claim: a replica may not have the other worker's pending row yet
+        with Session(db_router.writer()) as session:
+            record = session.get(IdempotencyRecord, record_key)
+            if record is None:
+                raise IdempotencyConflict("The earlier request with this idempotency key failed; retry it")
+            return self._stored_result(record, request_fingerprint), record.expires_at
+
+    def purge_expired(self) -> int:
+        """Delete expired records; returns how many were removed"""
+        with Session(db_router.writer()) as session:
+            result = session.execute(delete(IdempotencyRecord).where(IdempotencyRecord.expires_at <= datetime.utcnow()))
+            session.commit()
+            return result.rowcount
+
+
+idempotency_store = IdempotencyStore(
+    ttl_seconds=settings.idempotency_ttl_seconds,
+    pending_timeout_seconds=settings.idempotency_pending_timeout_seconds,
+)
@@ -0,0 +1,118 @@
+"""
+Async client for OpenAI-compatible chat completion APIs
+
+One pooled httpx.AsyncClient is shared per upstream base URL, with
+per-request timeouts, retries with full jitter and a concurrency limit, so a
+burst of chat turns queues locally instead of piling onto the model API.
+"""
+
+import asyncio
+import logging
+import random
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Raised when the model API cannot produce a completion"""
+
+
+class LLMClient:
+    def __init__(self, base_url: str, api_key: str, model: str, timeout: float = 30.0,
+                 connect_timeout: float = 5.0, max_retries: int = 3, max_concurrency: int = 16,
+                 backoff_base: float = 0.5, backoff_cap: float = 8.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.logger = logging.getLogger(__name__)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            transport=transport,
+        )
+
+    async def chat_completion(self, messages: List[Dict[str, Any]],
+                              tools: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """POST /chat/completions and return the first choice's message"""
+        payload = {"model": self.model, "messages": messages}
+        if tools:
+            payload["tools"] = tools
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                async with self._semaphore:
+                    response = await self._client.post("/chat/completions", json=payload)
+                if response.status_code not in RETRYABLE_STATUS:
+                    response.raise_for_status()
+                    return self._first_message(response)
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("retry-after")
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                error = repr(e)
+            except httpx.HTTPStatusError as e:
+                raise LLMError(f"Model API rejected the request: HTTP {e.response.status_code}") from e
+
+            if attempt == self.max_retries:
+                raise LLMError(f"Model API failed after {attempt + 1} attempts: {error}")
+            delay = self._backoff(attempt, retry_after)
+            self.logger.warning(f"Model API call failed ({error}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _first_message(response: httpx.Response) -> Dict[str, Any]:
+        try:
+            message = response.json()["choices"][0]["message"]
+        except (ValueError, LookupError, TypeError) as e:
+            raise LLMError(f"Model API returned a malformed response: {e!r}") from e
+        if not isinstance(message, dict):
+            raise LLMError("Model API returned a malformed response: the message is not an object")
+        return message
+
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.backoff_cap)
+            except ValueError:
+                pass
+        # Full jitter keeps retrying clients from synchronising
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+_clients: Dict[str, LLMClient] = {}
+
+
+def get_llm_client(settings) -> LLMClient:
+    """Return the shared client for the configured upstream"""
+    client = _clients.get(settings.llm_base_url)
+    if client is None:
+        client = LLMClient(
+            settings.llm_base_url,
+            settings.llm_api_key,
+            settings.llm_model,
+            timeout=settings.llm_timeout_seconds,
+            connect_timeout=settings.llm_connect_timeout_seconds,
+            max_retries=settings.llm_max_retries,
+            max_concurrency=settings.llm_max_concurrency,
+        )
+        _clients[settings.llm_base_url] = client
+    return client
+
+
+async def close_llm_clients():
+    for client in list(_clients.values()):
+        await client.aclose()
+    _clients.clear()
@@ -1,34 +1,148 @@
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
 import os
 import logging
-from typing import Optional
+from typing import Dict, Optional
 from pydantic import BaseModel
 from sqlmodel import SQLModel, Field, create_engine, Session, select
 from contextlib import asynccontextmanager
 from datetime import datetime
 import uuid
+import asyncio
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Import models
-from models import Task, Conversation, Message, engine, User
+from models import Task, Conversation, Message, engine, write_engine, db_router, settings, User
+
+from archive import archive_from_settings
+from llm import close_llm_clients
+from agents import close_mcp_client, mcp_server_instance, open_mcp_client, warm_up_rules
+from events import configure_task_events
+from idempotency import idempotency_store
+from profiling import ProfilerMiddleware
+from tracing import TracingMiddleware, configure_tracing
+from slow_queries import QueryOriginMiddleware, query_origin, slow_query_log
+from task_sync import compact_from_settings
+from task_stats import reconcile_from_settings
+from reminders import reminder_scheduler
+from database import ShardMoving
+from sharding import create_tables
+from warmup import Readiness, warm_up
 
 # Import routes
-from routes.chat import router as chat_router
+from routes.chat import router as chat_router, warm_up_chat_statements
+from routes.ws_chat import router as ws_chat_router
+from routes.task_events import router as task_events_router
+from routes.transfer import router as transfer_router
+from routes.task_sync import router as task_sync_router
+from routes.task_stats import router as task_stats_router
+from routes.conversations import router as conversations_router
+from routes.admin import router as admin_router
 from routes.auth import router as auth_router
 from routes.auth_routes import router as auth_routes_router, get_current_user
 
+
+async def check_replicas_periodically():
+    """Keep replica health fresh so failed replicas rejoin once they recover"""
+    while True:
+        await asyncio.sleep(settings.replica_health_check_seconds)
+        with query_origin("job:check_replicas"):
+            await asyncio.to_thread(db_router.check_replicas)
+
+
+async def archive_messages_periodically():
+    """Move old messages to the compressed archive in the background"""
+    while True:
+        await asyncio.sleep(settings.archive_interval_seconds)
+        try:
+            with query_origin("job:archive"):
+                await asyncio.to_thread(archive_from_settings)
+        except Exception as e:
+            logging.error(f"Message archive pass failed: {str(e)}")
+
+
+async def purge_idempotency_keys_periodically():
+    """Drop stored idempotency results once their TTL has passed"""
+    while True:
+        await asyncio.sleep(settings.idempotency_purge_interval_seconds)
+        try:
+            with query_origin("job:purge_idempotency_keys"):
+                await asyncio.to_thread(idempotency_store.purge_expired)
+        except Exception as e:
+            logging.error(f"Idempotency key purge failed: {str(e)}")
+
+
+async def compact_tombstones_periodically():
+    """Drop task tombstones once they are past the delta sync retention"""
+    while True:
+        await asyncio.sleep(settings.tombstone_compaction_interval_seconds)
+        try:
+            with query_origin("job:compact_tombstones"):
+                await asyncio.to_thread(compact_from_settings)
+        except Exception as e:
+            logging.error(f"Tombstone compaction failed: {str(e)}")
+
+
+async def reconcile_task_stats_periodically():
+    """Recount the per-user task stats to repair any drift"""
+    while True:
+        await asyncio.sleep(settings.stats_reconcile_interval_seconds)
+        try:
+            with query_origin("job:reconcile_task_stats"):
+                await asyncio.to_thread(reconcile_from_settings)
+        except Exception as e:
+            logging.error(f"Task stats reconciliation failed: {str(e)}")
+
+
+async def fire_reminders():
+    """Fire task reminders as they come due (see reminders.py)"""
+    with query_origin("job:reminders"):
+        await reminder_scheduler.run()
+
+
 # Initialize the FastAPI app
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Create tables on startup
-    SQLModel.metadata.create_all(bind=engine)
+    # Create tables on startup (on every shard)
+    create_tables()
+
+    events_backend = configure_task_events()
+    await events_backend.start()
+    trace_exporter = configure_tracing(settings, "todo-chatbot-api")
+    trace_exporter.start()
+    open_mcp_client()
+
+    background_tasks = []
+    readiness.reset()
+    if settings.warmup_enabled:
+        background_tasks.append(asyncio.create_task(warm_up(warmup_steps(), readiness)))
+    else:
+        readiness.warmed_up = True
+    if db_router.replicas:
+        background_tasks.append(asyncio.create_task(check_replicas_periodically()))
+    if settings.archive_interval_seconds > 0:
+        background_tasks.append(asyncio.create_task(archive_messages_periodically()))
+    if settings.idempotency_purge_interval_seconds > 0:
+        background_tasks.append(asyncio.create_task(purge_idempotency_keys_periodically()))
+    if settings.tombstone_compaction_interval_seconds > 0:
+        background_tasks.append(asyncio.create_task(compact_tombstones_periodically()))
+    if settings.stats_reconcile_interval_seconds > 0:
+        background_tasks.append(asyncio.create_task(reconcile_task_stats_periodically()))
+    if settings.reminder_window_seconds > 0:
+        background_tasks.append(asyncio.create_task(fire_reminders()))
     yield
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await close_llm_clients()
+    await close_mcp_client()
+    await events_backend.stop()
+    trace_exporter.stop()
 
 app = FastAPI(
     title="Todo AI Chatbot API",
@@ -46,28 +160,106 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Attribute slow statements to their route (see slow_queries.py)
+if slow_query_log.enabled:
+    app.add_middleware(QueryOriginMiddleware)
+
+# Root spans for sampled requests (see tracing.py)
+if settings.tracing_enabled:
+    app.add_middleware(TracingMiddleware)
+
+# Opt-in profiling of single requests (see profiling.py)
+if settings.profiling_enabled:
+    if not settings.profiling_token:
+        logging.warning("PROFILING_ENABLED is set without PROFILING_TOKEN; no request will be profiled")
+    app.add_middleware(
+        ProfilerMiddleware,
+        token=settings.profiling_token,
+        directory=settings.profiling_dir,
+        interval=settings.profiling_interval_seconds,
+        max_bytes=settings.profiling_max_bytes,
+    )
+
+# A user being moved between shards cannot write for a moment (see sharding.py)
+@app.exception_handler(ShardMoving)
+async def shard_moving_handler(request: Request, exc: ShardMoving):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+
 # Include routers
 app.include_router(auth_routes_router)  # Include the new authentication routes
 app.include_router(chat_router, prefix="/api")
+app.include_router(ws_chat_router)
+app.include_router(task_events_router, prefix="/api")
+app.include_router(transfer_router, prefix="/api")
+app.include_router(task_sync_router, prefix="/api")
+app.include_router(task_stats_router, prefix="/api")
+app.include_router(conversations_router, prefix="/api")
+app.include_router(admin_router, prefix="/api")
 app.include_router(auth_router, prefix="/auth")
 
-# Serve frontend files
+# Health check endpoint: liveness only, see /ready for readiness
+@app.get("/health")
+def health_check():
+    return {"status": "healthy"}
+
+
+readiness = Readiness(db_router.ping, settings.ready_db_check_seconds, settings.ready_db_timeout_seconds)
+
+
+def warmup_steps():
+    """What the first requests would otherwise pay for, in order (see warmup.py)"""
+    return [
+        ("database", lambda: db_router.warm_up(settings.warmup_db_connections)),
+        ("tools", mcp_server_instance.warm_up),
+        ("agent rules", warm_up_rules),
+        ("chat statements", warm_up_chat_statements),
+        ("openapi", app.openapi),
+        ("frontend", preload_frontend),
+    ]
+
+
+@app.get("/ready")
+async def readiness_check():
+    """200 once warm-up has finished and the database answers, 503 until then"""
+    ready, details = await readiness.status()
+    return JSONResponse(details, status_code=200 if ready else 503)
+
+
+# Serve frontend files; after the endpoints above, which the catch-all page route would shadow
 frontend_dir = "/app/frontend/out"  # Absolute path in Docker container
 
 logging.info(f"Looking for frontend files at: {frontend_dir}")
 logging.info(f"Frontend dir exists: {os.path.exists(frontend_dir)}")
 
+# HTML pages are read once and then served from memory; warm-up preloads them
+frontend_pages: Dict[str, str] = {}
+
+
+def read_frontend_page(path: str) -> Optional[str]:
+    path = os.path.realpath(path)
+    content = frontend_pages.get(path)
+    if content is None and os.path.isfile(path):
+        with open(path, "r") as f:
+            content = f.read()
+        frontend_pages[path] = content
+    return content
+
+
+def preload_frontend():
+    for directory, _, files in os.walk(frontend_dir):
+        for name in files:
+            if name.endswith(".html"):
+                read_frontend_page(os.path.join(directory, name))
+
+
 if os.path.exists(frontend_dir):
     app.mount("/static", StaticFiles(directory=os.path.join(frontend_dir, "_next", "static")), name="static")
 
     @app.get("/", response_class=HTMLResponse)
     async def serve_frontend(request: Request):
-        frontend_file = os.path.join(frontend_dir, "index.html")
-        logging.info(f"Serving index.html from: {frontend_file}")
-        logging.info(f"Index file exists: {os.path.exists(frontend_file)}")
-        if os.path.exists(frontend_file):
-            with open(frontend_file, "r") as f:
-                content = f.read()
+        content = read_frontend_page(os.path.join(frontend_dir, "index.html"))
+        if content is not None:
             return HTMLResponse(content=content)
         else:
             return {"message": "Welcome to Todo AI Chatbot API - Frontend index.html not found"}
@@ -80,17 +272,13 @@ if os.path.exists(frontend_dir):
         # If the requested file exists and is not a directory, serve it
         if os.path.exists(requested_file) and not os.path.isdir(requested_file):
             if requested_file.endswith('.html'):
-                with open(requested_file, "r") as f:
-                    content = f.read()
-                return HTMLResponse(content=content)
+                return HTMLResponse(content=read_frontend_page(requested_file))
             elif requested_file.endswith(('.js', '.css', '.json', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico')):
                 return FileResponse(requested_file)
 
         # For SPA, serve index.html for all other routes
-        index_file = os.path.join(frontend_dir, "index.html")
-        if os.path.exists(index_file):
-            with open(index_file, "r") as f:
-                content = f.read()
+        content = read_frontend_page(os.path.join(frontend_dir, "index.html"))
+        if content is not None:
             return HTMLResponse(content=content)
         else:
             return {"message": "Welcome to Todo AI Chatbot API - Frontend index.html not found"}
@@ -99,11 +287,6 @@ else:
     def read_root():
         return {"message": "Welcome to Todo AI Chatbot API - Frontend directory not found"}
 
-# Health check endpoint
-@app.get("/health")
-def health_check():
-    return {"status": "healthy"}
-
 # This is the important part - make sure the app runs on the correct port
 if __name__ == "__main__":
     import uvicorn
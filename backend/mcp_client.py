@@ -0,0 +1,239 @@
+"""
+Client for a remote MCP server
+
+When the tools run in a separate service (MCP_TRANSPORT=websocket, with
+MCP_SERVER_HOST/MCP_SERVER_PORT pointing at it, as for the mcp-server
+container in docker-compose), the agent's tool calls go to its /ws endpoint
+over a small pool of persistent WebSocket connections (MCP_POOL_SIZE). Each connection carries any number of concurrent calls,
+matched to their responses by request id; a call goes to the open
+connection with the fewest calls waiting.
+
+Each connection is kept open by its own task, which reconnects with
+exponential backoff and jitter (MCP_RECONNECT_MIN_SECONDS doubling up to
+MCP_RECONNECT_MAX_SECONDS). Calls waiting on a connection that drops fail
+at once; calls are never retried, since a mutating tool may already have
+run.
+
+A slow or unreachable server must not pile up chat turns: each call gives
+up after MCP_CALL_TIMEOUT_SECONDS, and after MCP_BREAKER_FAILURES timeouts
+or connection failures in a row the circuit opens and calls fail
+immediately for MCP_BREAKER_RESET_SECONDS. Then one trial call goes
+through; it closes the circuit if it succeeds and re-opens it if not.
+Tool errors are answers, not failures, and do not count.
+
+Calls carry the current traceparent, so the server's spans join the
+caller's trace.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import websockets
+
+from tracing import current_traceparent
+
+
+logger = logging.getLogger(__name__)
+
+
+class MCPUnavailable(Exception):
+    """The call did not get an answer: timeout, lost connection or open circuit"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single trial call when half open"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at < self.reset_seconds:
+            return "open"
+        return "half-open"
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead; in half-open state only the first caller gets through"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open" or self._trial_running:
+            return False
+        self._trial_running = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_running or self.failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+        self._trial_running = False
+
+    def release(self):
+        """A call ended with neither outcome (e.g. cancelled); let the next one be the trial"""
+        self._trial_running = False
+
+
+class _Connection:
+    """One pooled WebSocket, kept open by run()"""
+
+    def __init__(self, pool: "MCPClientPool"):
+        self.pool = pool
+        self.websocket = None
+        self.pending: Dict[int, asyncio.Future] = {}
+
+    async def run(self):
+        delay = self.pool.reconnect_min_seconds
+        while True:
+            answered = False
+            try:
+                self.websocket = await websockets.connect(self.pool.url, open_timeout=self.pool.call_timeout_seconds)
+            except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+                logger.warning(f"MCP server connection to {self.pool.url} failed: {str(e)}")
+            else:
+                self.pool._connections_changed()
+                try:
+                    async for message in self.websocket:
+                        response = json.loads(message)
+                        future = self.pending.pop(response.get("id"), None)
+                        if future is not None and not future.done():
+                            future.set_result(response)
+                        answered = True
+                except websockets.ConnectionClosed:
+                    pass
+                finally:
+                    websocket, self.websocket = self.websocket, None
+                    self.pool._connections_changed()
+                    self._fail_pending()
+                    await websocket.close()
+                logger.warning(f"MCP server connection to {self.pool.url} closed")
+
+            # A connection that answered something was healthy; start backing off afresh
+            if answered:
+                delay = self.pool.reconnect_min_seconds
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, self.pool.reconnect_max_seconds)
+
+    async def call(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request["id"]] = future
+        try:
+            await self.websocket.send(json.dumps(request))
+            return await future
+        except websockets.ConnectionClosed as e:
+            raise ConnectionError(f"MCP server connection closed: {str(e)}")
+        finally:
+            self.pending.pop(request["id"], None)
+
+    def _fail_pending(self):
+        pending, self.pending = self.pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("MCP server connection lost"))
+
+
+class MCPClientPool:
+    """Pooled, multiplexed WebSocket client for the MCP server's /ws endpoint"""
+
+    def __init__(self, url: str, size: int = 2, call_timeout_seconds: float = 10.0,
+                 reconnect_min_seconds: float = 0.1, reconnect_max_seconds: float = 10.0,
+                 breaker_failures: int = 5, breaker_reset_seconds: float = 30.0):
+        self.url = url
+        self.size = size
+        self.call_timeout_seconds = call_timeout_seconds
+        self.reconnect_min_seconds = reconnect_min_seconds
+        self.reconnect_max_seconds = reconnect_max_seconds
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset_seconds)
+        self._connections: List[_Connection] = []
+        self._tasks: List[asyncio.Task] = []
+        self._connected: Optional[asyncio.Event] = None
+        self._loop = None
+        self._ids = itertools.count(1)
+
+    @classmethod
+    def from_settings(cls, settings) -> "MCPClientPool":
+        return cls(
+            f"ws://{settings.mcp_server_host}:{settings.mcp_server_port}/ws",
+            size=settings.mcp_pool_size,
+            call_timeout_seconds=settings.mcp_call_timeout_seconds,
+            reconnect_min_seconds=settings.mcp_reconnect_min_seconds,
+            reconnect_max_seconds=settings.mcp_reconnect_max_seconds,
+            breaker_failures=settings.mcp_breaker_failures,
+            breaker_reset_seconds=settings.mcp_breaker_reset_seconds,
+        )
+
+    @property
+    def open_connections(self) -> int:
+        return sum(1 for connection in self._connections if connection.websocket is not None)
+
+    def start(self):
+        """Open the connections in the background; calls wait for the first one"""
+        if self._loop is asyncio.get_running_loop():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._connected = asyncio.Event()
+        self._connections = [_Connection(self) for _ in range(self.size)]
+        self._tasks = [asyncio.create_task(connection.run()) for connection in self._connections]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._connections, self._tasks, self._loop = [], [], None
+
+    async def call(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Send one request and wait for its response ({"id", "result", "error"});
+        raises MCPUnavailable when no answer comes
+        """
+        self.start()
+        if not self.breaker.allow():
+            raise MCPUnavailable("MCP server unavailable (circuit open)")
+
+        request = {"id": next(self._ids), "method": method, "params": params}
+        traceparent = current_traceparent()
+        if traceparent:
+            request["traceparent"] = traceparent
+        try:
+            response = await asyncio.wait_for(self._send(request), self.call_timeout_seconds)
+        except asyncio.TimeoutError:
+            self.breaker.record_failure()
+            raise MCPUnavailable(f"MCP server did not answer {method} within {self.call_timeout_seconds}s")
+        except ConnectionError as e:
+            self.breaker.record_failure()
+            raise MCPUnavailable(str(e))
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+        return response
+
+    async def _send(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        while True:
+            open_connections = [c for c in self._connections if c.websocket is not None]
+            if open_connections:
+                connection = min(open_connections, key=lambda c: len(c.pending))
+                return await connection.call(request)
+            await self._connected.wait()
+
+    def _connections_changed(self):
+        if self.open_connections:
+            self._connected.set()
+        else:
+            self._connected.clear()
@@ -5,17 +5,31 @@ Implements the Model Context Protocol to expose todo management tools to AI agen
 """
 
 import asyncio
+import functools
 import json
 import logging
 import sys
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from sqlalchemy import and_, case, func, update
 from sqlmodel import Session, select
-from models import Task, engine
+from models import Task, db_router, settings
+from agent_cache import task_versions
+from task_sync import bump_seq, next_seq
+from task_stats import task_stats
+from reminders import reminder_scheduler
+from events import configure_task_events, task_events
+from idempotency import IdempotencyConflict, idempotency_store
+from profiling import to_thread
+from tracing import configure_tracing, span, start_trace
+from slow_queries import query_origin
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, time, timezone
+
+# Tries of a task change that loses a race with another change of the same task
+TASK_CHANGE_ATTEMPTS = 3
 
 
 # Define the tool schemas
@@ -27,59 +41,145 @@ class ToolResult(BaseModel):
 
 
 class AddTaskParams(BaseModel):
-    user_id: str  # Changed back to str to match DB column type
+    user_id: int
     title: str
     description: str = None
+    idempotency_key: Optional[str] = None
 
 
 class ListTasksParams(BaseModel):
-    user_id: str  # Changed back to str to match DB column type
+    user_id: int
     status: str = "all"  # "all", "pending", "completed"
 
 
+class GetTaskStatsParams(BaseModel):
+    user_id: int
+
+
 class CompleteTaskParams(BaseModel):
-    user_id: str  # Changed back to str to match DB column type
+    user_id: int
     task_id: int
+    expected_version: Optional[int] = None  # fail with a conflict if the task has changed since
+    idempotency_key: Optional[str] = None
 
 
 class DeleteTaskParams(BaseModel):
-    user_id: str  # Changed back to str to match DB column type
+    user_id: int
     task_id: int
+    expected_version: Optional[int] = None
+    idempotency_key: Optional[str] = None
 
 
 class UpdateTaskParams(BaseModel):
-    user_id: str  # Changed back to str to match DB column type
+    user_id: int
     task_id: int
     title: str = None
     description: str = None
+    expected_version: Optional[int] = None
+    idempotency_key: Optional[str] = None
+
+
+class SetDueDateParams(BaseModel):
+    user_id: int
+    task_id: int
+    due_at: Optional[datetime] = None  # None clears the due date
+    expected_version: Optional[int] = None
+    idempotency_key: Optional[str] = None
+
+
+class SetReminderParams(BaseModel):
+    user_id: int
+    task_id: int
+    remind_at: Optional[datetime] = None  # None cancels the reminder
+    expected_version: Optional[int] = None
+    idempotency_key: Optional[str] = None
+
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Times are stored as naive UTC; aware values are converted, naive ones taken as UTC"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def current_task_state(user_id: int, task_id: int, expression):
+    """An expression over one of the user's live tasks, as a scalar subquery (NULL if there is no such task)"""
+    return select(expression).where(
+        Task.id == task_id, Task.user_id == user_id, Task.deleted == False
+    ).scalar_subquery()
+
+
+def blocking_tool(func):
+    """
+    Run a synchronous tool body in a worker thread, so database work does not
+    block the event loop and several tool calls can run concurrently
+    """
+    @functools.wraps(func)
+    async def wrapper(self, params):
+        with span(f"tool.{func.__name__}", user_id=params.user_id), query_origin(f"tool:{func.__name__}"):
+            return await run_tool(self, params)
+
+    async def run_tool(self, params):
+        key = getattr(params, "idempotency_key", None)
+        if not key:
+            return await to_thread(func, self, params)
+        # A retried mutation with the same key returns the first result
+        try:
+            return await idempotency_store.run(
+                f"tool:{func.__name__}",
+                params.user_id,
+                key,
+                params.model_dump(exclude={"idempotency_key"}),
+                lambda: to_thread(func, self, params),
+                should_store=lambda result: "error" not in result,
+            )
+        except IdempotencyConflict as e:
+            return {"error": str(e)}
+    return wrapper
 
 
 class MCPServer:
+    param_models = {
+        "add_task": AddTaskParams,
+        "list_tasks": ListTasksParams,
+        "get_task_stats": GetTaskStatsParams,
+        "complete_task": CompleteTaskParams,
+        "delete_task": DeleteTaskParams,
+        "update_task": UpdateTaskParams,
+        "set_due_date": SetDueDateParams,
+        "set_reminder": SetReminderParams,
+    }
+
     def __init__(self):
         self.tools = {
             "add_task": self.add_task,
             "list_tasks": self.list_tasks,
+            "get_task_stats": self.get_task_stats,
             "complete_task": self.complete_task,
             "delete_task": self.delete_task,
             "update_task": self.update_task,
+            "set_due_date": self.set_due_date,
+            "set_reminder": self.set_reminder,
         }
         self.logger = logging.getLogger(__name__)
+        self._tool_definitions: Optional[List[Dict[str, Any]]] = None
 
-    async def add_task(self, params: AddTaskParams) -> Dict[str, Any]:
+    @blocking_tool
+    def add_task(self, params: AddTaskParams) -> Dict[str, Any]:
         """Create a new task"""
         try:
-            with Session(engine) as session:
-                # Convert integer user_id to string for storage in DB column
-                user_id_str = str(params.user_id)
+            with Session(db_router.writer(params.user_id)) as session:
                 task = Task(
-                    user_id=user_id_str,  # Store as string to match DB schema
+                    user_id=params.user_id,
                     title=params.title,
                     description=params.description,
-                    completed=False
+                    completed=False,
+                    seq=next_seq(session, params.user_id, total=1)
                 )
                 session.add(task)
                 session.commit()
                 session.refresh(task)
+                self._task_changed(params.user_id, "add", task)
 
                 return {
                     "task_id": task.id,
@@ -90,114 +190,259 @@ class MCPServer:
             self.logger.error(f"Error adding task: {str(e)}")
             return {"error": str(e)}
 
-    async def list_tasks(self, params: ListTasksParams) -> List[Dict[str, Any]]:
+    @blocking_tool
+    def list_tasks(self, params: ListTasksParams) -> List[Dict[str, Any]]:
         """Retrieve tasks from the list"""
         try:
-            with Session(engine) as session:
-                # Convert integer user_id to string for comparison with DB column
-                user_id_str = str(params.user_id)
-                statement = select(Task).where(Task.user_id == user_id_str)
+            with Session(db_router.reader(params.user_id)) as session:
+                # Only the three columns the result needs, as plain rows rather than Task entities
+                statement = select(Task.id, Task.title, Task.completed).where(
+                    Task.user_id == params.user_id, Task.deleted == False
+                )
 
                 if params.status == "pending":
                     statement = statement.where(Task.completed == False)
                 elif params.status == "completed":
                     statement = statement.where(Task.completed == True)
 
-                tasks = session.exec(statement).all()
-
                 return [
-                    {
-                        "id": task.id,
-                        "title": task.title,
-                        "completed": task.completed
-                    }
-                    for task in tasks
+                    {"id": task_id, "title": title, "completed": completed}
+                    for task_id, title, completed in session.exec(statement)
                 ]
         except Exception as e:
             self.logger.error(f"Error listing tasks: {str(e)}")
             return {"error": str(e)}
 
-    async def complete_task(self, params: CompleteTaskParams) -> Dict[str, Any]:
-        """Mark a task as complete"""
+    @blocking_tool
+    def get_task_stats(self, params: GetTaskStatsParams) -> Dict[str, Any]:
+        """Count the user's tasks: total, pending, completed and completed today"""
         try:
-            with Session(engine) as session:
-                # Convert integer user_id to string for comparison with DB column
-                user_id_str = str(params.user_id)
-
-                task = session.get(Task, params.task_id)
-
-                if not task or str(task.user_id) != user_id_str:
-                    return {"error": f"Task {params.task_id} not found for user {params.user_id}"}
-
-                task.completed = True
-                session.add(task)
-                session.commit()
-                session.refresh(task)
+            with Session(db_router.reader(params.user_id)) as session:
+                return task_stats(session, params.user_id)
+        except Exception as e:
+            self.logger.error(f"Error reading task stats: {str(e)}")
+            return {"error": str(e)}
 
-                return {
-                    "task_id": task.id,
-                    "status": "completed",
-                    "title": task.title
-                }
+    @blocking_tool
+    def complete_task(self, params: CompleteTaskParams) -> Dict[str, Any]:
+        """Mark a task as complete"""
+        try:
+            # Completing a completed task again changes no counts
+            newly_completed = func.coalesce(current_task_state(
+                params.user_id, params.task_id, case((Task.completed == True, 0), else_=1)), 0)
+            changed = self._change_task(
+                params.user_id, params.task_id, params.expected_version,
+                {"completed": True, "completed_at": func.coalesce(Task.completed_at, datetime.utcnow()),
+                 "remind_at": None},
+                stats={"completed": newly_completed, "completed_today": newly_completed},
+            )
+            if isinstance(changed, dict):
+                return changed
+            _, task = changed
+            self._task_changed(params.user_id, "complete", task)
+            reminder_scheduler.schedule(task.id, params.user_id, None)
+
+            return {
+                "task_id": task.id,
+                "status": "completed",
+                "title": task.title,
+                "version": task.version
+            }
         except Exception as e:
             self.logger.error(f"Error completing task: {str(e)}")
             return {"error": str(e)}
 
-    async def delete_task(self, params: DeleteTaskParams) -> Dict[str, Any]:
+    @blocking_tool
+    def delete_task(self, params: DeleteTaskParams) -> Dict[str, Any]:
         """Remove a task from the list"""
         try:
-            with Session(engine) as session:
-                # Convert integer user_id to string for comparison with DB column
-                user_id_str = str(params.user_id)
-
-                task = session.get(Task, params.task_id)
-
-                if not task or str(task.user_id) != user_id_str:
-                    return {"error": f"Task {params.task_id} not found for user {params.user_id}"}
-
-                session.delete(task)
-                session.commit()
-
-                return {
-                    "task_id": params.task_id,
-                    "status": "deleted",
-                    "title": task.title
-                }
+            start_of_today = datetime.combine(datetime.utcnow().date(), time.min)
+            was_completed = func.coalesce(current_task_state(
+                params.user_id, params.task_id, case((Task.completed == True, 1), else_=0)), 0)
+            was_completed_today = func.coalesce(current_task_state(
+                params.user_id, params.task_id,
+                case((and_(Task.completed == True, Task.completed_at >= start_of_today), 1), else_=0)), 0)
+            # Keep a tombstone so delta sync can report the delete
+            changed = self._change_task(
+                params.user_id, params.task_id, params.expected_version,
+                {"deleted": True, "title": "", "description": None, "due_at": None, "remind_at": None},
+                stats={"total": -1, "completed": -was_completed, "completed_today": -was_completed_today},
+            )
+            if isinstance(changed, dict):
+                return changed
+            before, task = changed
+            self._task_changed(params.user_id, "delete", task)
+            reminder_scheduler.schedule(task.id, params.user_id, None)
+
+            return {
+                "task_id": params.task_id,
+                "status": "deleted",
+                "title": before.title,
+                "version": task.version
+            }
         except Exception as e:
             self.logger.error(f"Error deleting task: {str(e)}")
             return {"error": str(e)}
 
-    async def update_task(self, params: UpdateTaskParams) -> Dict[str, Any]:
+    @blocking_tool
+    def update_task(self, params: UpdateTaskParams) -> Dict[str, Any]:
         """Modify task title or description"""
         try:
-            with Session(engine) as session:
-                # Convert integer user_id to string for comparison with DB column
-                user_id_str = str(params.user_id)
-
-                task = session.get(Task, params.task_id)
-
-                if not task or str(task.user_id) != user_id_str:
-                    return {"error": f"Task {params.task_id} not found for user {params.user_id}"}
-
-                if params.title is not None:
-                    task.title = params.title
-                if params.description is not None:
-                    task.description = params.description
+            values = {}
+            if params.title is not None:
+                values["title"] = params.title
+            if params.description is not None:
+                values["description"] = params.description
+
+            changed = self._change_task(params.user_id, params.task_id, params.expected_version, values)
+            if isinstance(changed, dict):
+                return changed
+            _, task = changed
+            self._task_changed(params.user_id, "update", task)
+
+            return {
+                "task_id": task.id,
+                "status": "updated",
+                "title": task.title,
+                "version": task.version
+            }
+        except Exception as e:
+            self.logger.error(f"Error updating task: {str(e)}")
+            return {"error": str(e)}
 
-                task.updated_at = datetime.utcnow()
-                session.add(task)
-                session.commit()
-                session.refresh(task)
+    @blocking_tool
+    def set_due_date(self, params: SetDueDateParams) -> Dict[str, Any]:
+        """Set a task's due date (ISO 8601 date-time, UTC unless it has an offset), or clear it with null"""
+        try:
+            return self._set_task_time(params.user_id, params.task_id, params.expected_version, "due_at",
+                                       as_utc(params.due_at))
+        except Exception as e:
+            self.logger.error(f"Error setting due date: {str(e)}")
+            return {"error": str(e)}
 
-                return {
-                    "task_id": task.id,
-                    "status": "updated",
-                    "title": task.title
-                }
+    @blocking_tool
+    def set_reminder(self, params: SetReminderParams) -> Dict[str, Any]:
+        """Remind the user about a task at a time (ISO 8601 date-time, UTC unless it has an offset), or cancel with null"""
+        try:
+            return self._set_task_time(params.user_id, params.task_id, params.expected_version, "remind_at",
+                                       as_utc(params.remind_at))
         except Exception as e:
-            self.logger.error(f"Error updating task: {str(e)}")
+            self.logger.error(f"Error setting reminder: {str(e)}")
             return {"error": str(e)}
 
+    def _set_task_time(self, user_id: int, task_id: int, expected_version: Optional[int], field: str,
+                       value: Optional[datetime]) -> Dict[str, Any]:
+        """Set due_at or remind_at, as a change of the task like any other"""
+        changed = self._change_task(user_id, task_id, expected_version, {field: value},
+                                    pending_only=field == "remind_at" and value is not None)
+        if isinstance(changed, dict):
+            return changed
+        _, task = changed
+        self._task_changed(user_id, "update", task)
+        if field == "remind_at":
+            reminder_scheduler.schedule(task.id, user_id, value)
+
+        return {
+            "task_id": task.id,
+            "status": "updated",
+            "title": task.title,
+            "version": task.version,
+            field: value.isoformat() if value else None
+        }
+
+    def _change_task(self, user_id: int, task_id: int, expected_version: Optional[int], values: Dict[str, Any],
+                     stats: Optional[Dict[str, Any]] = None, pending_only: bool = False):
+        """
+        Apply `values` to one of the user's live tasks with two statements and
+        a commit, and return the (before, after) rows or an error result.
+
+        The counter UPDATE comes first, in the lock order every writer
+        follows: it allocates the seq, applies the `stats` deltas (SQL
+        expressions over the task's current state) and returns the version,
+        completion and title it saw. The task UPDATE ... RETURNING then only
+        matches that version, so a change that committed in between (on
+        PostgreSQL, while this one waited for the counter lock) makes it
+        start over instead of being overwritten or counted twice.
+        """
+        live = and_(Task.id == task_id, Task.user_id == user_id, Task.deleted == False)
+        state = [current_task_state(user_id, task_id, column).label(column.key)
+                 for column in (Task.version, Task.completed, Task.title)]
+        for _ in range(TASK_CHANGE_ATTEMPTS):
+            with Session(db_router.writer(user_id)) as session:
+                before = bump_seq(session, user_id, **(stats or {}), returning=state)
+                if before is None or before.version is None:
+                    return {"error": f"Task {task_id} not found for user {user_id}"}
+                if expected_version is not None and before.version != expected_version:
+                    return {
+                        "error": f"Task {task_id} has changed since version {expected_version}",
+                        "conflict": True,
+                        "task_id": task_id,
+                        "version": before.version
+                    }
+                if pending_only and before.completed:
+                    return {"error": f"Task {task_id} is already completed"}
+
+                after = session.execute(
+                    update(Task)
+                    .where(live, Task.version == before.version)
+                    .values(**values, seq=before.last_seq, version=Task.version + 1, updated_at=datetime.utcnow())
+                    .returning(Task.id, Task.seq, Task.version, Task.title, Task.completed)
+                    .execution_options(synchronize_session=False)
+                ).first()
+                if after is not None:
+                    session.commit()
+                    return before, after
+        return {"error": f"Task {task_id} is being changed concurrently; try again", "conflict": True,
+                "task_id": task_id}
+
+    def _task_changed(self, user_id, op: str, task):
+        """Invalidate cached turns and notify subscribers after a committed change"""
+        task_versions.bump(user_id)
+        event = {"op": op, "task_id": task.id, "seq": task.seq}
+        if op != "delete":
+            event["task"] = {"id": task.id, "title": task.title, "completed": task.completed}
+        task_events.publish(user_id, event)
+
+    def tool_definitions(self) -> List[Dict[str, Any]]:
+        """
+        Describe the tools in the OpenAI function-calling format.
+
+        user_id is left out of the schemas: the caller injects the
+        authenticated user, so a model can never act on another user's tasks.
+        idempotency_key is a transport concern and is left out as well.
+        Built on first use (about 4 ms of schema generation) and reused.
+        """
+        if self._tool_definitions is not None:
+            return self._tool_definitions
+        definitions = []
+        for name, param_model in self.param_models.items():
+            schema = param_model.model_json_schema()
+            schema.pop("title", None)
+            schema["properties"].pop("user_id", None)
+            schema["properties"].pop("idempotency_key", None)
+            schema["required"] = [field for field in schema.get("required", []) if field != "user_id"]
+            definitions.append({
+                "type": "function",
+                "function": {
+                    "name": name,
+                    "description": self.tools[name].__doc__,
+                    "parameters": schema,
+                },
+            })
+        self._tool_definitions = definitions
+        return definitions
+
+    def warm_up(self):
+        """
+        Build the tool schemas and run the read tools once (for a user with no
+        tasks), so the first turns find the schemas and compiled statements
+        ready; call from a worker thread
+        """
+        self.tool_definitions()
+        for status in ("all", "pending", "completed"):
+            MCPServer.list_tasks.__wrapped__(self, ListTasksParams(user_id=0, status=status))
+        MCPServer.get_task_stats.__wrapped__(self, GetTaskStatsParams(user_id=0))
+
     async def execute_tool(self, tool_name: str, params: Dict[str, Any]) -> ToolResult:
         """Execute a tool with the given parameters"""
         if tool_name not in self.tools:
@@ -208,13 +453,7 @@ class MCPServer:
             tool_func = self.tools[tool_name]
             
             # Create the appropriate parameter model
-            param_model = {
-                "add_task": AddTaskParams,
-                "list_tasks": ListTasksParams,
-                "complete_task": CompleteTaskParams,
-                "delete_task": DeleteTaskParams,
-                "update_task": UpdateTaskParams,
-            }.get(tool_name)
+            param_model = self.param_models.get(tool_name)
             
             if param_model:
                 validated_params = param_model(**params)
@@ -235,8 +474,14 @@ mcp_server = MCPServer()
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    events_backend = configure_task_events()
+    await events_backend.start()
+    trace_exporter = configure_tracing(settings, "todo-mcp-server")
+    trace_exporter.start()
     yield
     # Shutdown
+    await events_backend.stop()
+    trace_exporter.stop()
 
 
 app = FastAPI(
@@ -247,42 +492,81 @@ app = FastAPI(
 )
 
 
+async def handle_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Answer one {"id", "method", "params"} request with {"id", "result",
+    "error"}; shared by the WebSocket and stdio transports. An optional W3C
+    "traceparent" field puts the call's spans in the caller's trace.
+    """
+    # Validate request structure
+    if not isinstance(request, dict) or "method" not in request or "params" not in request:
+        return {
+            "id": request.get("id") if isinstance(request, dict) else None,
+            "result": None,
+            "error": {"message": "Invalid request format"}
+        }
+
+    method = request["method"]
+    params = request["params"]
+
+    # Execute the tool; a "traceparent" field joins the caller's trace
+    with start_trace(f"mcp {method}", request.get("traceparent"), method=method):
+        result = await mcp_server.execute_tool(method, params)
+
+    return {
+        "id": request.get("id"),
+        "result": result.output,
+        "error": {"message": str(result.output)} if result.is_error else None
+    }
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    """
+    One JSON request per frame (see handle_request). A connection's requests
+    run concurrently, up to MCP_MAX_IN_FLIGHT at a time, and each response is
+    sent when its tool finishes, so clients match responses to requests by id.
+    """
     await websocket.accept()
+    slots = asyncio.Semaphore(settings.mcp_max_in_flight)
+    send_lock = asyncio.Lock()
+    in_flight = set()
+
+    async def run(request):
+        try:
+            response = await handle_request(request)
+            async with send_lock:
+                await websocket.send_text(json.dumps(response))
+        except Exception as e:
+            logging.error(f"WebSocket error: {str(e)}")
+        finally:
+            slots.release()
+
     try:
         while True:
             # Receive tool execution request
             data = await websocket.receive_text()
-            request = json.loads(data)
-            
-            # Validate request structure
-            if "method" not in request or "params" not in request:
-                error_response = {
-                    "id": request.get("id"),
-                    "result": None,
-                    "error": {"message": "Invalid request format"}
-                }
-                await websocket.send_text(json.dumps(error_response))
+            try:
+                request = json.loads(data)
+            except ValueError:
+                async with send_lock:
+                    await websocket.send_text(json.dumps(
+                        {"id": None, "result": None, "error": {"message": "Invalid JSON"}}
+                    ))
                 continue
-                
-            method = request["method"]
-            params = request["params"]
-            
-            # Execute the tool
-            result = await mcp_server.execute_tool(method, params)
-            
-            # Send response
-            response = {
-                "id": request.get("id"),
-                "result": result.output,
-                "error": {"message": str(result.output)} if result.is_error else None
-            }
-            await websocket.send_text(json.dumps(response))
+            await slots.acquire()
+            task = asyncio.create_task(run(request))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
         logging.error(f"WebSocket error: {str(e)}")
-    finally:
         await websocket.close()
+    finally:
+        # Nobody is left to read the answers
+        for task in in_flight:
+            task.cancel()
 
 
 @app.get("/")
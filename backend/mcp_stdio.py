@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+MCP server over stdio
+
+For agents on the same host as the MCP server: the agent starts this
+script as a child process and talks to it over its stdin and stdout,
+with no TCP connection, HTTP upgrade or WebSocket framing in between.
+
+Framing is newline-delimited JSON: each request and each response is one
+JSON object on one line. JSON encoders escape newlines inside strings, so
+a line is always a complete message. Messages have the same shape as on
+the /ws endpoint (see mcp_server.handle_request): {"id", "method",
+"params", "traceparent"} in, {"id", "result", "error"} out.
+
+Requests are executed concurrently, up to MCP_MAX_IN_FLIGHT at a time
+(reading pauses beyond that), and each response is written as soon as its
+tool finishes, so responses can arrive out of order; clients match them
+to requests by id. A line that is not valid JSON, or is longer than
+MCP_STDIO_MAX_LINE_BYTES, is answered with an error whose id is null.
+
+Stdout carries only the protocol: anything else written to it (a stray
+print, a library's warning) would corrupt the stream, so on startup the
+real stdout is kept for responses and file descriptor 1 is pointed at
+stderr. Logs go to stderr.
+
+StdioMCPClient below starts the server and multiplexes calls over it.
+
+Usage: python mcp_stdio.py
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+from mcp_server import app, handle_request, lifespan
+from models import settings
+from tracing import current_traceparent
+
+
+logger = logging.getLogger(__name__)
+
+
+async def _read_line(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """The next line, None at end of input; raises ValueError for an oversized line after skipping it"""
+    try:
+        return await reader.readuntil(b"\n")
+    except asyncio.IncompleteReadError as e:
+        return e.partial or None  # a last line without a newline still counts
+    except asyncio.LimitOverrunError as e:
+        await reader.readexactly(e.consumed)
+        while True:
+            try:
+                await reader.readuntil(b"\n")
+                break
+            except asyncio.LimitOverrunError as e:
+                await reader.readexactly(e.consumed)
+            except asyncio.IncompleteReadError:
+                break
+        raise ValueError("Request line too long")
+
+
+async def serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, max_in_flight: int = None):
+    """Answer requests from `reader` on `writer` until end of input, then wait for the ones in flight"""
+    slots = asyncio.Semaphore(max_in_flight or settings.mcp_max_in_flight)
+    write_lock = asyncio.Lock()
+    in_flight = set()
+
+    async def respond(response: Dict[str, Any]):
+        async with write_lock:
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+
+    async def run(request):
+        try:
+            await respond(await handle_request(request))
+        except Exception as e:
+            logger.error(f"Error answering MCP request: {str(e)}")
+            await respond({"id": request.get("id"), "result": None, "error": {"message": str(e)}})
+        finally:
+            slots.release()
+
+    try:
+        while True:
+            try:
+                line = await _read_line(reader)
+            except ValueError as e:
+                await respond({"id": None, "result": None, "error": {"message": str(e)}})
+                continue
+            if line is None:
+                break
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError:
+                await respond({"id": None, "result": None, "error": {"message": "Invalid JSON"}})
+                continue
+            if not isinstance(request, dict):
+                await respond(await handle_request(request))
+                continue
+
+            await slots.acquire()
+            task = asyncio.create_task(run(request))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+
+class StdioMCPClient:
+    """
+    Runs the stdio server as a child process and multiplexes calls over its
+    pipes: any number of call()s can be in flight, each resolved by the
+    reader task when the response with its id arrives.
+    """
+
+    def __init__(self, command: Optional[List[str]] = None, env: Optional[Dict[str, str]] = None):
+        self.command = command or [sys.executable, os.path.abspath(__file__)]
+        self.env = env
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+
+    async def start(self):
+        self._process = await asyncio.create_subprocess_exec(
+            *self.command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            env=self.env,
+            limit=settings.mcp_stdio_max_line_bytes,
+        )
+        self._reader_task = asyncio.create_task(self._read_responses())
+
+    async def call(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Send one request and wait for its response ({"id", "result", "error"})"""
+        if self._process is None or self._reader_task.done():
+            raise ConnectionError("MCP stdio server is not running")
+        request_id = next(self._ids)
+        request = {"id": request_id, "method": method, "params": params}
+        traceparent = current_traceparent()
+        if traceparent:
+            request["traceparent"] = traceparent
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self._process.stdin.write(json.dumps(request).encode() + b"\n")
+            await self._process.stdin.drain()
+            return await future
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def close(self):
+        """Close the server's stdin; it finishes the requests in flight and exits"""
+        if self._process is None:
+            return
+        if not self._process.stdin.is_closing():
+            self._process.stdin.close()
+        await self._process.wait()
+        await self._reader_task
+        self._process = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _read_responses(self):
+        try:
+            while True:
+                line = await self._process.stdout.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self._pending.get(response.get("id"))
+                if future is not None and not future.done():
+                    future.set_result(response)
+                elif response.get("error"):
+                    logger.error(f"MCP stdio server error: {response['error']['message']}")
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("MCP stdio server exited"))
+
+
+async def main():
+    # Keep the real stdout for responses and send everything else written to fd 1 to stderr
+    protocol_out = os.fdopen(os.dup(sys.stdout.fileno()), "wb", buffering=0)
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=settings.mcp_stdio_max_line_bytes)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, protocol_out)
+    writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+
+    async with lifespan(app):
+        await serve(reader, writer)
+    writer.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,33 @@
+from alembic import op
+import sqlalchemy as sa
+from datetime import datetime
+
+# revision identifiers, used by Alembic.
+revision = '002_message_archive'
+down_revision = '001_initial'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Compressed blocks of archived conversation messages
+    op.create_table(
+        'messagearchive',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('conversation_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.String(), nullable=False),
+        sa.Column('first_message_id', sa.Integer(), nullable=False),
+        sa.Column('last_message_id', sa.Integer(), nullable=False),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+        sa.Column('codec', sa.String(), nullable=False),
+        sa.Column('raw_size', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False, default=datetime.utcnow),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_messagearchive_conversation_id', 'messagearchive', ['conversation_id'])
+
+
+def downgrade():
+    op.drop_index('ix_messagearchive_conversation_id', table_name='messagearchive')
+    op.drop_table('messagearchive')
@@ -0,0 +1,30 @@
+from alembic import op
+import sqlalchemy as sa
+from datetime import datetime
+
+# revision identifiers, used by Alembic.
+revision = '003_idempotency_keys'
+down_revision = '002_message_archive'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Results of requests made with an idempotency key
+    op.create_table(
+        'idempotencyrecord',
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('user_id', sa.String(), nullable=False),
+        sa.Column('fingerprint', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('response', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False, default=datetime.utcnow),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index('ix_idempotencyrecord_expires_at', 'idempotencyrecord', ['expires_at'])
+
+
+def downgrade():
+    op.drop_index('ix_idempotencyrecord_expires_at', table_name='idempotencyrecord')
+    op.drop_table('idempotencyrecord')
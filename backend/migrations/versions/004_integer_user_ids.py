@@ -0,0 +1,91 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004_integer_user_ids'
+down_revision = '003_idempotency_keys'
+branch_labels = None
+depends_on = None
+
+# Tables whose user_id goes from the stringified User.id to an integer foreign key
+TABLES = ['task', 'conversation', 'message', 'messagearchive']
+BATCH_SIZE = 10000
+
+
+def _backfill(table):
+    """Copy user_id into the new column in id-range batches, each committed on its own"""
+    bind = op.get_bind()
+    max_id = bind.execute(sa.text(f"SELECT MAX(id) FROM {table}")).scalar() or 0
+    with op.get_context().autocommit_block():
+        for low in range(0, max_id, BATCH_SIZE):
+            bind.execute(
+                sa.text(
+                    f"UPDATE {table} SET user_id_int = CAST(user_id AS INTEGER) "
+                    f"WHERE id > :low AND id <= :high AND user_id_int IS NULL"
+                ),
+                {"low": low, "high": low + BATCH_SIZE},
+            )
+
+
+def _swap_postgresql(table):
+    bind = op.get_bind()
+    # Build the index without blocking writes, before the swap
+    with op.get_context().autocommit_block():
+        op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{table}_user_id_int ON {table} (user_id_int)")
+
+    # The swap itself is one short transaction: catch up rows written during
+    # the backfill, then replace the column
+    op.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+    bind.execute(sa.text(f"UPDATE {table} SET user_id_int = CAST(user_id AS INTEGER) WHERE user_id_int IS NULL"))
+    op.drop_column(table, 'user_id')
+    op.alter_column(table, 'user_id_int', new_column_name='user_id', nullable=False)
+    op.execute(f"ALTER INDEX ix_{table}_user_id_int RENAME TO ix_{table}_user_id")
+    # NOT VALID skips the full-table check under the lock
+    op.execute(
+        f'ALTER TABLE {table} ADD CONSTRAINT fk_{table}_user_id FOREIGN KEY (user_id) '
+        f'REFERENCES "user" (id) NOT VALID'
+    )
+    # Committing the swap first releases its lock; VALIDATE then scans holding
+    # only SHARE UPDATE EXCLUSIVE, which lets reads and writes through
+    with op.get_context().autocommit_block():
+        op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT fk_{table}_user_id")
+
+
+def _swap_sqlite(table):
+    # SQLite cannot add constraints in place; batch mode rebuilds the table
+    op.execute(sa.text(f"UPDATE {table} SET user_id_int = CAST(user_id AS INTEGER) WHERE user_id_int IS NULL"))
+    with op.batch_alter_table(table, recreate='always') as batch_op:
+        batch_op.drop_column('user_id')
+        batch_op.alter_column('user_id_int', new_column_name='user_id', existing_type=sa.Integer(), nullable=False)
+    with op.batch_alter_table(table, recreate='always') as batch_op:
+        batch_op.create_foreign_key(f'fk_{table}_user_id', 'user', ['user_id'], ['id'])
+    op.create_index(f'ix_{table}_user_id', table, ['user_id'])
+
+
+def upgrade():
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    for table in TABLES:
+        op.add_column(table, sa.Column('user_id_int', sa.Integer(), nullable=True))
+        _backfill(table)
+        if postgresql:
+            _swap_postgresql(table)
+        else:
+            _swap_sqlite(table)
+
+    # Idempotency records are short-lived; convert in place
+    with op.batch_alter_table('idempotencyrecord') as batch_op:
+        batch_op.alter_column('user_id', existing_type=sa.String(), type_=sa.Integer(),
+                              postgresql_using='user_id::integer')
+
+
+def downgrade():
+    with op.batch_alter_table('idempotencyrecord') as batch_op:
+        batch_op.alter_column('user_id', existing_type=sa.Integer(), type_=sa.String(),
+                              postgresql_using='user_id::varchar')
+
+    for table in reversed(TABLES):
+        op.drop_index(f'ix_{table}_user_id', table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_constraint(f'fk_{table}_user_id', type_='foreignkey')
+            batch_op.alter_column('user_id', existing_type=sa.Integer(), type_=sa.String(),
+                                  postgresql_using='user_id::varchar')
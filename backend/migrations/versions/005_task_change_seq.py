@@ -0,0 +1,52 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005_task_change_seq'
+down_revision = '004_integer_user_ids'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('task', sa.Column('seq', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('task', sa.Column('deleted', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+    # Number existing tasks per user in id order, so their seqs are unique
+    op.execute(
+        "UPDATE task SET seq = numbered.rn FROM "
+        "(SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id) AS rn FROM task) AS numbered "
+        "WHERE task.id = numbered.id"
+    )
+
+    # Per-user change counter, starting after the backfilled seqs
+    op.create_table(
+        'tasksequence',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('last_seq', sa.Integer(), nullable=False),
+        sa.Column('compacted_seq', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+    op.execute(
+        "INSERT INTO tasksequence (user_id, last_seq, compacted_seq) "
+        "SELECT user_id, MAX(seq), 0 FROM task GROUP BY user_id"
+    )
+
+    # (user_id, seq) leads with user_id, so it replaces the plain user_id index
+    op.create_index('ix_task_user_id_seq', 'task', ['user_id', 'seq'], unique=True)
+    op.drop_index('ix_task_user_id', table_name='task')
+    op.create_index('ix_task_tombstones', 'task', ['updated_at'],
+                    sqlite_where=sa.text('deleted'), postgresql_where=sa.text('deleted'))
+
+
+def downgrade():
+    # Tombstones have no meaning without delta sync
+    op.execute("DELETE FROM task WHERE deleted")
+    op.drop_index('ix_task_tombstones', table_name='task')
+    op.create_index('ix_task_user_id', 'task', ['user_id'])
+    op.drop_index('ix_task_user_id_seq', table_name='task')
+    op.drop_table('tasksequence')
+    with op.batch_alter_table('task') as batch_op:
+        batch_op.drop_column('deleted')
+        batch_op.drop_column('seq')
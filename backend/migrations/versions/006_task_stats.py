@@ -0,0 +1,37 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006_task_stats'
+down_revision = '005_task_change_seq'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('task', sa.Column('completed_at', sa.DateTime(), nullable=True))
+    # The completion time was not recorded before; the last update is the best guess
+    op.execute("UPDATE task SET completed_at = updated_at WHERE completed")
+
+    op.add_column('tasksequence', sa.Column('total', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('tasksequence', sa.Column('completed', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('tasksequence', sa.Column('completed_today', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('tasksequence', sa.Column('completed_day', sa.Date(), nullable=True))
+
+    # completed_today starts at 0; the reconciliation pass fills it in
+    op.execute(
+        "UPDATE tasksequence SET "
+        "total = (SELECT COUNT(*) FROM task WHERE task.user_id = tasksequence.user_id AND NOT task.deleted), "
+        "completed = (SELECT COUNT(*) FROM task WHERE task.user_id = tasksequence.user_id "
+        "AND NOT task.deleted AND task.completed)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('tasksequence') as batch_op:
+        batch_op.drop_column('completed_day')
+        batch_op.drop_column('completed_today')
+        batch_op.drop_column('completed')
+        batch_op.drop_column('total')
+    with op.batch_alter_table('task') as batch_op:
+        batch_op.drop_column('completed_at')
@@ -0,0 +1,26 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007_task_reminders'
+down_revision = '006_task_stats'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('task', sa.Column('due_at', sa.DateTime(), nullable=True))
+    op.add_column('task', sa.Column('remind_at', sa.DateTime(), nullable=True))
+    # Only pending reminders are indexed, so the index stays as small as the backlog
+    op.create_index(
+        'ix_task_remind_at', 'task', ['remind_at'],
+        sqlite_where=sa.text('remind_at IS NOT NULL'),
+        postgresql_where=sa.text('remind_at IS NOT NULL'),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_task_remind_at', table_name='task')
+    with op.batch_alter_table('task') as batch_op:
+        batch_op.drop_column('remind_at')
+        batch_op.drop_column('due_at')
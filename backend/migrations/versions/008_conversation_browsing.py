@@ -0,0 +1,39 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008_conversation_browsing'
+down_revision = '007_task_reminders'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('conversation', sa.Column('message_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('conversation', sa.Column('last_message_preview', sa.String(), nullable=True))
+
+    # Counts include archived messages; the preview and activity time come from the newest hot message
+    op.execute(
+        "UPDATE conversation SET "
+        "message_count = (SELECT COUNT(*) FROM message WHERE message.conversation_id = conversation.id) "
+        "+ COALESCE((SELECT SUM(message_count) FROM messagearchive "
+        "WHERE messagearchive.conversation_id = conversation.id), 0), "
+        "last_message_preview = (SELECT SUBSTR(content, 1, 120) FROM message "
+        "WHERE message.conversation_id = conversation.id ORDER BY created_at DESC, id DESC LIMIT 1), "
+        "updated_at = COALESCE((SELECT MAX(created_at) FROM message "
+        "WHERE message.conversation_id = conversation.id), updated_at)"
+    )
+
+    # (user_id, updated_at, id) leads with user_id, so it replaces the plain user_id index
+    op.create_index('ix_conversation_user_id_updated_at', 'conversation', ['user_id', 'updated_at', 'id'])
+    op.drop_index('ix_conversation_user_id', table_name='conversation')
+    op.create_index('ix_message_conversation_id_created_at', 'message', ['conversation_id', 'created_at', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_message_conversation_id_created_at', table_name='message')
+    op.create_index('ix_conversation_user_id', 'conversation', ['user_id'])
+    op.drop_index('ix_conversation_user_id_updated_at', table_name='conversation')
+    with op.batch_alter_table('conversation') as batch_op:
+        batch_op.drop_column('last_message_preview')
+        batch_op.drop_column('message_count')
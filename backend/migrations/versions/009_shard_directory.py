@@ -0,0 +1,25 @@
+from alembic import op
+import sqlalchemy as sa
+from datetime import datetime
+
+# revision identifiers, used by Alembic.
+revision = '009_shard_directory'
+down_revision = '008_conversation_browsing'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Users who do not live on their hash-ring shard; only read on shard 0
+    op.create_table(
+        'shardassignment',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('shard', sa.Integer(), nullable=False),
+        sa.Column('moving_to', sa.Integer(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, default=datetime.utcnow),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('shardassignment')
@@ -0,0 +1,18 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '010_task_version'
+down_revision = '009_shard_directory'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Optimistic concurrency for the task tools; existing tasks start at version 0
+    op.add_column('task', sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('task') as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,35 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '011_bigint_row_ids'
+down_revision = '010_task_version'
+branch_labels = None
+depends_on = None
+
+# Shard N allocates ids from N << 40 (database.reserve_id_range), past int4
+ID_COLUMNS = {
+    'task': ['id'],
+    'conversation': ['id'],
+    'message': ['id', 'conversation_id'],
+    'messagearchive': ['id', 'conversation_id', 'first_message_id', 'last_message_id'],
+}
+
+
+def upgrade():
+    # SQLite's INTEGER is already 64-bit
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table, columns in ID_COLUMNS.items():
+        for column in columns:
+            op.alter_column(table, column, existing_type=sa.Integer(), type_=sa.BigInteger())
+        op.execute(f"ALTER SEQUENCE {table}_id_seq AS BIGINT")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table, columns in ID_COLUMNS.items():
+        op.execute(f"ALTER SEQUENCE {table}_id_seq AS INTEGER")
+        for column in columns:
+            op.alter_column(table, column, existing_type=sa.BigInteger(), type_=sa.Integer())
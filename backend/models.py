@@ -1,51 +1,308 @@
 from sqlmodel import SQLModel, Field, create_engine
-from datetime import datetime
+from sqlalchemy import BigInteger, Index, Integer, text
+from datetime import date, datetime
 from typing import Optional
 import os
 from pydantic_settings import BaseSettings
+from database import EngineRouter, ShardRouter, create_sqlite_engine, create_sqlite_engines
+from tracing import instrument_engine
+from slow_queries import slow_query_log
 
 
 class Settings(BaseSettings):
     database_url: str = os.getenv("DATABASE_URL", "sqlite:///./todo_chatbot.db")
+    sql_echo: bool = False  # log every statement (SQLAlchemy echo)
+
+    # SQLite performance profile (single-node deployments)
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size: int = -64000  # negative values are KiB
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_temp_store: str = "MEMORY"
+    sqlite_read_pool_size: int = 5
+
+    # Read replicas (comma separated URLs); empty means primary only
+    database_replica_urls: str = ""
+    replica_read_your_writes_seconds: float = 2.0
+    replica_health_check_seconds: float = 5.0
+
+    # Sharding by user: more databases (comma separated URLs) beside DATABASE_URL, which is shard 0
+    database_shard_urls: str = ""
+    shard_directory_seconds: float = 2.0  # how stale a process's copy of the shard directory may be
+    shard_move_drain_seconds: float = 1.0  # lets in-flight writes finish before a moving user is copied
+
+    # Cold-storage archive for old conversation messages
+    archive_interval_seconds: float = 0  # 0 disables the background pass
+    archive_after_days: Optional[int] = 30
+    archive_keep_last: Optional[int] = 200
+    archive_codec: str = "zlib"  # "zlib" or "zstd"
+    archive_batch_size: int = 500
+
+    # OpenAI-compatible model backend for the agent; keyword rules are used without a key
+    llm_api_key: str = os.getenv("OPENAI_API_KEY", "")
+    llm_base_url: str = "https://api.openai.com/v1"
+    llm_model: str = "gpt-4o-mini"
+    llm_timeout_seconds: float = 30.0
+    llm_connect_timeout_seconds: float = 5.0
+    llm_max_retries: int = 3
+    llm_max_concurrency: int = 16
+    llm_max_tool_rounds: int = 5
+    llm_task_token_budget: int = 2000
+    llm_history_token_budget: int = 4000
+
+    # Turn-level response cache for read-only agent turns
+    agent_cache_enabled: bool = True
+    agent_cache_max_entries: int = 10000
+    agent_cache_max_bytes: int = 16 * 1024 * 1024
+    agent_cache_ttl_seconds: float = 300.0
+
+    # WebSocket chat channel
+    ws_idle_timeout_seconds: float = 120.0
+    ws_stream_chunk_size: int = 64
+
+    # MCP server transports (/ws and mcp_stdio.py)
+    mcp_max_in_flight: int = 64  # requests executing at once per connection; reading pauses beyond this
+    mcp_stdio_max_line_bytes: int = 1024 * 1024
+
+    # Where the agent's tool calls run: "inprocess", or "websocket" for pooled
+    # connections to the MCP server at MCP_SERVER_HOST:MCP_SERVER_PORT (mcp_client.py)
+    mcp_transport: str = "inprocess"
+    mcp_server_host: str = "localhost"
+    mcp_server_port: int = 3000
+    mcp_pool_size: int = 2
+    mcp_call_timeout_seconds: float = 10.0
+    mcp_reconnect_min_seconds: float = 0.1
+    mcp_reconnect_max_seconds: float = 10.0
+    mcp_breaker_failures: int = 5  # consecutive timeouts or connection failures that open the circuit
+    mcp_breaker_reset_seconds: float = 30.0  # how long an open circuit fails calls before a trial call
+
+    # Task change notifications: "local" for one worker, "postgres" for LISTEN/NOTIFY fan-out
+    task_events_backend: str = "local"
+    task_events_max_pending: int = 100
+
+    # Idempotency keys on chat turns and mutating tools
+    idempotency_ttl_seconds: float = 24 * 3600
+    idempotency_pending_timeout_seconds: float = 60.0
+    idempotency_purge_interval_seconds: float = 3600.0
+
+    # Delta sync: tombstones of deleted tasks are kept this long
+    tombstone_retention_days: int = 30
+    tombstone_compaction_interval_seconds: float = 3600.0
+    tombstone_compaction_batch_size: int = 1000
+    task_changes_page_size: int = 500
+
+    # Conversation browsing
+    conversations_page_size: int = 50
+    messages_page_size: int = 50
+    chat_history_max_messages: int = 200  # newest messages handed to the agent each turn
+
+    # Task stats are kept up to date by the tools; this pass recounts them to fix drift
+    stats_reconcile_interval_seconds: float = 86400.0  # 0 disables the background pass
+    stats_reconcile_batch_size: int = 500
+
+    # Reminder scheduler: reminders due within the window are held in memory and fired on time
+    reminder_window_seconds: float = 300.0  # 0 disables the scheduler
+    reminder_refresh_seconds: float = 30.0  # re-read the window to pick up other workers' reminders
+    reminder_max_loaded: int = 10000
+    reminder_batch_size: int = 500
+
+    # NDJSON export / bulk import
+    export_fetch_size: int = 1000
+    import_batch_size: int = 5000
+    import_max_line_bytes: int = 1024 * 1024
+
+    # Per-request profiling: requests sending X-Profile-Token: <token> are sampled
+    profiling_enabled: bool = False
+    profiling_token: str = ""
+    profiling_dir: str = "profiles"
+    profiling_interval_seconds: float = 0.005
+    profiling_max_bytes: int = 50 * 1024 * 1024  # oldest profiles are deleted beyond this
+
+    # Tracing: sampled requests are exported as OTLP/JSON lines to a local file
+    tracing_enabled: bool = False
+    tracing_sample_rate: float = 0.01  # for new traces; callers' traceparent decisions are kept
+    tracing_export_path: str = "traces.jsonl"
+    tracing_max_bytes: int = 100 * 1024 * 1024  # rotated to <path>.1 beyond this
+    tracing_flush_interval_seconds: float = 1.0
+
+    # Slow-query log: statements slower than this are logged and aggregated; negative disables
+    slow_query_threshold_ms: float = 200.0
+    slow_query_explain: bool = False  # capture the plan of each slow statement shape once
+    slow_query_max_fingerprints: int = 1000
+
+    # Startup warm-up; /ready reports not ready until it has finished (/health is liveness only)
+    warmup_enabled: bool = True
+    warmup_db_connections: int = 2  # per engine, opened before the first request
+    ready_db_check_seconds: float = 2.0  # /ready reuses a database check this recent
+    ready_db_timeout_seconds: float = 1.0
+
+    # Token for the admin endpoints (X-Admin-Token); empty disables them
+    admin_token: str = ""
 
 
 settings = Settings()
 
 # Use SQLite for local development, PostgreSQL for production
 if settings.database_url.startswith("sqlite"):
-    engine = create_engine(settings.database_url, echo=True)
+    # Reads use a pool, writes are funnelled through a single connection
+    engine, write_engine = create_sqlite_engines(settings.database_url, settings, echo=settings.sql_echo)
 else:
     # For PostgreSQL, use connect_args to handle SSL
-    engine = create_engine(settings.database_url, echo=True, connect_args={
+    engine = create_engine(settings.database_url, echo=settings.sql_echo, connect_args={
         "sslmode": "require"
     })
+    write_engine = engine
+
+
+def create_replica_engine(url: str):
+    if url.startswith("sqlite"):
+        return create_sqlite_engine(url, settings, echo=settings.sql_echo)
+    return create_engine(url, echo=settings.sql_echo, connect_args={"sslmode": "require"})
+
+
+def create_shard_router(url: str) -> EngineRouter:
+    if url.startswith("sqlite"):
+        reader, writer = create_sqlite_engines(url, settings, echo=settings.sql_echo)
+        return EngineRouter(reader, writer=writer)
+    return EngineRouter(create_replica_engine(url))
+
+
+# Route read-only work to replicas, writes (and read-your-writes) to the primary
+db_router = EngineRouter(
+    engine,
+    writer=write_engine,
+    replicas=[create_replica_engine(url.strip()) for url in settings.database_replica_urls.split(",") if url.strip()],
+    read_your_writes_seconds=settings.replica_read_your_writes_seconds,
+)
+shard_urls = [url.strip() for url in settings.database_shard_urls.split(",") if url.strip()]
+if shard_urls:
+    # Each user's data on one shard; the primary above is shard 0
+    db_router = ShardRouter(
+        [db_router, *(create_shard_router(url) for url in shard_urls)],
+        directory_seconds=settings.shard_directory_seconds,
+    )
+
+
+if settings.tracing_enabled:
+    for traced_engine in db_router.engines():
+        instrument_engine(traced_engine)
+
+slow_query_log.configure(settings.slow_query_threshold_ms, settings.slow_query_explain,
+                         settings.slow_query_max_fingerprints)
+if slow_query_log.enabled:
+    for timed_engine in db_router.engines():
+        slow_query_log.instrument(timed_engine)
 
 
 # Import User model from auth module
 from auth import User
 
+# Row ids of the per-user tables: 64-bit, since shard N allocates from N << SHARD_ID_BITS
+# (database.reserve_id_range). SQLite's INTEGER already is, and only INTEGER PRIMARY KEY
+# can be AUTOINCREMENT there.
+RowId = BigInteger().with_variant(Integer(), "sqlite")
+
 
 class Task(SQLModel, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: str  # String to match database schema
+    __table_args__ = (
+        # Delta sync range scans; also serves every per-user lookup
+        Index("ix_task_user_id_seq", "user_id", "seq", unique=True),
+        # Only tombstones, for compaction
+        Index("ix_task_tombstones", "updated_at", sqlite_where=text("deleted"), postgresql_where=text("deleted")),
+        # Only pending reminders, for the scheduler's window loads
+        Index("ix_task_remind_at", "remind_at",
+              sqlite_where=text("remind_at IS NOT NULL"), postgresql_where=text("remind_at IS NOT NULL")),
+        # Ids from a counter that a shard can start at its own range (see database.reserve_id_range)
+        {"sqlite_autoincrement": True},
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True, sa_type=RowId)
+    user_id: int = Field(foreign_key="user.id")
     title: str
     description: Optional[str] = None
     completed: bool = False
+    completed_at: Optional[datetime] = None
+    due_at: Optional[datetime] = None
+    remind_at: Optional[datetime] = None  # pending reminder; cleared once it fires
+    seq: int = 0  # position in the user's change sequence
+    deleted: bool = False  # tombstone, kept for delta sync until compacted
+    version: int = 0  # bumped by every tool change, for optimistic concurrency
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class TaskSequence(SQLModel, table=True):
+    """Per-user task change counter and task statistics, updated together"""
+    user_id: int = Field(primary_key=True, foreign_key="user.id")
+    last_seq: int = 0
+    compacted_seq: int = 0  # tombstones up to this seq have been deleted
+    total: int = 0  # live (not deleted) tasks
+    completed: int = 0
+    completed_today: int = 0  # tasks completed on completed_day (UTC)
+    completed_day: Optional[date] = None
+
+
 class Conversation(SQLModel, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: str  # String to match database schema
+    __table_args__ = (
+        # Keyset pagination of a user's conversations, most recent first
+        Index("ix_conversation_user_id_updated_at", "user_id", "updated_at", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True, sa_type=RowId)
+    user_id: int = Field(foreign_key="user.id")
+    message_count: int = 0  # including archived messages
+    last_message_preview: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)  # time of the last message
 
 
 class Message(SQLModel, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: str  # String to match database schema
-    conversation_id: int
+    __table_args__ = (
+        # History reads and backwards paging within a conversation
+        Index("ix_message_conversation_id_created_at", "conversation_id", "created_at", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True, sa_type=RowId)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    conversation_id: int = Field(sa_type=RowId)
     role: str  # "user" or "assistant"
     content: str
-    created_at: datetime = Field(default_factory=datetime.utcnow)
\ No newline at end of file
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class MessageArchive(SQLModel, table=True):
+    """A compressed block of consecutive old messages from one conversation"""
+    __table_args__ = ({"sqlite_autoincrement": True},)
+
+    id: Optional[int] = Field(default=None, primary_key=True, sa_type=RowId)
+    conversation_id: int = Field(index=True, sa_type=RowId)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    first_message_id: int = Field(sa_type=RowId)
+    last_message_id: int = Field(sa_type=RowId)
+    message_count: int
+    codec: str  # "zlib" or "zstd"
+    raw_size: int
+    payload: bytes
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class IdempotencyRecord(SQLModel, table=True):
+    """Stored result of a request made with an idempotency key"""
+    key: str = Field(primary_key=True)  # "<scope>:<user_id>:<client key>"
+    user_id: int
+    fingerprint: str  # sha256 of the request, to reject a reused key
+    status: str  # "pending" or "done"
+    response: Optional[str] = None  # JSON result once done
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime = Field(index=True)
+
+
+class ShardAssignment(SQLModel, table=True):
+    """A user who does not live on their hash-ring shard (kept on shard 0)"""
+    user_id: int = Field(primary_key=True)
+    shard: int
+    moving_to: Optional[int] = None  # set while the user's data is copied to that shard
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,193 @@
+"""
+Opt-in profiling of single requests
+
+With PROFILING_ENABLED set, a request carrying the privileged
+X-Profile-Token header is profiled end to end by a sampling profiler.
+Every PROFILING_INTERVAL_SECONDS a sampler thread records the Python stack
+of the event loop thread (only while it is running one of the request's
+asyncio tasks, so concurrent requests don't leak into the profile) and of
+any worker thread the request has handed work to through to_thread() below,
+which is what the tool calls use. Stacks are written in the folded format
+("frame;frame;frame count") read by flamegraph.pl, speedscope and
+inferno, one file per request; the oldest files are deleted once the
+directory grows past PROFILING_MAX_BYTES. The response carries
+X-Profile-Id with the file name.
+
+Without the header a request costs one header scan, and to_thread() costs
+one context variable lookup; when profiling is disabled the middleware is
+not installed at all.
+"""
+
+import asyncio
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+import weakref
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TOKEN_HEADER = b"x-profile-token"
+PROFILE_ID_HEADER = b"x-profile-id"
+
+_current_capture: ContextVar[Optional["ProfileCapture"]] = ContextVar("profile_capture", default=None)
+
+
+async def to_thread(func, *args, **kwargs):
+    """asyncio.to_thread, with the worker thread's stack included in an active profile"""
+    capture = _current_capture.get()
+    if capture is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return await asyncio.to_thread(capture.run_claimed, func, *args, **kwargs)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def fold_stack(frame, root: str) -> str:
+    """One stack as a folded line prefix, outermost frame first"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(root)
+    return ";".join(reversed(labels))
+
+
+class ProfileCapture:
+    """Stack samples for one request"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float):
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+        self.interval = interval
+        self.tasks = weakref.WeakSet()
+        self.threads = set()
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+
+    def run_claimed(self, func, *args, **kwargs):
+        """Run func in the current (worker) thread, sampling it meanwhile"""
+        thread_id = threading.get_ident()
+        self.threads.add(thread_id)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.threads.discard(thread_id)
+
+    def sample(self):
+        frames = sys._current_frames()
+        task = asyncio.current_task(self.loop)
+        if task is not None and task in self.tasks:
+            frame = frames.get(self.loop_thread)
+            if frame is not None:
+                self.samples[fold_stack(frame, "event loop")] += 1
+        for thread_id in list(self.threads):
+            frame = frames.get(thread_id)
+            if frame is not None:
+                self.samples[fold_stack(frame, "worker thread")] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def _task_factory(loop, coro, context=None):
+    """Tasks created by a profiled request belong to its capture"""
+    task = asyncio.Task(coro, loop=loop, context=context)
+    capture = context.get(_current_capture) if context is not None else _current_capture.get()
+    if capture is not None:
+        capture.tasks.add(task)
+    return task
+
+
+def rotate_profiles(directory: str, max_bytes: int):
+    """Delete the oldest profiles until the directory fits in max_bytes (the newest is always kept)"""
+    paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".folded")]
+    paths.sort(key=os.path.getmtime)
+    total = sum(os.path.getsize(path) for path in paths)
+    while total > max_bytes and len(paths) > 1:
+        oldest = paths.pop(0)
+        total -= os.path.getsize(oldest)
+        os.remove(oldest)
+
+
+class ProfilerMiddleware:
+    """ASGI middleware that profiles requests carrying the profile token"""
+
+    def __init__(self, app, token: str, directory: str, interval: float = 0.005, max_bytes: int = 50 * 1024 * 1024):
+        self.app = app
+        self.token = token.encode()
+        self.directory = directory
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self._active = 0
+
+    def _requested(self, scope) -> bool:
+        if scope["type"] != "http" or not self.token:
+            return False
+        for name, value in scope["headers"]:
+            if name == PROFILE_TOKEN_HEADER:
+                return hmac.compare_digest(value, self.token)
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        loop = asyncio.get_running_loop()
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        capture = ProfileCapture(loop, self.interval)
+        capture.tasks.add(asyncio.current_task())
+        token = _current_capture.set(capture)
+        if self._active == 0 and loop.get_task_factory() is None:
+            loop.set_task_factory(_task_factory)
+        self._active += 1
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", [])) + [(PROFILE_ID_HEADER, profile_id.encode())]
+                message = dict(message, headers=headers)
+            await send(message)
+
+        capture.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            capture.stop()
+            self._active -= 1
+            if self._active == 0 and loop.get_task_factory() is _task_factory:
+                loop.set_task_factory(None)
+            _current_capture.reset(token)
+            try:
+                await asyncio.to_thread(self._write, profile_id, capture.folded())
+            except OSError as e:
+                logger.error(f"Could not write profile {profile_id}: {str(e)}")
+
+    def _write(self, profile_id: str, folded: str):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f"{profile_id}.folded"), "w") as f:
+            f.write(folded)
+        rotate_profiles(self.directory, self.max_bytes)
+        logger.info(f"Wrote request profile {profile_id}")
@@ -0,0 +1,135 @@
+"""
+Compact, token-efficient encoding of task lists and history for model context
+
+Tasks are rendered one per line as `id|done|title`, always sorted by id, so
+the same list always produces the same bytes and providers can reuse cached
+prompt prefixes. Each turn sends a stable base snapshot plus a small delta
+against it; the base is only re-rendered once the delta grows too large.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+TASKS_HEADER = "tasks id|done|title"
+DELTA_HEADER = "changes since list (+ added/changed, - removed)"
+
+_TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the token count without a tokenizer: one token per word or
+    punctuation mark, plus one per extra six characters of long words.
+    Meant for budgeting, not billing.
+    """
+    tokens = 0
+    for piece in _TOKEN_PIECES.findall(text):
+        tokens += 1 + (len(piece) - 1) // 6
+    return tokens
+
+
+def _escape(title: str) -> str:
+    if "|" not in title and "\\" not in title and "\n" not in title:
+        return title
+    return title.replace("\\", "\\\\").replace("|", "\\|").replace("\n", " ")
+
+
+def encode_task(task: Dict[str, Any]) -> str:
+    return f"{task['id']}|{1 if task.get('completed') else 0}|{_escape(task['title'])}"
+
+
+def _truncate(header: str, lines: List[str], budget: Optional[int]) -> str:
+    """Keep as many lines as fit the token budget, noting how many were left out"""
+    if budget is None:
+        return "\n".join([header] + lines)
+    kept = [header]
+    used = estimate_tokens(header)
+    for index, line in enumerate(lines):
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            kept.append(f"...{len(lines) - index} more not shown")
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept)
+
+
+def encode_tasks(tasks: Iterable[Dict[str, Any]], budget: Optional[int] = None) -> str:
+    """Render a task list in stable id order, truncated to `budget` tokens"""
+    lines = [encode_task(task) for task in sorted(tasks, key=lambda t: t["id"])]
+    return _truncate(TASKS_HEADER, lines, budget)
+
+
+def snapshot(tasks: Iterable[Dict[str, Any]]) -> Dict[int, str]:
+    """id -> encoded row, the form deltas are computed from"""
+    return {task["id"]: encode_task(task) for task in tasks}
+
+
+def encode_delta(previous: Dict[int, str], current: Dict[int, str], budget: Optional[int] = None) -> str:
+    """Render the rows that were added, changed or removed since `previous`"""
+    lines = []
+    for task_id in sorted(previous.keys() | current.keys()):
+        before = previous.get(task_id)
+        after = current.get(task_id)
+        if after is None:
+            lines.append(f"-{task_id}")
+        elif before != after:
+            lines.append(f"+{after}")
+    if not lines:
+        return ""
+    return _truncate(DELTA_HEADER, lines, budget)
+
+
+def trim_history(messages: List[Dict[str, Any]], budget: int) -> List[Dict[str, Any]]:
+    """Keep the most recent messages that fit the token budget (always the last one)"""
+    kept = []
+    used = 0
+    for message in reversed(messages):
+        cost = estimate_tokens(message.get("content") or "") + 4  # role and framing
+        if kept and used + cost > budget:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    return kept
+
+
+class TaskContext:
+    """
+    Per-user base snapshot of the task list that prompts are built on.
+
+    `render` returns (base, delta): the base text only changes when the delta
+    would cost more than half of it, so consecutive turns share a cacheable
+    prompt prefix.
+    """
+
+    def __init__(self, max_users: int = 10000, rebase_ratio: float = 0.5):
+        self.max_users = max_users
+        self.rebase_ratio = rebase_ratio
+        self._bases: "OrderedDict[str, Tuple[Dict[int, str], str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, user_id, tasks: List[Dict[str, Any]], budget: Optional[int] = None) -> Tuple[str, str]:
+        current = snapshot(tasks)
+        key = str(user_id)
+        with self._lock:
+            entry = self._bases.get(key)
+            if entry is not None:
+                self._bases.move_to_end(key)
+
+        if entry is not None:
+            base_rows, base_text = entry
+            delta = encode_delta(base_rows, current, budget)
+            if estimate_tokens(delta) <= estimate_tokens(base_text) * self.rebase_ratio:
+                return base_text, delta
+
+        base_text = encode_tasks(tasks, budget)
+        with self._lock:
+            self._bases[key] = (current, base_text)
+            self._bases.move_to_end(key)
+            while len(self._bases) > self.max_users:
+                self._bases.popitem(last=False)
+        return base_text, ""
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Task reminder scheduler
+
+A task's `remind_at` is its pending reminder. Pending reminders can number
+in the millions, nearly all of them far in the future, so the scheduler
+never scans them: it loads only those due within the next
+REMINDER_WINDOW_SECONDS (a range scan of the partial ix_task_remind_at
+index) into a heap ordered by time, and sleeps until the earliest one is
+due. The window is re-read every REMINDER_REFRESH_SECONDS, which both
+slides it forward and picks up reminders set by other workers; reminders
+set in this process inside the window are pushed onto the heap directly
+by the set_reminder tool.
+
+Firing a reminder clears `remind_at` with a conditional UPDATE ... RETURNING,
+so a reminder moved or removed since it was loaded is skipped, and of
+several workers only the one whose UPDATE wins delivers it. The change gets
+a sequence number like any other, and a {"op": "reminder"} task event goes
+to the user's subscribers. Nothing is kept across restarts: reminders that
+came due while the process was down are still set, so the first window
+load (which has no lower bound) fires them straight away.
+"""
+
+import asyncio
+import heapq
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from models import Task, TaskSequence, db_router, settings
+from events import task_events
+from task_sync import next_seqs
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReminderScheduler:
+    """Fires task reminders on time from a heap holding the current window"""
+
+    def __init__(self, window_seconds: float = 300.0, refresh_seconds: float = 30.0,
+                 max_loaded: int = 10000, batch_size: int = 500):
+        self.window = timedelta(seconds=window_seconds)
+        self.refresh_seconds = refresh_seconds
+        self.max_loaded = max_loaded
+        self.batch_size = batch_size
+        # (remind_at, task_id, user_id); entries whose time no longer matches
+        # `_loaded` were moved and are dropped when they reach the top
+        self._heap: List[Tuple[datetime, int, int]] = []
+        self._loaded: Dict[int, datetime] = {}
+        self.horizon: Optional[datetime] = None  # every reminder due before this is loaded
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def __len__(self) -> int:
+        return len(self._loaded)
+
+    def schedule(self, task_id: int, user_id: int, remind_at: Optional[datetime]):
+        """Note a reminder set (or cleared, with None) by this process; safe to call from any thread"""
+        with self._lock:
+            if remind_at is None or self.horizon is None or remind_at >= self.horizon:
+                # Outside the window: a later window load will find it
+                self._loaded.pop(task_id, None)
+                return
+            self._loaded[task_id] = remind_at
+            heapq.heappush(self._heap, (remind_at, task_id, user_id))
+            earliest = self._heap[0][1] == task_id
+        if earliest and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def load_window(self, now: datetime) -> int:
+        """Load the reminders due before now + window; returns how many were new"""
+        horizon = now + self.window
+        rows = []
+        for shard in db_router.shards:
+            with Session(shard.reader()) as session:
+                rows.extend(session.exec(
+                    select(Task.remind_at, Task.id, Task.user_id)
+                    .where(Task.remind_at != None, Task.remind_at < horizon)
+                    .order_by(Task.remind_at)
+                    .limit(self.max_loaded)
+                ).all())
+        if len(db_router.shards) > 1:
+            # Each shard's earliest, merged
+            rows = sorted(rows, key=lambda row: row[0])[:self.max_loaded]
+        if len(rows) == self.max_loaded:
+            # Too many to hold: shrink the window to what was loaded
+            horizon = rows[-1][0]
+
+        added = 0
+        with self._lock:
+            for remind_at, task_id, user_id in rows:
+                if self._loaded.get(task_id) != remind_at:
+                    self._loaded[task_id] = remind_at
+                    heapq.heappush(self._heap, (remind_at, task_id, user_id))
+                    added += 1
+            self.horizon = horizon
+        return added
+
+    def pop_due(self, now: datetime) -> List[Tuple[int, int]]:
+        """Take the (task_id, user_id) of every reminder due by now off the heap"""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                remind_at, task_id, user_id = heapq.heappop(self._heap)
+                if self._loaded.get(task_id) == remind_at:
+                    del self._loaded[task_id]
+                    due.append((task_id, user_id))
+        return due
+
+    def next_due(self) -> Optional[datetime]:
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def fire(self, due: List[Tuple[int, int]], now: datetime) -> int:
+        """Clear and deliver the due reminders, batch_size per transaction; returns how many fired"""
+        by_shard = defaultdict(list)
+        for task_id, user_id in due:
+            if db_router.moving(user_id):
+                # Cleared on the old shard it would fire again from the copy; a window load after the move finds it
+                continue
+            by_shard[db_router.shard_for(user_id)].append((task_id, user_id))
+        fired = 0
+        for index, shard_due in by_shard.items():
+            for start in range(0, len(shard_due), self.batch_size):
+                fired += self._fire_batch(db_router.shards[index], shard_due[start:start + self.batch_size], now)
+        return fired
+
+    def _fire_batch(self, shard, batch: List[Tuple[int, int]], now: datetime) -> int:
+        task_ids = [task_id for task_id, _ in batch]
+        user_ids = sorted({user_id for _, user_id in batch})
+        with Session(shard.writer()) as session:
+            # Lock the counters before the tasks, in the order the tools do
+            session.exec(
+                select(TaskSequence.user_id).where(TaskSequence.user_id.in_(user_ids)).with_for_update()
+            ).all()
+            rows = session.execute(
+                update(Task)
+                .where(Task.id.in_(task_ids), Task.remind_at <= now)
+                .values(remind_at=None, version=Task.version + 1, updated_at=now)
+                .returning(Task.id, Task.user_id, Task.title, Task.due_at, Task.completed, Task.deleted)
+                .execution_options(synchronize_session=False)
+            ).all()
+            if not rows:
+                return 0
+
+            by_user = defaultdict(list)
+            for row in rows:
+                by_user[row.user_id].append(row.id)
+            last_seqs = next_seqs(session, {user_id: len(ids) for user_id, ids in by_user.items()})
+            seqs = [
+                {"id": task_id, "seq": last_seqs[user_id] - len(ids) + n}
+                for user_id, ids in by_user.items()
+                for n, task_id in enumerate(ids, start=1)
+            ]
+            session.execute(update(Task), seqs)
+            session.commit()
+
+        for row in rows:
+            if row.completed or row.deleted:
+                continue
+            task_events.publish(row.user_id, {"op": "reminder", "task": {
+                "id": row.id,
+                "title": row.title,
+                "due_at": row.due_at.isoformat() if row.due_at else None,
+            }})
+        return len(rows)
+
+    async def run(self):
+        """Load windows and fire reminders until cancelled"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        next_refresh = 0.0
+        try:
+            while True:
+                try:
+                    now = datetime.utcnow()
+                    if time.monotonic() >= next_refresh or self.horizon is None or now >= self.horizon:
+                        await asyncio.to_thread(self.load_window, now)
+                        next_refresh = time.monotonic() + self.refresh_seconds
+
+                    due = self.pop_due(now)
+                    if due:
+                        await asyncio.to_thread(self.fire, due, now)
+                        continue
+
+                    # Sleep until the next reminder, the end of the window or the next refresh
+                    delay = min(next_refresh - time.monotonic(), (self.horizon - now).total_seconds())
+                    next_due = self.next_due()
+                    if next_due is not None:
+                        delay = min(delay, (next_due - now).total_seconds())
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=max(delay, 0))
+                    except asyncio.TimeoutError:
+                        pass
+                except Exception as e:
+                    logger.error(f"Reminder scheduler pass failed: {str(e)}")
+                    await asyncio.sleep(self.refresh_seconds)
+                    next_refresh = 0.0
+        finally:
+            # Stopped: forget the window, so schedule() leaves everything to the next run
+            self._loop = None
+            with self._lock:
+                self._heap.clear()
+                self._loaded.clear()
+                self.horizon = None
+
+
+reminder_scheduler = ReminderScheduler(
+    settings.reminder_window_seconds,
+    settings.reminder_refresh_seconds,
+    settings.reminder_max_loaded,
+    settings.reminder_batch_size,
+)
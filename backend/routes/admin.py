@@ -0,0 +1,45 @@
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from models import settings
+from sharding import ShardMoveError, move_user
+from slow_queries import slow_query_log
+
+router = APIRouter()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints need the configured ADMIN_TOKEN in X-Admin-Token"""
+    if not settings.admin_token or x_admin_token is None or not hmac.compare_digest(
+        x_admin_token.encode(), settings.admin_token.encode()
+    ):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@router.get("/admin/slow-queries", dependencies=[Depends(require_admin)])
+def slow_queries(
+    limit: int = Query(20, ge=1, le=1000),
+    order_by: str = Query("total_ms", pattern="^(total_ms|max_ms|count)$"),
+):
+    """The slowest statement fingerprints, with call counts, timings, origins and plans"""
+    return {
+        "threshold_ms": settings.slow_query_threshold_ms,
+        "queries": slow_query_log.top(limit, order_by),
+    }
+
+
+@router.delete("/admin/slow-queries", dependencies=[Depends(require_admin)])
+def reset_slow_queries():
+    """Start the aggregation over, e.g. after a fix is deployed"""
+    slow_query_log.reset()
+    return {"status": "reset"}
+
+
+@router.post("/admin/users/{user_id}/shard", dependencies=[Depends(require_admin)])
+def move_user_to_shard(user_id: int, shard: int = Query(..., ge=0)):
+    """Move a user's data to another shard while they keep using the app; takes a few seconds"""
+    try:
+        return move_user(user_id, shard)
+    except ShardMoveError as e:
+        raise HTTPException(status_code=409, detail=str(e))
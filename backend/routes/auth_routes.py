@@ -1,19 +1,22 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from sqlmodel import Session, select
 from auth import UserCreate, UserLogin, Token, create_access_token, verify_password, get_password_hash
-from models import User, engine
+from models import User, db_router
+from sharding import place_user
 from typing import Optional
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from auth import verify_token, TokenData
 from datetime import timedelta
+from tracing import span
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 
 @router.post("/register", response_model=Token)
 def register(user: UserCreate):
-    with Session(engine) as session:
+    with Session(db_router.writer()) as session:
         # Check if user already exists
         existing_user = session.exec(select(User).where(User.username == user.username)).first()
         if existing_user:
@@ -43,7 +46,18 @@ def register(user: UserCreate):
         except Exception as e:
             session.rollback()
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_ERROR,
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Registration failed: {str(e)}"
+            )
+
+        try:
+            place_user(db_user.id)
+        except Exception as e:
+            # Without its copy on the user's shard the account could never write there; undo it
+            session.delete(db_user)
+            session.commit()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Registration failed: {str(e)}"
             )
 
@@ -58,7 +72,7 @@ def register(user: UserCreate):
 
 @router.post("/login", response_model=Token)
 def login(credentials: UserLogin):
-    with Session(engine) as session:
+    with Session(db_router.reader()) as session:
         try:
             # Find user by username
             user = session.exec(select(User).where(User.username == credentials.username)).first()
@@ -85,7 +99,26 @@ def login(credentials: UserLogin):
 
 
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
-    token_data = verify_token(credentials.credentials)
+    return authenticate_token(credentials.credentials)
+
+
+def get_stream_user(token: Optional[str] = None,
+                    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)) -> User:
+    """Like get_current_user, but also accepts ?token= for EventSource clients that cannot set headers"""
+    if credentials is not None:
+        return authenticate_token(credentials.credentials)
+    if token is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return authenticate_token(token)
+
+
+def authenticate_token(token: str) -> User:
+    """Resolve a bearer token to its user, raising 401 when it is not valid"""
+    token_data = verify_token(token)
     if token_data is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -93,7 +126,7 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    with Session(engine) as session:
+    with span("auth.user_lookup"), Session(db_router.reader()) as session:
         user = session.exec(select(User).where(User.username == token_data.username)).first()
         if user is None:
             raise HTTPException(
@@ -1,11 +1,17 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, Header
 from pydantic import BaseModel
 from sqlmodel import Session, select
-from models import Message, Conversation, Task, engine, User
+from models import Message, Conversation, Task, db_router, settings, User
 from datetime import datetime
 from typing import Optional, List
 import uuid
 from agents import run_agent
+from agent_cache import turn_cache
+from archive import load_turns
+from conversations import record_message
+from idempotency import IdempotencyConflict, idempotency_store
+from tracing import span
+from .admin import require_admin
 from .auth_routes import get_current_user
 
 router = APIRouter()
@@ -23,66 +29,123 @@ class ChatResponse(BaseModel):
 
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest, current_user: User = Depends(get_current_user)):
+async def chat(
+    request: ChatRequest,
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    if idempotency_key:
+        return await idempotent_chat_turn(request, current_user, idempotency_key)
+    return await process_chat_turn(request, current_user)
+
+
+async def idempotent_chat_turn(request: ChatRequest, current_user: User, idempotency_key: str) -> ChatResponse:
+    """
+    Run a chat turn at most once per idempotency key: a retry gets the stored
+    response, and a duplicate sent while the first is running waits for it
+    """
+    async def run_turn():
+        return (await process_chat_turn(request, current_user)).model_dump()
+
+    try:
+        result = await idempotency_store.run(
+            "chat", current_user.id, idempotency_key, request.model_dump(), run_turn
+        )
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return ChatResponse(**result)
+
+
+def warm_up_chat_statements():
+    """
+    Run a chat turn's statements once in a transaction that is rolled back,
+    so the first real turn does not pay for compiling them. The inserts need
+    an existing user for their foreign keys and are skipped without one.
+    """
+    with Session(db_router.reader()) as session:
+        session.exec(select(User).where(User.username == "")).first()
+        load_turns(session, 0, settings.chat_history_max_messages)
+        user_id = session.exec(select(User.id).limit(1)).first()
+    if user_id is None:
+        return
+
+    with Session(db_router.writer()) as session:
+        conversation = Conversation(user_id=user_id)
+        session.add(conversation)
+        session.flush()
+        session.refresh(conversation)
+        message = Message(user_id=user_id, conversation_id=conversation.id, role="user", content="")
+        session.add(message)
+        record_message(session, conversation.id, message.content, message.created_at)
+        session.flush()
+        session.rollback()
+
+
+async def process_chat_turn(request: ChatRequest, current_user: User) -> ChatResponse:
+    """Run one chat turn for an authenticated user (shared by HTTP and WebSocket)"""
     user_id = current_user.id  # Use the authenticated user's ID
 
     conversation_id = None
 
     # Create or get conversation
-    with Session(engine) as session:
-        if request.conversation_id is None:
-            # Create new conversation
-            conversation = Conversation(user_id=str(user_id))  # Convert to string to match DB schema
-            session.add(conversation)
-            session.commit()
-            session.refresh(conversation)
-            conversation_id = conversation.id
-        else:
-            conversation_id = request.conversation_id
-
-            # Verify conversation belongs to user
-            conversation = session.get(Conversation, request.conversation_id)
-            if not conversation or conversation.user_id != user_id:
-                raise HTTPException(status_code=404, detail="Conversation not found")
+    with Session(db_router.writer(user_id)) as session:
+        with span("chat.conversation_fetch", new=request.conversation_id is None):
+            if request.conversation_id is None:
+                # Create new conversation
+                conversation = Conversation(user_id=user_id)
+                session.add(conversation)
+                session.commit()
+                session.refresh(conversation)
+                conversation_id = conversation.id
+            else:
+                conversation_id = request.conversation_id
+
+                # Verify conversation belongs to user
+                conversation = session.get(Conversation, request.conversation_id)
+                if not conversation or conversation.user_id != user_id:
+                    raise HTTPException(status_code=404, detail="Conversation not found")
 
         # Store user message
-        user_message = Message(
-            user_id=str(user_id),  # Convert to string to match DB schema
-            conversation_id=conversation_id,
-            role="user",
-            content=request.message
-        )
-        session.add(user_message)
-        session.commit()
-
-        # Get conversation history
-        statement = select(Message).where(Message.conversation_id == conversation_id).order_by(Message.created_at)
-        messages = session.exec(statement).all()
+        with span("chat.message_insert"):
+            user_message = Message(
+                user_id=user_id,
+                conversation_id=conversation_id,
+                role="user",
+                content=request.message
+            )
+            session.add(user_message)
+            record_message(session, conversation_id, user_message.content, user_message.created_at)
+            session.commit()
 
-        # Prepare messages for agent
-        agent_messages = []
-        for msg in messages:
-            agent_messages.append({
-                "role": msg.role,
-                "content": msg.content
-            })
+    # Get conversation history; the router keeps this on the primary right
+    # after the user's own write, so the new message is always included
+    with span("chat.history_load"), Session(db_router.reader(user_id)) as session:
+        # The newest messages, reaching into the cold-storage archive if needed
+        agent_messages = load_turns(session, conversation_id, settings.chat_history_max_messages)
 
     # Run agent with MCP tools
-    result = await run_agent(str(user_id), agent_messages)  # Pass user_id as string to match DB schema
+    result = await run_agent(user_id, agent_messages)
 
     # Store assistant response
-    with Session(engine) as session:
+    with span("chat.response_insert"), Session(db_router.writer(user_id)) as session:
         assistant_message = Message(
-            user_id=str(user_id),  # Convert to string to match DB schema
+            user_id=user_id,
             conversation_id=conversation_id,
             role="assistant",
             content=result["response"]
         )
         session.add(assistant_message)
+        record_message(session, conversation_id, assistant_message.content, assistant_message.created_at)
         session.commit()
 
     return ChatResponse(
         conversation_id=conversation_id,
         response=result["response"],
         tool_calls=result.get("tool_calls", [])
-    )
\ No newline at end of file
+    )
+
+
+@router.get("/chat/cache-stats", dependencies=[Depends(require_admin)])
+async def chat_cache_stats():
+    """Hit rate and latency saved by the agent turn cache"""
+    return turn_cache.stats()
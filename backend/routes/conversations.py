@@ -0,0 +1,47 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import Optional
+from sqlmodel import Session
+from models import Conversation, User, db_router, settings
+from conversations import InvalidCursor, list_conversations, page_messages
+from .auth_routes import get_current_user
+
+router = APIRouter()
+
+
+@router.get("/conversations")
+def get_conversations(
+    before: Optional[str] = None,
+    limit: int = Query(None, ge=1, le=500),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    The user's conversations, most recently active first, each with its
+    message count and a preview of the last message. Pass `next` back as
+    `before` for the following page; it is null on the last page.
+    """
+    with Session(db_router.reader(current_user.id)) as session:
+        try:
+            return list_conversations(session, current_user.id, before, limit or settings.conversations_page_size)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/conversations/{conversation_id}/messages")
+def get_conversation_messages(
+    conversation_id: int,
+    before: Optional[str] = None,
+    limit: int = Query(None, ge=1, le=500),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    A conversation's messages, newest page first (each page oldest first),
+    archived messages included. Pass `next` back as `before` to page back.
+    """
+    with Session(db_router.reader(current_user.id)) as session:
+        conversation = session.get(Conversation, conversation_id)
+        if not conversation or conversation.user_id != current_user.id:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        try:
+            return page_messages(session, conversation_id, before, limit or settings.messages_page_size)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, Request
+from sse_starlette.sse import EventSourceResponse
+import json
+from models import User
+from events import task_events
+from .auth_routes import get_stream_user
+
+router = APIRouter()
+
+
+@router.get("/tasks/events")
+async def stream_task_events(request: Request, current_user: User = Depends(get_stream_user)):
+    """
+    Server-sent events with the user's task changes, so clients can stop
+    polling list_tasks. Each event is {"op": "add"|"complete"|"delete"|"update",
+    "task_id": ..., "task": {...}}; {"op": "resync"} means events were dropped
+    and the client should re-list.
+    """
+    subscription = task_events.subscribe(current_user.id)
+
+    async def event_stream():
+        try:
+            while not await request.is_disconnected():
+                for event in await subscription.get():
+                    yield {"event": "task", "data": json.dumps(event, separators=(",", ":"))}
+        finally:
+            task_events.unsubscribe(subscription)
+
+    return EventSourceResponse(event_stream(), ping=15)
@@ -0,0 +1,14 @@
+from fastapi import APIRouter, Depends
+from sqlmodel import Session
+from models import User, db_router
+from task_stats import task_stats
+from .auth_routes import get_current_user
+
+router = APIRouter()
+
+
+@router.get("/tasks/stats")
+def get_task_stats(current_user: User = Depends(get_current_user)):
+    """The user's task counts: total, pending, completed and completed today (UTC)"""
+    with Session(db_router.reader(current_user.id)) as session:
+        return task_stats(session, current_user.id)
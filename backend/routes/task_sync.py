@@ -0,0 +1,26 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlmodel import Session
+from models import User, db_router, settings
+from task_sync import SyncResetRequired, changes_since
+from .auth_routes import get_current_user
+
+router = APIRouter()
+
+
+@router.get("/tasks/changes")
+def task_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(None, ge=1, le=5000),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Tasks changed after sequence number `since`, oldest first. Deleted tasks
+    appear as {"id", "seq", "deleted": true}. Pass `next` back as `since`
+    to continue; `has_more` means another page is ready. 410 means the
+    cursor predates compacted deletes and the client must resync from 0.
+    """
+    with Session(db_router.reader(current_user.id)) as session:
+        try:
+            return changes_since(session, current_user.id, since, limit or settings.task_changes_page_size)
+        except SyncResetRequired as e:
+            raise HTTPException(status_code=410, detail=str(e))
@@ -0,0 +1,52 @@
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
+import asyncio
+from models import User, db_router, settings
+from agent_cache import task_versions
+from events import task_events
+from transfer import BulkImportError, BulkImporter, export_conversations, export_tasks, read_line_batches
+from .auth_routes import get_current_user
+
+router = APIRouter()
+
+NDJSON = "application/x-ndjson"
+
+
+@router.get("/export/tasks")
+def export_user_tasks(current_user: User = Depends(get_current_user)):
+    """Stream all of the user's tasks as NDJSON"""
+    chunks = export_tasks(db_router.reader(current_user.id), current_user.id, settings.export_fetch_size)
+    return StreamingResponse(chunks, media_type=NDJSON,
+                             headers={"Content-Disposition": 'attachment; filename="tasks.ndjson"'})
+
+
+@router.get("/export/conversations")
+def export_user_conversations(current_user: User = Depends(get_current_user)):
+    """Stream all of the user's conversations, each followed by its messages, as NDJSON"""
+    chunks = export_conversations(db_router.reader(current_user.id), current_user.id, settings.export_fetch_size)
+    return StreamingResponse(chunks, media_type=NDJSON,
+                             headers={"Content-Disposition": 'attachment; filename="conversations.ndjson"'})
+
+
+@router.post("/import")
+async def import_user_data(request: Request, current_user: User = Depends(get_current_user)):
+    """
+    Import an NDJSON stream in the export format. Lines are written in
+    batches of IMPORT_BATCH_SIZE, each in its own transaction; on a bad line
+    the response says which one and how much was already imported.
+    """
+    importer = BulkImporter(db_router.writer(current_user.id), current_user.id)
+    try:
+        async for lines in read_line_batches(request.stream(), settings.import_batch_size,
+                                             settings.import_max_line_bytes):
+            await asyncio.to_thread(importer.write_lines, lines)
+    except BulkImportError as e:
+        raise HTTPException(status_code=400, detail={
+            "line": e.line, "error": e.message, "imported": importer.counts
+        })
+    finally:
+        if importer.counts["task"]:
+            task_versions.bump(current_user.id)
+            task_events.publish(current_user.id, {"op": "resync"})
+
+    return {"imported": importer.counts}
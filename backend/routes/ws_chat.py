@@ -0,0 +1,109 @@
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+import asyncio
+import json
+import logging
+from models import settings
+from tracing import start_trace
+from .auth_routes import authenticate_token
+from .chat import ChatRequest, idempotent_chat_turn, process_chat_turn
+
+router = APIRouter()
+
+logger = logging.getLogger(__name__)
+
+
+def stream_chunks(text: str, size: int):
+    """Split a response into chunks of about `size` characters on word boundaries"""
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            cut = max(text.rfind(" ", start, end), text.rfind("\n", start, end))
+            if cut > start:
+                end = cut + 1
+        yield text[start:end]
+        start = end
+
+
+@router.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket):
+    """
+    Chat over one long-lived connection.
+
+    The bearer token is checked once, from the `token` query parameter or the
+    Authorization header. Each {"type": "message", "message": ..., "conversation_id": ...}
+    frame (optionally with "idempotency_key" and a W3C "traceparent")
+    runs the same pipeline as POST /api/chat and is answered with a
+    "start" frame, "delta" frames and a final "done" frame. {"type": "ping"}
+    is answered with {"type": "pong"}; a connection with no frames for
+    WS_IDLE_TIMEOUT_SECONDS is closed.
+    """
+    token = websocket.query_params.get("token")
+    authorization = websocket.headers.get("authorization", "")
+    if token is None and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+
+    await websocket.accept()
+    try:
+        if not token:
+            raise HTTPException(status_code=401, detail="Missing bearer token")
+        user = await run_in_threadpool(authenticate_token, token)
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "detail": e.detail})
+        await websocket.close(code=4401)
+        return
+
+    await websocket.send_json({"type": "ready"})
+    try:
+        while True:
+            try:
+                data = await asyncio.wait_for(websocket.receive_text(), timeout=settings.ws_idle_timeout_seconds)
+            except asyncio.TimeoutError:
+                await websocket.send_json({"type": "error", "detail": "Idle timeout"})
+                await websocket.close(code=4408)
+                return
+            try:
+                frame = json.loads(data)
+            except ValueError:
+                frame = None
+            if not isinstance(frame, dict):
+                # A bad frame is answered like any other bad request; the connection stays open
+                await websocket.send_json({"type": "error", "id": None, "detail": "Frames must be JSON objects"})
+                continue
+
+            frame_type = frame.get("type", "message")
+            request_id = frame.get("id")
+            if frame_type == "ping":
+                await websocket.send_json({"type": "pong", "id": request_id})
+                continue
+            if frame_type != "message":
+                await websocket.send_json({"type": "error", "id": request_id, "detail": f"Unknown frame type: {frame_type}"})
+                continue
+
+            try:
+                # Each turn is its own trace; a "traceparent" field joins the client's
+                with start_trace("ws.chat_turn", frame.get("traceparent")):
+                    request = ChatRequest(message=frame.get("message"), conversation_id=frame.get("conversation_id"))
+                    idempotency_key = frame.get("idempotency_key")
+                    if idempotency_key:
+                        result = await idempotent_chat_turn(request, user, idempotency_key)
+                    else:
+                        result = await process_chat_turn(request, user)
+            except ValidationError as e:
+                await websocket.send_json({"type": "error", "id": request_id, "detail": e.errors()[0]["msg"]})
+                continue
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "id": request_id, "detail": e.detail})
+                continue
+
+            await websocket.send_json({"type": "start", "id": request_id, "conversation_id": result.conversation_id})
+            for chunk in stream_chunks(result.response, settings.ws_stream_chunk_size):
+                await websocket.send_json({"type": "delta", "id": request_id, "content": chunk})
+            await websocket.send_json({"type": "done", "id": request_id, **result.model_dump()})
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Chat WebSocket error: {str(e)}")
+        await websocket.close(code=1011)
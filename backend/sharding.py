@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Moving users between shards
+
+With DATABASE_SHARD_URLS set, each user's tasks, task counters,
+conversations, messages and archived messages live on one shard (see
+database.ShardRouter). Accounts, idempotency keys and the shard directory
+stay on shard 0; a copy of the account row sits on the user's shard for
+the foreign keys there. Every shard allocates row ids from its own range,
+so a move copies rows with their ids: the task ids, conversation ids and
+message cursors that clients hold stay valid.
+
+move_user() works while the app serves the user:
+
+  1. mark the user as moving in the directory; writes for them now fail
+     with ShardMoving (a 503 to retry) while reads carry on
+  2. wait until every process has reloaded the directory and in-flight
+     writes have committed
+  3. copy the user's rows to the target shard in one transaction
+  4. point the directory at the target shard
+  5. once every process routes there, delete the rows on the old shard
+
+A copy that fails (an id already taken on the target; only a SQLite shard
+that received users from a higher shard can drift into another's range)
+is rolled back and the user stays where they were.
+
+Usage:
+  python sharding.py move <user_id> <shard>
+  python sharding.py pin <previous shard count>   (before adding shards)
+"""
+
+import logging
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import delete, insert
+from sqlmodel import Session, SQLModel, select
+
+from database import HashRing, ShardRouter, reserve_id_range
+from models import Conversation, Message, MessageArchive, ShardAssignment, Task, TaskSequence, User, db_router, settings
+
+
+logger = logging.getLogger(__name__)
+
+# Per-user tables, parents first
+SHARDED_TABLES = [TaskSequence.__table__, Task.__table__, Conversation.__table__, Message.__table__,
+                  MessageArchive.__table__]
+COPY_BATCH_SIZE = 1000
+
+
+class ShardMoveError(Exception):
+    """A user could not be moved to another shard"""
+
+
+def create_tables():
+    """Create the tables on every shard and start each shard's ids in its own range"""
+    for index, shard in enumerate(db_router.shards):
+        SQLModel.metadata.create_all(bind=shard.writer_engine)
+        if index:
+            reserve_id_range(shard.writer_engine, index, [table.name for table in SHARDED_TABLES[1:]])
+
+
+def place_user(user_id: int):
+    """Copy a new account row to the shard the user's data goes to"""
+    shard = db_router.shard_for(user_id)
+    if shard != 0:
+        with db_router.shards[shard].writer().begin() as conn:
+            _copy_account(user_id, conn)
+
+
+def move_user(user_id: int, target: int, drain_seconds: Optional[float] = None) -> Dict[str, int]:
+    """Move a user's data to the target shard (see the module docstring); returns what was moved"""
+    if not isinstance(db_router, ShardRouter):
+        raise ShardMoveError("Sharding is not configured (DATABASE_SHARD_URLS)")
+    if not 0 <= target < len(db_router.shards):
+        raise ShardMoveError(f"There is no shard {target}")
+    with Session(db_router.shards[0].primary) as session:
+        if session.get(User, user_id) is None:
+            raise ShardMoveError(f"User {user_id} not found")
+
+    db_router.refresh_directory()
+    source = db_router.shard_for(user_id)
+    if source == target:
+        return {"user_id": user_id, "from": source, "to": target, "rows": 0}
+
+    _assign(user_id, source, moving_to=target)
+    try:
+        time.sleep(db_router.directory_seconds + (
+            settings.shard_move_drain_seconds if drain_seconds is None else drain_seconds))
+        started = time.perf_counter()
+        rows = _copy_rows(user_id, db_router.shards[source], db_router.shards[target])
+    except Exception as e:
+        _assign(user_id, source)
+        raise ShardMoveError(f"Moving user {user_id} to shard {target} failed: {str(e)}") from e
+    _assign(user_id, target)
+    copy_ms = (time.perf_counter() - started) * 1e3
+
+    # Processes with the old directory still read from the source until they reload it
+    time.sleep(db_router.directory_seconds)
+    _delete_rows(user_id, db_router.shards[source], keep_account=source == 0)
+    logger.info(f"Moved user {user_id} from shard {source} to {target}: {rows} rows, copied in {copy_ms:.0f} ms")
+    return {"user_id": user_id, "from": source, "to": target, "rows": rows}
+
+
+def pin_users(previous_shard_count: int, batch_size: int = 1000) -> int:
+    """
+    Run with the new DATABASE_SHARD_URLS before the app starts using them:
+    every user whose hash-ring shard changes with the added shards is pinned
+    in the directory to the shard their data is on, so nobody's data goes
+    missing; move_user() can then move them at leisure. Returns how many
+    users were pinned.
+    """
+    if not isinstance(db_router, ShardRouter):
+        raise ShardMoveError("Sharding is not configured (DATABASE_SHARD_URLS)")
+    previous_ring = HashRing(previous_shard_count)
+    pinned = 0
+    after = 0
+    while True:
+        with Session(db_router.shards[0].writer()) as session:
+            user_ids = session.exec(select(User.id).where(User.id > after).order_by(User.id).limit(batch_size)).all()
+            if not user_ids:
+                break
+            assigned = set(session.exec(
+                select(ShardAssignment.user_id).where(ShardAssignment.user_id.in_(user_ids))
+            ).all())
+            for user_id in user_ids:
+                shard = previous_ring.shard_for(user_id)
+                if user_id not in assigned and shard != db_router.ring.shard_for(user_id):
+                    session.add(ShardAssignment(user_id=user_id, shard=shard))
+                    pinned += 1
+            session.commit()
+        after = user_ids[-1]
+    db_router.refresh_directory()
+    return pinned
+
+
+def _assign(user_id: int, shard: int, moving_to: Optional[int] = None):
+    """Record where the user lives; users on their hash-ring shard need no entry"""
+    with Session(db_router.shards[0].writer()) as session:
+        if moving_to is None and shard == db_router.ring.shard_for(user_id):
+            session.execute(delete(ShardAssignment).where(ShardAssignment.user_id == user_id))
+        else:
+            session.merge(ShardAssignment(user_id=user_id, shard=shard, moving_to=moving_to,
+                                          updated_at=datetime.utcnow()))
+        session.commit()
+    db_router.refresh_directory()
+
+
+def _copy_account(user_id: int, conn):
+    if conn.execute(select(User.id).where(User.id == user_id)).first() is not None:
+        return
+    with db_router.shards[0].primary.connect() as reading:
+        account = reading.execute(select(User.__table__).where(User.__table__.c.id == user_id)).one()
+    conn.execute(insert(User.__table__), [account._asdict()])
+
+
+def _copy_rows(user_id: int, source, target) -> int:
+    """Copy the user's rows, ids included, in one transaction on the target"""
+    copied = 0
+    with source.primary.connect() as reading, reading.begin(), target.writer().begin() as writing:
+        _copy_account(user_id, writing)
+        for table in SHARDED_TABLES:
+            result = reading.execution_options(yield_per=COPY_BATCH_SIZE).execute(
+                select(table).where(table.c.user_id == user_id).order_by(*table.primary_key.columns)
+            )
+            for rows in result.partitions():
+                writing.execute(insert(table), [row._asdict() for row in rows])
+                copied += len(rows)
+    return copied
+
+
+def _delete_rows(user_id: int, shard, keep_account: bool):
+    with shard.writer().begin() as conn:
+        for table in reversed(SHARDED_TABLES):
+            conn.execute(delete(table).where(table.c.user_id == user_id))
+        if not keep_account:
+            conn.execute(delete(User.__table__).where(User.__table__.c.id == user_id))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) == 4 and sys.argv[1] == "move":
+        print(move_user(int(sys.argv[2]), int(sys.argv[3])))
+    elif len(sys.argv) == 3 and sys.argv[1] == "pin":
+        print({"pinned": pin_users(int(sys.argv[2]))})
+    else:
+        print(__doc__.split("Usage:")[1].rstrip())
+        sys.exit(2)
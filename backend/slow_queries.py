@@ -0,0 +1,223 @@
+"""
+Slow-query log
+
+SQLAlchemy cursor events time every statement. One that takes longer than
+SLOW_QUERY_THRESHOLD_MS is logged with the shape of its parameters (types,
+never values), the route or tool that issued it and, with
+SLOW_QUERY_EXPLAIN, the database's plan for it, captured once per
+statement shape on a side cursor of the same connection. Slow statements
+are also aggregated by fingerprint (the statement with literals and IN
+lists normalized away) so repeat offenders show up in the top-N report
+behind GET /api/admin/slow-queries.
+
+The origin is a context variable holding the HTTP/WebSocket scope (set by
+QueryOriginMiddleware) and any tool or job labels pushed with
+query_origin(); it is only turned into text when a statement is slow.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+
+
+logger = logging.getLogger(__name__)
+
+_origin: ContextVar[Tuple[Any, ...]] = ContextVar("query_origin", default=())
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|:\w+|\$\d+|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_statement(statement: str) -> str:
+    """The statement with literals and placeholders as ?, IN lists collapsed and whitespace squeezed"""
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _PLACEHOLDER.sub("?", normalized)
+    normalized = _NUMBER.sub("?", normalized)
+    normalized = _IN_LIST.sub("(?+)", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def _type_names(values) -> Any:
+    if isinstance(values, dict):
+        return {key: type(value).__name__ for key, value in values.items()}
+    if isinstance(values, (list, tuple)):
+        return [type(value).__name__ for value in values]
+    return type(values).__name__
+
+
+def params_shape(parameters, executemany: bool) -> Any:
+    """Parameter types only, so no user data reaches the log"""
+    if executemany:
+        rows = list(parameters)
+        return {"rows": len(rows), "row": _type_names(rows[0]) if rows else None}
+    return _type_names(parameters)
+
+
+@contextmanager
+def query_origin(label):
+    """Attribute the statements run inside the block to `label` (a tool, a job)"""
+    token = _origin.set(_origin.get() + (label,))
+    try:
+        yield
+    finally:
+        _origin.reset(token)
+
+
+def describe_origin(parts: Tuple[Any, ...]) -> str:
+    labels = []
+    for part in parts:
+        if isinstance(part, dict):
+            # An ASGI scope; the router fills in the endpoint once it matches
+            endpoint = part.get("endpoint")
+            label = f"{part.get('method', 'WS')} {part['path']}"
+            labels.append(f"{label} ({endpoint.__name__})" if endpoint is not None else label)
+        else:
+            labels.append(str(part))
+    return " > ".join(labels) or "-"
+
+
+class QueryOriginMiddleware:
+    """ASGI middleware recording the request as the origin of its statements"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        token = _origin.set((scope,))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _origin.reset(token)
+
+
+class SlowQueryLog:
+    """Times statements and keeps per-fingerprint totals for the slow ones"""
+
+    def __init__(self, threshold_ms: float = -1, explain: bool = False, max_fingerprints: int = 1000):
+        self.configure(threshold_ms, explain, max_fingerprints)
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, threshold_ms: float, explain: bool = False, max_fingerprints: int = 1000):
+        """A negative threshold turns the log off"""
+        self.threshold = threshold_ms / 1000
+        self.explain = explain
+        self.max_fingerprints = max_fingerprints
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold >= 0
+
+    def instrument(self, engine):
+        if not event.contains(engine, "before_cursor_execute", self._before_cursor_execute):
+            event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_started
+        if elapsed >= self.threshold >= 0:
+            self.record(conn, cursor, statement, parameters, executemany, elapsed)
+
+    def record(self, conn, cursor, statement: str, parameters, executemany: bool, elapsed: float):
+        normalized = normalize_statement(statement)
+        key = fingerprint(normalized)
+        origin = describe_origin(_origin.get())
+        shape = params_shape(parameters, executemany)
+        elapsed_ms = elapsed * 1000
+
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                if len(self._stats) >= self.max_fingerprints:
+                    # Forget the entry that has cost the least so far
+                    del self._stats[min(self._stats, key=lambda k: self._stats[k]["total_ms"])]
+                entry = self._stats[key] = {
+                    "fingerprint": key,
+                    "statement": normalized,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "origins": {},
+                    "plan": None,
+                }
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            entry["last_seen"] = time.time()
+            entry["params"] = shape
+            if origin in entry["origins"] or len(entry["origins"]) < 10:
+                entry["origins"][origin] = entry["origins"].get(origin, 0) + 1
+            needs_plan = self.explain and entry["plan"] is None and not executemany
+
+        plan = self._explain(conn, cursor, statement, parameters) if needs_plan else None
+        if plan is not None:
+            with self._lock:
+                entry["plan"] = plan
+
+        logger.warning(
+            f"Slow query {elapsed_ms:.1f} ms [{origin}] {statement[:1000]} params={shape}"
+            + (f"\n{plan}" if plan else "")
+        )
+
+    def _explain(self, conn, cursor, statement: str, parameters) -> Optional[str]:
+        """The plan for a statement that just ran, from a side cursor on its connection"""
+        dialect = conn.dialect.name
+        if dialect == "sqlite":
+            prefix = "EXPLAIN QUERY PLAN "
+        elif dialect == "postgresql":
+            prefix = "EXPLAIN "
+        else:
+            return None
+        explain_cursor = cursor.connection.cursor()
+        try:
+            if dialect == "postgresql":
+                # A failed statement would abort the caller's transaction
+                explain_cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                explain_cursor.execute(prefix + statement, parameters)
+                rows = explain_cursor.fetchall()
+            except Exception as e:
+                if dialect == "postgresql":
+                    explain_cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                return f"(EXPLAIN failed: {e})"
+            if dialect == "postgresql":
+                explain_cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            # The last column is the plan text on both (SQLite: id, parent, notused, detail)
+            return "\n".join(str(row[-1]) for row in rows)
+        finally:
+            explain_cursor.close()
+
+    def top(self, limit: int = 20, order_by: str = "total_ms") -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = [dict(entry, origins=dict(entry["origins"])) for entry in self._stats.values()]
+        entries.sort(key=lambda entry: entry[order_by], reverse=True)
+        for entry in entries:
+            entry["mean_ms"] = entry["total_ms"] / entry["count"]
+        return entries[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+slow_query_log = SlowQueryLog()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Per-user task statistics
+
+The counts live on the user's `tasksequence` row and are adjusted by the
+same upsert that allocates the change sequence number (see
+task_sync.next_seq), so they commit atomically with every add, complete
+and delete, and reading them is a primary-key lookup instead of a scan of
+the task list. Counting "completed today" needs the day it refers to; the
+counter starts over on the first completion of a new (UTC) day and reads
+as 0 once its day is past.
+
+reconcile_task_stats() recounts from the task table in batches of users
+and rewrites only the rows that drifted.
+"""
+
+import logging
+from datetime import datetime, time
+from typing import Dict
+
+from sqlalchemy import and_, case, func, or_, update
+from sqlmodel import Session, select
+
+from models import Task, TaskSequence, db_router, settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def task_stats(session: Session, user_id: int) -> Dict[str, int]:
+    """The user's task counts, read from the stats row"""
+    row = session.get(TaskSequence, user_id)
+    if row is None:
+        return {"total": 0, "pending": 0, "completed": 0, "completed_today": 0}
+    return {
+        "total": row.total,
+        "pending": row.total - row.completed,
+        "completed": row.completed,
+        "completed_today": row.completed_today if row.completed_day == datetime.utcnow().date() else 0,
+    }
+
+
+def reconcile_task_stats(batch_size: int = 500) -> Dict[str, int]:
+    """
+    Recount every user's stats from their tasks, shard by shard and one
+    batch of users per transaction. The batch's stats rows are locked first
+    (on PostgreSQL), which holds off concurrent tool calls for those users
+    until the recount commits.
+    """
+    stats = {"users": 0, "drifted": 0, "batches": 0}
+    for shard in db_router.shards:
+        after = 0
+        while True:
+            with Session(shard.writer()) as session:
+                user_ids = session.exec(
+                    select(TaskSequence.user_id)
+                    .where(TaskSequence.user_id > after)
+                    .order_by(TaskSequence.user_id)
+                    .limit(batch_size)
+                    .with_for_update()
+                ).all()
+                if not user_ids:
+                    break
+
+                today = datetime.utcnow().date()
+                live = and_(Task.user_id == TaskSequence.user_id, Task.deleted == False)
+                total = select(func.count(Task.id)).where(live).scalar_subquery()
+                completed = select(func.count(Task.id)).where(live, Task.completed == True).scalar_subquery()
+                completed_today = select(func.count(Task.id)).where(
+                    live, Task.completed == True, Task.completed_at >= datetime.combine(today, time.min)
+                ).scalar_subquery()
+                stored_today = case((TaskSequence.completed_day == today, TaskSequence.completed_today), else_=0)
+
+                drifted = session.execute(
+                    update(TaskSequence)
+                    .where(
+                        TaskSequence.user_id.in_(user_ids),
+                        or_(TaskSequence.total != total, TaskSequence.completed != completed,
+                            stored_today != completed_today),
+                    )
+                    .values(total=total, completed=completed, completed_today=completed_today, completed_day=today)
+                    .returning(TaskSequence.user_id)
+                    .execution_options(synchronize_session=False)
+                ).scalars().all()
+                session.commit()
+
+            if drifted:
+                logger.warning(f"Task stats drifted for users {list(drifted)}; recounted")
+            stats["users"] += len(user_ids)
+            stats["drifted"] += len(drifted)
+            stats["batches"] += 1
+            after = user_ids[-1]
+    return stats
+
+
+def reconcile_from_settings() -> Dict[str, int]:
+    return reconcile_task_stats(settings.stats_reconcile_batch_size)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(reconcile_from_settings())
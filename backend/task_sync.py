@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Per-user change sequence for tasks, for delta sync
+
+Every task change (add, update, complete, delete) stamps the row with the
+next number from the user's `tasksequence` counter, in the same
+transaction. The counter row is locked until commit, so a user's changes
+become visible in sequence order and a client that has seen everything up
+to N only ever needs rows with seq > N; the (user_id, seq) index makes that
+a range scan whose cost depends on the number of changes, not on the size
+of the list. Deletes leave a tombstone row so clients learn about them;
+tombstones older than TOMBSTONE_RETENTION_DAYS are compacted away, and a
+client whose cursor predates the compaction must start over from 0.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import Row, case, delete, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+
+from models import Task, TaskSequence, db_router, settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class SyncResetRequired(Exception):
+    """The requested cursor is older than the compacted tombstones"""
+
+
+def next_seq(conn, user_id: int, count: int = 1, total: int = 0, completed: int = 0,
+             completed_today: int = 0) -> int:
+    """
+    Allocate `count` sequence numbers for the user inside the caller's
+    transaction and return the last one. The task stats deltas are applied
+    by the same upsert, so they commit with the change (one round trip).
+    """
+    dialect = conn.dialect if hasattr(conn, "dialect") else conn.get_bind().dialect
+    insert = postgresql.insert if dialect.name == "postgresql" else sqlite.insert
+    today = datetime.utcnow().date()
+    values = {
+        "user_id": user_id,
+        "last_seq": count,
+        "compacted_seq": 0,
+        "total": total,
+        "completed": completed,
+        "completed_today": max(completed_today, 0),
+        "completed_day": today if completed_today else None,
+    }
+    changes = {
+        "last_seq": TaskSequence.last_seq + count,
+        "total": TaskSequence.total + total,
+        "completed": TaskSequence.completed + completed,
+    }
+    if completed_today:
+        # The daily count starts over on the first completion of a new day
+        changes["completed_today"] = case(
+            (TaskSequence.completed_day == today, TaskSequence.completed_today + completed_today),
+            else_=max(completed_today, 0),
+        )
+        changes["completed_day"] = today
+    statement = (
+        insert(TaskSequence)
+        .values(**values)
+        .on_conflict_do_update(index_elements=[TaskSequence.user_id], set_=changes)
+        .returning(TaskSequence.last_seq)
+    )
+    return conn.execute(statement).scalar_one()
+
+
+def bump_seq(conn, user_id: int, total=0, completed=0, completed_today=0, returning=()) -> Optional[Row]:
+    """
+    next_seq() for a user whose counter row exists, as a plain UPDATE. The
+    stats deltas may be SQL expressions, e.g. over the state of the task
+    being changed, and `returning` adds columns to the returned row of
+    (last_seq, *returning); None if the user has no counter row.
+    """
+    today = datetime.utcnow().date()
+    changes = {
+        "last_seq": TaskSequence.last_seq + 1,
+        "total": TaskSequence.total + total,
+        "completed": TaskSequence.completed + completed,
+    }
+    if not (isinstance(completed_today, int) and completed_today == 0):
+        # The daily count starts over on the first completion of a new day
+        started = (max(completed_today, 0) if isinstance(completed_today, int)
+                   else case((completed_today > 0, completed_today), else_=0))
+        changes["completed_today"] = case(
+            (TaskSequence.completed_day == today, TaskSequence.completed_today + completed_today),
+            else_=started,
+        )
+        changes["completed_day"] = today
+    statement = (
+        update(TaskSequence)
+        .where(TaskSequence.user_id == user_id)
+        .values(**changes)
+        .returning(TaskSequence.last_seq, *returning)
+        .execution_options(synchronize_session=False)
+    )
+    return conn.execute(statement).first()
+
+
+def next_seqs(conn, counts: Dict[int, int]) -> Dict[int, int]:
+    """
+    next_seq() for several users in one statement: allocate counts[user_id]
+    numbers for each and return the last one per user. Stats are untouched.
+    """
+    dialect = conn.dialect if hasattr(conn, "dialect") else conn.get_bind().dialect
+    insert = postgresql.insert if dialect.name == "postgresql" else sqlite.insert
+    statement = insert(TaskSequence)
+    statement = statement.on_conflict_do_update(
+        index_elements=[TaskSequence.user_id],
+        set_={"last_seq": TaskSequence.last_seq + statement.excluded.last_seq},
+    ).returning(TaskSequence.user_id, TaskSequence.last_seq)
+    rows = [
+        {"user_id": user_id, "last_seq": count, "compacted_seq": 0, "total": 0, "completed": 0, "completed_today": 0}
+        for user_id, count in counts.items()
+    ]
+    return dict(conn.execute(statement, rows).all())
+
+
+def changes_since(session: Session, user_id: int, since: int, limit: int) -> Dict[str, Any]:
+    """
+    Rows changed after `since`, oldest first. `next` is the cursor for the
+    following call; with since=0 tombstones are skipped, since the client
+    has nothing to delete.
+    """
+    sequence = session.get(TaskSequence, user_id)
+    last_seq = sequence.last_seq if sequence else 0
+    if since > 0 and sequence is not None and since < sequence.compacted_seq:
+        raise SyncResetRequired(f"Changes before {sequence.compacted_seq} were compacted; sync again from 0")
+
+    statement = (
+        select(Task.id, Task.seq, Task.title, Task.description, Task.completed, Task.due_at, Task.remind_at,
+               Task.deleted, Task.version, Task.updated_at)
+        .where(Task.user_id == user_id, Task.seq > since)
+        .order_by(Task.seq)
+        .limit(limit + 1)
+    )
+    if since == 0:
+        statement = statement.where(Task.deleted == False)
+    rows = session.exec(statement).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    changes = []
+    for task_id, seq, title, description, completed, due_at, remind_at, deleted, version, updated_at in rows:
+        if deleted:
+            changes.append({"id": task_id, "seq": seq, "deleted": True})
+        else:
+            changes.append({
+                "id": task_id,
+                "seq": seq,
+                "title": title,
+                "description": description,
+                "completed": completed,
+                "version": version,
+                "due_at": due_at,
+                "remind_at": remind_at,
+                "updated_at": updated_at,
+            })
+
+    if has_more:
+        next_cursor = rows[-1].seq
+    else:
+        next_cursor = max(last_seq, rows[-1].seq if rows else since)
+    return {"changes": changes, "next": next_cursor, "has_more": has_more}
+
+
+def compact_tombstones(retention_days: int = 30, batch_size: int = 1000) -> Dict[str, int]:
+    """
+    Delete tombstones older than the retention period, shard by shard and
+    one batch per transaction, and raise each affected user's compacted_seq
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    stats = {"tombstones": 0, "batches": 0}
+    for shard in db_router.shards:
+        while True:
+            with Session(shard.writer()) as session:
+                rows = session.exec(
+                    select(Task.id, Task.user_id, Task.seq)
+                    .where(Task.deleted == True, Task.updated_at < cutoff)
+                    .order_by(Task.id)
+                    .limit(batch_size)
+                ).all()
+                if not rows:
+                    break
+
+                horizon: Dict[int, int] = {}
+                for _, user_id, seq in rows:
+                    horizon[user_id] = max(seq, horizon.get(user_id, 0))
+                session.execute(delete(Task).where(Task.id.in_([row.id for row in rows])))
+                for user_id, seq in horizon.items():
+                    session.execute(
+                        update(TaskSequence)
+                        .where(TaskSequence.user_id == user_id, TaskSequence.compacted_seq < seq)
+                        .values(compacted_seq=seq)
+                    )
+                session.commit()
+
+            stats["tombstones"] += len(rows)
+            stats["batches"] += 1
+    return stats
+
+
+def compact_from_settings() -> Dict[str, int]:
+    stats = compact_tombstones(settings.tombstone_retention_days, settings.tombstone_compaction_batch_size)
+    if stats["tombstones"]:
+        logger.info(f"Compacted {stats['tombstones']} task tombstones")
+    return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(compact_from_settings())
@@ -0,0 +1,156 @@
+# backend/test_agent_cache.py
+"""
+Test script for the agent turn cache
+"""
+
+import pytest
+from unittest.mock import AsyncMock
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel
+
+import agent_cache
+import agents
+from agent_cache import TaskListVersions, TurnCache, normalize_utterance
+from database import EngineRouter, create_sqlite_engines
+from main import app
+from models import TaskSequence, settings
+
+
+LIST_RESULT = {
+    "response": "Here are your pending tasks:\nTask #1: 'milk' (pending)",
+    "tool_calls": [{"name": "list_tasks", "arguments": {"user_id": 1, "status": "pending"}}],
+}
+ADD_RESULT = {
+    "response": "I've added the task 'milk' to your list.",
+    "tool_calls": [{"name": "add_task", "arguments": {"user_id": 1, "title": "milk"}}],
+}
+
+
+@pytest.fixture
+def router(tmp_path, monkeypatch):
+    """A temporary database for the shared task-list versions"""
+    reader, writer = create_sqlite_engines(f"sqlite:///{tmp_path / 'test.db'}", settings)
+    SQLModel.metadata.create_all(bind=writer)
+    db_router = EngineRouter(reader, writer=writer)
+    monkeypatch.setattr(agent_cache, "db_router", db_router)
+    yield db_router
+    reader.dispose()
+    writer.dispose()
+
+
+@pytest.fixture
+def cache(router, monkeypatch):
+    """Give the agent a fresh cache and version table"""
+    versions = TaskListVersions()
+    cache = TurnCache()
+    versions.on_bump(cache.invalidate_user)
+    monkeypatch.setattr(agents, "task_versions", versions)
+    monkeypatch.setattr(agents, "turn_cache", cache)
+    monkeypatch.setattr(agents.settings, "agent_cache_enabled", True)
+    return cache
+
+
+def test_normalize_utterance():
+    """Case, punctuation and spacing differences share a key"""
+    assert normalize_utterance("  What's PENDING?? ") == normalize_utterance("what s pending")
+    assert normalize_utterance("complete task #3") == "complete task #3"
+
+
+def test_lru_and_byte_cap():
+    """The oldest entries are evicted once a cap is exceeded"""
+    cache = TurnCache(max_entries=2)
+    for i in range(3):
+        cache.put(("1", f"q{i}", 0, "rules"), LIST_RESULT)
+    assert cache.get(("1", "q0", 0, "rules")) is None
+    assert cache.get(("1", "q2", 0, "rules")) == LIST_RESULT
+
+    small = TurnCache(max_bytes=300)
+    small.put(("1", "a", 0, "rules"), LIST_RESULT)
+    small.put(("1", "b", 0, "rules"), LIST_RESULT)
+    assert small.stats()["entries"] == 1
+
+
+def test_ttl_expiry():
+    """Expired entries are never served"""
+    cache = TurnCache(ttl_seconds=-1)
+    cache.put(("1", "q", 0, "rules"), LIST_RESULT)
+    assert cache.get(("1", "q", 0, "rules")) is None
+
+
+@pytest.mark.asyncio
+async def test_repeat_read_turn_is_cached(cache, monkeypatch):
+    """A repeated read-only turn is answered without running the agent"""
+    uncached = AsyncMock(return_value=LIST_RESULT)
+    monkeypatch.setattr(agents, "run_uncached_agent", uncached)
+
+    first = await agents.run_agent(1, [{"role": "user", "content": "What's pending?"}])
+    second = await agents.run_agent(1, [{"role": "user", "content": "what's pending"}])
+
+    assert first == second == LIST_RESULT
+    assert uncached.await_count == 1
+    assert cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_write_invalidates_cached_turn(cache, monkeypatch):
+    """A task mutation makes the next identical turn run again"""
+    uncached = AsyncMock(return_value=LIST_RESULT)
+    monkeypatch.setattr(agents, "run_uncached_agent", uncached)
+
+    await agents.run_agent(1, [{"role": "user", "content": "show my tasks"}])
+    agents.task_versions.bump("1")
+    await agents.run_agent(1, [{"role": "user", "content": "show my tasks"}])
+
+    assert uncached.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_mutating_turns_are_not_cached(cache, monkeypatch):
+    """Turns that change tasks always run"""
+    uncached = AsyncMock(return_value=ADD_RESULT)
+    monkeypatch.setattr(agents, "run_uncached_agent", uncached)
+
+    await agents.run_agent(1, [{"role": "user", "content": "add milk"}])
+    await agents.run_agent(1, [{"role": "user", "content": "add milk"}])
+
+    assert uncached.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_write_in_another_worker_invalidates(cache, router, monkeypatch):
+    """A task change made by another process, seen only in the shared counter, makes the turn run again"""
+    uncached = AsyncMock(return_value=LIST_RESULT)
+    monkeypatch.setattr(agents, "run_uncached_agent", uncached)
+
+    await agents.run_agent(1, [{"role": "user", "content": "show my tasks"}])
+    with Session(router.writer()) as session:
+        session.add(TaskSequence(user_id=1, last_seq=1, total=1))
+        session.commit()
+    await agents.run_agent(1, [{"role": "user", "content": "show my tasks"}])
+
+    assert uncached.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_model_turns_are_keyed_by_history(cache, monkeypatch):
+    """With a model, the same follow-up in another conversation is not answered from the cache"""
+    uncached = AsyncMock(return_value=LIST_RESULT)
+    monkeypatch.setattr(agents, "run_uncached_agent", uncached)
+    monkeypatch.setattr(agents.settings, "llm_api_key", "test-key")
+
+    first = [{"role": "user", "content": "show my pending tasks"}, {"role": "assistant", "content": "..."}]
+    other = [{"role": "user", "content": "show my completed tasks"}, {"role": "assistant", "content": "..."}]
+    await agents.run_agent(1, first + [{"role": "user", "content": "yes"}])
+    await agents.run_agent(1, other + [{"role": "user", "content": "yes"}])
+    await agents.run_agent(1, first + [{"role": "user", "content": "yes"}])
+
+    assert uncached.await_count == 2
+
+
+def test_cache_stats_need_admin_token(monkeypatch):
+    """The global cache stats are an admin endpoint"""
+    monkeypatch.setattr(settings, "admin_token", "secret")
+    with TestClient(app) as client:
+        assert client.get("/api/chat/cache-stats").status_code == 403
+        response = client.get("/api/chat/cache-stats", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200 and "hit_rate" in response.json()
@@ -0,0 +1,84 @@
+# backend/test_agents.py
+"""
+Test script for multi-tool planning and execution in the rule-based agent
+"""
+
+import asyncio
+
+import pytest
+from sqlmodel import SQLModel
+
+import agents
+import mcp_server
+from database import EngineRouter, create_sqlite_engines
+from models import settings
+
+
+@pytest.fixture
+def router(tmp_path, monkeypatch):
+    """Run the MCP tools against a temporary database"""
+    reader, writer = create_sqlite_engines(f"sqlite:///{tmp_path / 'test.db'}", settings)
+    SQLModel.metadata.create_all(bind=writer)
+    router = EngineRouter(reader, writer=writer)
+    monkeypatch.setattr(mcp_server, "db_router", router)
+    yield router
+    reader.dispose()
+    writer.dispose()
+
+
+def test_split_utterance():
+    """Compound requests split only where a new command starts"""
+    assert agents.split_utterance("add milk, add eggs and show my pending tasks") == [
+        "add milk", "add eggs", "show my pending tasks"
+    ]
+    assert agents.split_utterance("add task to buy bread and butter") == ["add task to buy bread and butter"]
+
+
+def test_plan_stages():
+    """Independent writes share a stage; reads wait for earlier writes"""
+    calls = [agents.plan_clause(1, clause) for clause in [
+        "add milk", "add eggs", "show my pending tasks", "complete task 3", "delete task 3"
+    ]]
+    assert agents.plan_stages(calls) == [[0, 1], [2], [3], [4]]
+
+
+@pytest.mark.asyncio
+async def test_independent_calls_run_concurrently():
+    """Calls in the same stage overlap instead of running back to back"""
+    running = 0
+    peak = 0
+
+    async def execute(name, arguments):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return {"title": arguments.get("title")}
+
+    calls = [{"name": "add_task", "arguments": {"user_id": 1, "title": t}} for t in "abc"]
+    await agents.execute_plan(calls, execute)
+    assert peak == 3
+
+
+@pytest.mark.asyncio
+async def test_compound_turn(router):
+    """One turn adds two tasks and then lists them"""
+    result = await agents.run_rules_agent(1, "add milk, add eggs and show my pending tasks")
+
+    assert [call["name"] for call in result["tool_calls"]] == ["add_task", "add_task", "list_tasks"]
+    assert "'milk'" in result["response"]
+    assert "'eggs'" in result["response"]
+    assert result["response"].count("(pending)") == 2
+
+
+@pytest.mark.asyncio
+async def test_partial_failure_reported_per_call(router):
+    """A failing call is reported without hiding the calls that worked"""
+    result = await agents.run_rules_agent(1, "add milk and delete task 999")
+
+    add_call, delete_call = result["tool_calls"]
+    assert "error" not in add_call
+    assert "not found" in delete_call["error"]
+    assert "I've added the task 'milk'" in result["response"]
+    assert "Sorry, I encountered an error" in result["response"]
@@ -73,26 +73,26 @@ def test_models_creation():
     """Test that database models can be instantiated"""
     # Test Task model
     task = Task(
-        user_id="test_user",
+        user_id=1,
         title="Test task",
         description="Test description",
         completed=False
     )
-    assert task.user_id == "test_user"
+    assert task.user_id == 1
     assert task.title == "Test task"
     
     # Test Conversation model
-    conversation = Conversation(user_id="test_user")
-    assert conversation.user_id == "test_user"
+    conversation = Conversation(user_id=1)
+    assert conversation.user_id == 1
     
     # Test Message model
     message = Message(
-        user_id="test_user",
+        user_id=1,
         conversation_id=1,
         role="user",
         content="Test message"
     )
-    assert message.user_id == "test_user"
+    assert message.user_id == 1
     assert message.role == "user"
     assert message.content == "Test message"
 
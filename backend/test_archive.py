@@ -0,0 +1,92 @@
+# backend/test_archive.py
+"""
+Test script for the cold-storage message archive
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import SQLModel, Session, select
+
+import archive
+from database import EngineRouter, create_sqlite_engines
+from models import Message, MessageArchive, settings
+
+
+@pytest.fixture
+def router(tmp_path, monkeypatch):
+    """Point the archive module at a temporary database"""
+    reader, writer = create_sqlite_engines(f"sqlite:///{tmp_path / 'test.db'}", settings)
+    SQLModel.metadata.create_all(bind=writer)
+    router = EngineRouter(reader, writer=writer)
+    monkeypatch.setattr(archive, "db_router", router)
+    yield router
+    reader.dispose()
+    writer.dispose()
+
+
+def add_messages(router, conversation_id, count, start=None):
+    start = start or datetime.utcnow() - timedelta(days=count)
+    with Session(router.writer()) as session:
+        for i in range(count):
+            session.add(Message(
+                user_id=1,
+                conversation_id=conversation_id,
+                role="user" if i % 2 == 0 else "assistant",
+                content=f"message {i}",
+                created_at=start + timedelta(days=i),
+            ))
+        session.commit()
+
+
+def test_keep_last_archives_prefix(router):
+    """Everything but the last N messages moves into compressed blocks"""
+    add_messages(router, 1, 50)
+    add_messages(router, 2, 5)
+
+    stats = archive.archive_messages(keep_last=10, batch_size=16)
+
+    assert stats["messages"] == 40
+    assert stats["conversations"] == 1
+    assert stats["blocks"] == 3
+    with Session(router.reader()) as session:
+        assert len(session.exec(select(Message).where(Message.conversation_id == 1)).all()) == 10
+        assert len(session.exec(select(Message).where(Message.conversation_id == 2)).all()) == 5
+        assert len(session.exec(select(MessageArchive)).all()) == 3
+
+
+def test_cutoff_archives_old_messages(router):
+    """Messages older than the cutoff are archived"""
+    add_messages(router, 1, 20, start=datetime.utcnow() - timedelta(days=25))
+
+    stats = archive.archive_messages(cutoff=datetime.utcnow() - timedelta(days=10, hours=12))
+
+    assert stats["messages"] == 15
+
+
+def test_history_readable_after_archive(router):
+    """load_history and load_turns return the same conversation before and after archiving"""
+    add_messages(router, 1, 30)
+    with Session(router.reader()) as session:
+        before = [(m["role"], m["content"]) for m in archive.load_history(session, 1)]
+
+    archive.archive_messages(keep_last=4, batch_size=7)
+
+    with Session(router.reader()) as session:
+        after = [(m["role"], m["content"]) for m in archive.load_history(session, 1)]
+        turns = archive.load_turns(session, 1)
+    assert after == before
+    assert turns == [{"role": role, "content": content} for role, content in before]
+
+
+def test_pass_is_resumable(router):
+    """A second pass after a completed one finds nothing left to move"""
+    add_messages(router, 1, 30)
+    archive.archive_messages(keep_last=5)
+    assert archive.archive_messages(keep_last=5)["messages"] == 0
+
+
+def test_requires_policy():
+    """A pass without a cutoff or keep_last is rejected"""
+    with pytest.raises(ValueError):
+        archive.archive_messages()
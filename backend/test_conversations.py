@@ -0,0 +1,170 @@
+# backend/test_conversations.py
+"""
+Test script for conversation and message browsing
+"""
+
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import insert, text
+from sqlmodel import Session, SQLModel
+
+import archive
+from conversations import list_conversations, page_messages, preview
+from database import EngineRouter, create_sqlite_engines
+from main import app
+from models import Conversation, Message, settings
+
+
+@pytest.fixture
+def router(tmp_path, monkeypatch):
+    """Point the archive module at a temporary database"""
+    reader, writer = create_sqlite_engines(f"sqlite:///{tmp_path / 'test.db'}", settings)
+    SQLModel.metadata.create_all(bind=writer)
+    router = EngineRouter(reader, writer=writer)
+    monkeypatch.setattr(archive, "db_router", router)
+    yield router
+    reader.dispose()
+    writer.dispose()
+
+
+def register(client):
+    name = f"conv_{uuid.uuid4().hex[:12]}"
+    token = client.post("/auth/register", json={
+        "email": f"{name}@example.com", "username": name, "password": "secret123"
+    }).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def add_conversation(writer, user_id, count, start, same_time=False):
+    """A conversation with `count` messages; with same_time they all share one timestamp"""
+    with writer.begin() as conn:
+        conversation_id = conn.execute(insert(Conversation).values(
+            user_id=user_id, message_count=count, last_message_preview=f"message {count - 1}",
+            created_at=start, updated_at=start + timedelta(seconds=0 if same_time else count - 1),
+        )).inserted_primary_key[0]
+        conn.execute(insert(Message), [
+            {"user_id": user_id, "conversation_id": conversation_id, "role": "user" if n % 2 == 0 else "assistant",
+             "content": f"message {n}", "created_at": start + timedelta(seconds=0 if same_time else n)}
+            for n in range(count)
+        ])
+    return conversation_id
+
+
+def all_pages(fetch, key):
+    items, before = [], None
+    while True:
+        page = fetch(before)
+        items.append(page[key])
+        before = page["next"]
+        if before is None:
+            return items
+
+
+def test_chat_keeps_conversation_summary():
+    """Chat turns keep counts, previews and order; other users' conversations are hidden"""
+    with TestClient(app) as client:
+        headers = register(client)
+        first = client.post("/api/chat", json={"message": "add task to buy milk"}, headers=headers).json()
+        client.post("/api/chat", json={"message": "show my tasks", "conversation_id": first["conversation_id"]},
+                    headers=headers)
+        second = client.post("/api/chat", json={"message": "how many tasks"}, headers=headers).json()
+
+        page = client.get("/api/conversations", headers=headers).json()
+        assert [c["id"] for c in page["conversations"]] == [second["conversation_id"], first["conversation_id"]]
+        assert [c["message_count"] for c in page["conversations"]] == [2, 4]
+        assert page["conversations"][0]["last_message_preview"] == preview(second["response"])
+        assert page["next"] is None
+
+        messages = client.get(f"/api/conversations/{first['conversation_id']}/messages", headers=headers).json()
+        assert [m["role"] for m in messages["messages"]] == ["user", "assistant", "user", "assistant"]
+        assert messages["messages"][0]["content"] == "add task to buy milk"
+
+        other = register(client)
+        assert client.get("/api/conversations", headers=other).json()["conversations"] == []
+        assert client.get(f"/api/conversations/{first['conversation_id']}/messages", headers=other).status_code == 404
+        assert client.get("/api/conversations", params={"before": "garbage"}, headers=headers).status_code == 400
+
+
+def test_conversations_keyset_pages(router):
+    """Pages cover every conversation once, most recent first, ties broken by id"""
+    start = datetime(2024, 1, 1)
+    ids = [add_conversation(router.writer(), 1, 3, start + timedelta(hours=n // 2)) for n in range(11)]
+    add_conversation(router.writer(), 2, 3, start)
+
+    with Session(router.reader()) as session:
+        pages = all_pages(lambda before: list_conversations(session, 1, before, 4), "conversations")
+    assert [len(page) for page in pages] == [4, 4, 3]
+    # Two conversations per hour, so every page boundary falls on or next to a tie
+    assert [c["id"] for page in pages for c in page] == [i for _, i in sorted(
+        ((n // 2, i) for n, i in enumerate(ids)), reverse=True
+    )]
+
+
+def test_messages_page_back_into_archive(router):
+    """Paging backwards crosses from hot rows into archived blocks without gaps or repeats"""
+    start = datetime.utcnow() - timedelta(days=1)
+    conversation_id = add_conversation(router.writer(), 1, 30, start)
+    tied = add_conversation(router.writer(), 1, 9, start, same_time=True)
+    archive.archive_messages(keep_last=4, batch_size=7)
+
+    with Session(router.reader()) as session:
+        pages = all_pages(lambda before: page_messages(session, conversation_id, before, 6), "messages")
+        tied_pages = all_pages(lambda before: page_messages(session, tied, before, 2), "messages")
+    assert [m["content"] for m in pages[0]] == [f"message {n}" for n in range(24, 30)]
+    contents = [m["content"] for page in reversed(pages) for m in page]
+    assert contents == [f"message {n}" for n in range(30)]
+    tied_ids = [m["id"] for page in reversed(tied_pages) for m in page]
+    assert tied_ids == sorted(set(tied_ids)) and len(tied_ids) == 9
+
+
+def test_browsing_latency_at_100k_messages(router):
+    """With 100k messages for one user, first and deep pages stay index range scans of a few ms"""
+    writer = router.writer()
+    start = datetime(2024, 1, 1)
+    conversations = 500
+    with writer.begin() as conn:
+        conn.execute(insert(Conversation), [
+            {"id": n + 1, "user_id": 1, "message_count": 200, "last_message_preview": "hi",
+             "created_at": start, "updated_at": start + timedelta(minutes=n)}
+            for n in range(conversations)
+        ])
+        conn.execute(insert(Message), [
+            {"user_id": 1, "conversation_id": n % conversations + 1, "role": "user", "content": f"message {n}",
+             "created_at": start + timedelta(seconds=n)}
+            for n in range(100_000)
+        ])
+
+    def median_ms(func):
+        samples = []
+        for _ in range(20):
+            started = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - started)
+        return statistics.median(samples) * 1e3
+
+    with Session(router.reader()) as session:
+        deep_conversation = list_conversations(session, 1, None, 480)["next"]
+        deep_message = page_messages(session, 1, None, 180)["next"]
+        timings = {
+            "conversations first page": median_ms(lambda: list_conversations(session, 1, None, 50)),
+            "conversations deep page": median_ms(lambda: list_conversations(session, 1, deep_conversation, 50)),
+            "messages first page": median_ms(lambda: page_messages(session, 1, None, 50)),
+            "messages deep page": median_ms(lambda: page_messages(session, 1, deep_message, 50)),
+        }
+        plans = [
+            " ".join(row[-1] for row in session.exec(text(f"EXPLAIN QUERY PLAN {statement}")))
+            for statement in (
+                "SELECT id FROM conversation WHERE user_id = 1 AND (updated_at, id) < ('2024-01-02', 1) "
+                "ORDER BY updated_at DESC, id DESC LIMIT 51",
+                "SELECT id, role, content, created_at FROM message WHERE conversation_id = 1 "
+                "AND (created_at, id) < ('2024-01-02', 1) ORDER BY created_at DESC, id DESC LIMIT 51",
+            )
+        ]
+    assert all(ms < 25 for ms in timings.values()), timings
+    assert "ix_conversation_user_id_updated_at" in plans[0] and "TEMP B-TREE" not in plans[0]
+    assert "ix_message_conversation_id_created_at" in plans[1] and "TEMP B-TREE" not in plans[1]
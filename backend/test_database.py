@@ -0,0 +1,66 @@
+# backend/test_database.py
+"""
+Test script for engine construction and the SQLite performance profile
+"""
+
+import threading
+
+import pytest
+from sqlalchemy import text
+from sqlmodel import SQLModel, Session, select
+
+from database import create_sqlite_engines
+from models import Task, settings
+
+
+@pytest.fixture
+def engines(tmp_path):
+    """Create a tuned reader/writer engine pair on a temporary database"""
+    reader, writer = create_sqlite_engines(f"sqlite:///{tmp_path / 'test.db'}", settings)
+    SQLModel.metadata.create_all(bind=writer)
+    yield reader, writer
+    reader.dispose()
+    writer.dispose()
+
+
+def test_sqlite_pragmas_applied(engines):
+    """Every connection should come up in WAL mode with the tuned pragmas"""
+    reader, writer = engines
+    for engine in (reader, writer):
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == settings.sqlite_busy_timeout_ms
+            assert conn.execute(text("PRAGMA temp_store")).scalar() == 2  # MEMORY
+
+
+def test_single_writer_connection(engines):
+    """The writer engine should never hold more than one connection"""
+    _, writer = engines
+    assert writer.pool.size() == 1
+    assert writer.pool._max_overflow == 0
+
+
+def test_concurrent_writers(engines):
+    """Concurrent writers should all commit without lock errors"""
+    reader, writer = engines
+    errors = []
+
+    def worker(n):
+        for i in range(20):
+            try:
+                with Session(writer) as session:
+                    session.add(Task(user_id=n, title=f"task {i}", seq=i + 1))
+                    session.commit()
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    with Session(reader) as session:
+        assert len(session.exec(select(Task)).all()) == 160
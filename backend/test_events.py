@@ -0,0 +1,92 @@
+# backend/test_events.py
+"""
+Test script for task change notifications
+"""
+
+import asyncio
+import threading
+
+import pytest
+from sqlmodel import SQLModel
+
+import mcp_server
+from database import EngineRouter, create_sqlite_engines
+from events import TaskEventHub
+from mcp_server import AddTaskParams, CompleteTaskParams, MCPServer
+from models import settings
+
+
+@pytest.mark.asyncio
+async def test_events_reach_only_the_users_subscribers():
+    """Subscribers receive their own user's events"""
+    hub = TaskEventHub()
+    mine = hub.subscribe(1)
+    theirs = hub.subscribe(2)
+
+    hub.publish(1, {"op": "add", "task_id": 10})
+
+    assert await asyncio.wait_for(mine.get(), 1) == [{"op": "add", "task_id": 10}]
+    assert not theirs._pending
+
+
+@pytest.mark.asyncio
+async def test_publish_from_worker_thread():
+    """Tools publish from worker threads; events arrive on the event loop"""
+    hub = TaskEventHub()
+    subscription = hub.subscribe(1)
+
+    thread = threading.Thread(target=hub.publish, args=(1, {"op": "delete", "task_id": 3}))
+    thread.start()
+    thread.join()
+
+    assert await asyncio.wait_for(subscription.get(), 1) == [{"op": "delete", "task_id": 3}]
+
+
+@pytest.mark.asyncio
+async def test_slow_consumer_coalesces_then_resyncs():
+    """Repeated changes to one task coalesce; overflow becomes a resync"""
+    hub = TaskEventHub(max_pending=3)
+    subscription = hub.subscribe(1)
+
+    for op in ("add", "update", "complete"):
+        hub.publish(1, {"op": op, "task_id": 1})
+    assert await subscription.get() == [{"op": "complete", "task_id": 1}]
+
+    for task_id in range(10):
+        hub.publish(1, {"op": "add", "task_id": task_id})
+    assert await subscription.get() == [{"op": "resync"}]
+
+
+@pytest.mark.asyncio
+async def test_unsubscribed_users_cost_nothing():
+    """Publishing with no subscribers is a no-op"""
+    hub = TaskEventHub()
+    subscription = hub.subscribe(1)
+    hub.unsubscribe(subscription)
+    hub.publish(1, {"op": "add", "task_id": 1})
+    assert hub.subscriber_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_mutating_tools_publish(tmp_path, monkeypatch):
+    """add_task and complete_task publish deltas for the user"""
+    reader, writer = create_sqlite_engines(f"sqlite:///{tmp_path / 'test.db'}", settings)
+    SQLModel.metadata.create_all(bind=writer)
+    monkeypatch.setattr(mcp_server, "db_router", EngineRouter(reader, writer=writer))
+    hub = TaskEventHub()
+    monkeypatch.setattr(mcp_server, "task_events", hub)
+    subscription = hub.subscribe(7)
+
+    server = MCPServer()
+    created = await server.add_task(AddTaskParams(user_id=7, title="buy milk"))
+    await server.complete_task(CompleteTaskParams(user_id=7, task_id=created["task_id"]))
+
+    events = await asyncio.wait_for(subscription.get(), 1)
+    assert events == [{
+        "op": "complete",
+        "task_id": created["task_id"],
+        "seq": 2,
+        "task": {"id": created["task_id"], "title": "buy milk", "completed": True},
+    }]
+    reader.dispose()
+    writer.dispose()
@@ -0,0 +1,233 @@
+# backend/test_idempotency.py
+"""
+Test script for idempotency keys on chat turns and task mutations
+"""
+
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, select
+
+import idempotency
+import mcp_server
+from database import EngineRouter, create_sqlite_engines
+from idempotency import IdempotencyConflict, IdempotencyStore
+from main import app
+from mcp_server import AddTaskParams, DeleteTaskParams, MCPServer
+from models import IdempotencyRecord, Task, settings
+
+
+@pytest.fixture
+def router(tmp_path, monkeypatch):
+    """Point the store and the tools at a temporary database"""
+    reader, writer = create_sqlite_engines(f"sqlite:///{tmp_path / 'test.db'}", settings)
+    SQLModel.metadata.create_all(bind=writer)
+    db_router = EngineRouter(reader, writer=writer)
+    monkeypatch.setattr(idempotency, "db_router", db_router)
+    monkeypatch.setattr(mcp_server, "db_router", db_router)
+    monkeypatch.setattr(mcp_server, "idempotency_store", IdempotencyStore())
+    yield db_router
+    reader.dispose()
+    writer.dispose()
+
+
+@pytest.mark.asyncio
+async def test_retry_returns_stored_result(router):
+    """The second call with the same key does not run the function"""
+    store = IdempotencyStore()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        return {"n": len(calls)}
+
+    assert await store.run("chat", 1, "k1", {"message": "hi"}, work) == {"n": 1}
+    assert await store.run("chat", 1, "k1", {"message": "hi"}, work) == {"n": 1}
+    # A fresh store (another worker) reads the result from the table
+    assert await IdempotencyStore().run("chat", 1, "k1", {"message": "hi"}, work) == {"n": 1}
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicates_wait_for_first(router):
+    """Duplicates sent while the first attempt runs share its result"""
+    store = IdempotencyStore()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"ok": True}
+
+    results = await asyncio.gather(*(store.run("chat", 1, "k", {}, work) for _ in range(5)))
+    assert results == [{"ok": True}] * 5
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_other_worker_waits_for_pending_row(router):
+    """A worker that finds a pending row polls until the result is stored"""
+    first, second = IdempotencyStore(), IdempotencyStore()
+
+    async def slow():
+        await asyncio.sleep(0.2)
+        return {"from": "first"}
+
+    async def never():
+        raise AssertionError("duplicate ran")
+
+    task = asyncio.create_task(first.run("chat", 1, "k", {}, slow))
+    await asyncio.sleep(0.05)
+    assert await second.run("chat", 1, "k", {}, never) == {"from": "first"}
+    assert await task == {"from": "first"}
+
+
+@pytest.mark.asyncio
+async def test_key_reused_for_different_request(router):
+    """Reusing a key with a different request body is a conflict"""
+    store = IdempotencyStore()
+
+    async def work():
+        return {}
+
+    await store.run("chat", 1, "k", {"message": "a"}, work)
+    with pytest.raises(IdempotencyConflict):
+        await store.run("chat", 1, "k", {"message": "b"}, work)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicate_with_different_request(router):
+    """A key reused with a different body while the first attempt runs is a conflict, not its result"""
+    store = IdempotencyStore()
+
+    async def slow():
+        await asyncio.sleep(0.1)
+        return {"message": "a"}
+
+    first = asyncio.create_task(store.run("chat", 1, "k", {"message": "a"}, slow))
+    await asyncio.sleep(0.02)
+    with pytest.raises(IdempotencyConflict):
+        await store.run("chat", 1, "k", {"message": "b"}, slow)
+    assert await first == {"message": "a"}
+
+
+@pytest.mark.asyncio
+async def test_long_attempt_keeps_its_claim(router):
+    """An attempt running past the pending timeout is not run again by another worker"""
+    first, second = IdempotencyStore(pending_timeout_seconds=0.15), IdempotencyStore(pending_timeout_seconds=0.15)
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.5)
+        return {"from": "first"}
+
+    task = asyncio.create_task(first.run("chat", 1, "k", {}, slow))
+    await asyncio.sleep(0.05)
+    # Waits past the pending timeout, since the claim keeps being extended
+    assert await second.run("chat", 1, "k", {}, slow) == {"from": "first"}
+    assert await task == {"from": "first"}
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_lapsed_claim_stops_the_wait(router):
+    """A duplicate waiting on a worker that died gives up once its claim lapses; a retry then runs"""
+    with Session(router.writer()) as session:
+        session.add(IdempotencyRecord(key="chat:1:k", user_id=1, fingerprint=idempotency.fingerprint({}),
+                                      status="pending", expires_at=datetime.utcnow() + timedelta(seconds=0.2)))
+        session.commit()
+    store = IdempotencyStore()
+
+    async def work():
+        return {"ran": True}
+
+    with pytest.raises(IdempotencyConflict, match="did not finish"):
+        await store.run("chat", 1, "k", {}, work)
+    assert await store.run("chat", 1, "k", {}, work) == {"ran": True}
+
+
+@pytest.mark.asyncio
+async def test_failure_releases_key(router):
+    """A failed attempt leaves no record, so a retry runs again"""
+    store = IdempotencyStore()
+
+    async def fail():
+        raise ValueError("boom")
+
+    async def work():
+        return {"ok": True}
+
+    with pytest.raises(ValueError):
+        await store.run("chat", 1, "k", {}, fail)
+    assert await store.run("chat", 1, "k", {}, work) == {"ok": True}
+
+
+@pytest.mark.asyncio
+async def test_expired_records_are_purged(router):
+    """Records past their TTL are deleted and the key can be reused"""
+    store = IdempotencyStore(ttl_seconds=-1)
+
+    async def work():
+        return {"ok": True}
+
+    await store.run("chat", 1, "k", {}, work)
+    assert store.purge_expired() == 1
+    with Session(router.reader()) as session:
+        assert session.exec(select(IdempotencyRecord)).all() == []
+
+
+@pytest.mark.asyncio
+async def test_retried_add_task_creates_one_task(router):
+    """add_task with the same idempotency token inserts a single row"""
+    server = MCPServer()
+    params = AddTaskParams(user_id=1, title="buy milk", idempotency_key="add-1")
+
+    first = await server.add_task(params)
+    second = await server.add_task(params)
+
+    assert first == second
+    with Session(router.reader()) as session:
+        assert len(session.exec(select(Task)).all()) == 1
+
+
+@pytest.mark.asyncio
+async def test_retried_delete_returns_first_result(router):
+    """A retried delete reports the original success rather than 'not found'"""
+    server = MCPServer()
+    created = await server.add_task(AddTaskParams(user_id=1, title="walk the dog"))
+    params = DeleteTaskParams(user_id=1, task_id=created["task_id"], idempotency_key="del-1")
+
+    assert (await server.delete_task(params))["status"] == "deleted"
+    assert (await server.delete_task(params))["status"] == "deleted"
+
+
+def test_tool_schemas_hide_idempotency_key():
+    """The model never sees the idempotency token"""
+    for definition in MCPServer().tool_definitions():
+        assert "idempotency_key" not in definition["function"]["parameters"]["properties"]
+
+
+def test_chat_idempotency_key_header():
+    """POST /api/chat retried with the same key returns the first turn"""
+    with TestClient(app) as client:
+        name = f"idem_{uuid.uuid4().hex[:12]}"
+        token = client.post("/auth/register", json={
+            "email": f"{name}@example.com", "username": name, "password": "secret123"
+        }).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": uuid.uuid4().hex}
+
+        first = client.post("/api/chat", json={"message": "add task to buy milk"}, headers=headers)
+        second = client.post("/api/chat", json={"message": "add task to buy milk"}, headers=headers)
+        assert first.status_code == second.status_code == 200
+        assert first.json() == second.json()
+
+        reused = client.post("/api/chat", json={"message": "add task to buy eggs"}, headers=headers)
+        assert reused.status_code == 409
+
+        listed = client.post("/api/chat", json={"message": "show my tasks"},
+                             headers={"Authorization": headers["Authorization"]})
+        assert listed.json()["response"].count("buy milk") == 1
@@ -0,0 +1,151 @@
+# backend/test_llm.py
+"""
+Test script for the LLM agent backend against a local fake
+OpenAI-compatible server that returns tool calls
+"""
+
+import json
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from unittest.mock import AsyncMock
+
+import agents
+from llm import LLMClient, LLMError
+from mcp_server import ToolResult
+
+
+def fake_openai_server(failures_before_success: int = 0):
+    """A fake /chat/completions that asks for add_task, then answers"""
+    app = FastAPI()
+    app.state.requests = []
+    app.state.failures = failures_before_success
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests.append(body)
+        if app.state.failures > 0:
+            app.state.failures -= 1
+            return JSONResponse({"error": "overloaded"}, status_code=503)
+
+        if body["messages"][-1]["role"] == "tool":
+            message = {"role": "assistant", "content": "Added 'buy milk' to your list."}
+        else:
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": "call_1",
+                    "type": "function",
+                    "function": {"name": "add_task", "arguments": json.dumps({"title": "buy milk", "user_id": 999})},
+                }],
+            }
+        return {"choices": [{"index": 0, "message": message, "finish_reason": "stop"}]}
+
+    return app
+
+
+def make_client(app, **kwargs):
+    return LLMClient(
+        "http://fake-llm/v1", "test-key", "test-model",
+        transport=httpx.ASGITransport(app=app), backoff_base=0.001, **kwargs
+    )
+
+
+@pytest.mark.asyncio
+async def test_llm_agent_dispatches_tool_calls(monkeypatch):
+    """Tool calls from the model are executed as the authenticated user"""
+    app = fake_openai_server()
+    client = make_client(app)
+    execute_tool = AsyncMock(return_value=ToolResult(
+        tool_name="add_task", output={"task_id": 1, "status": "created", "title": "buy milk"}
+    ))
+    monkeypatch.setattr(agents, "get_llm_client", lambda settings: client)
+    monkeypatch.setattr(agents.mcp_server_instance, "execute_tool", execute_tool)
+    monkeypatch.setattr(agents.mcp_server_instance, "list_tasks", AsyncMock(return_value=[
+        {"id": 7, "title": "call mom", "completed": False}
+    ]))
+
+    result = await agents.run_llm_agent(42, [{"role": "user", "content": "add buy milk"}])
+
+    assert result["response"] == "Added 'buy milk' to your list."
+    execute_tool.assert_awaited_once_with("add_task", {"title": "buy milk", "user_id": 42})
+    assert result["tool_calls"] == [{"name": "add_task", "arguments": {"title": "buy milk", "user_id": 42}}]
+    # The current task list is in the system prompt in compact form
+    assert "7|0|call mom" in app.state.requests[0]["messages"][0]["content"]
+    # The tool definitions are sent with every request and never expose user_id
+    tools = app.state.requests[0]["tools"]
+    assert all("user_id" not in t["function"]["parameters"]["properties"] for t in tools)
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_llm_client_retries_transient_errors():
+    """503 responses are retried until the model answers"""
+    app = fake_openai_server(failures_before_success=2)
+    client = make_client(app, max_retries=3)
+
+    message = await client.chat_completion([{"role": "user", "content": "hi"}])
+
+    assert message["tool_calls"][0]["function"]["name"] == "add_task"
+    assert len(app.state.requests) == 3
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_llm_client_gives_up_after_retries():
+    """Persistent failures surface as LLMError"""
+    app = fake_openai_server(failures_before_success=10)
+    client = make_client(app, max_retries=1)
+
+    with pytest.raises(LLMError):
+        await client.chat_completion([{"role": "user", "content": "hi"}])
+    assert len(app.state.requests) == 2
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_llm_client_rejects_malformed_responses():
+    """A 200 response without choices surfaces as LLMError"""
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions():
+        return {"error": "no choices"}
+
+    client = make_client(app)
+    with pytest.raises(LLMError):
+        await client.chat_completion([{"role": "user", "content": "hi"}])
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_llm_agent_rejects_non_object_arguments(monkeypatch):
+    """Tool arguments that are not an object fail that call only"""
+    reply = {
+        "role": "assistant",
+        "content": None,
+        "tool_calls": [
+            {"id": "call_1", "type": "function", "function": {"name": "add_task", "arguments": "[\"milk\"]"}},
+            {"id": "call_2", "type": "function", "function": {"name": "add_task", "arguments": "{\"title\": \"eggs\"}"}},
+        ],
+    }
+    client = AsyncMock()
+    client.chat_completion.side_effect = [reply, {"role": "assistant", "content": "Added eggs."}]
+    execute_tool = AsyncMock(return_value=ToolResult(
+        tool_name="add_task", output={"task_id": 2, "status": "created", "title": "eggs"}
+    ))
+    monkeypatch.setattr(agents, "get_llm_client", lambda settings: client)
+    monkeypatch.setattr(agents.mcp_server_instance, "execute_tool", execute_tool)
+    monkeypatch.setattr(agents.mcp_server_instance, "list_tasks", AsyncMock(return_value=[]))
+
+    result = await agents.run_llm_agent(42, [{"role": "user", "content": "add milk and eggs"}])
+
+    assert result["response"] == "Added eggs."
+    execute_tool.assert_awaited_once_with("add_task", {"title": "eggs", "user_id": 42})
+    assert result["tool_calls"][0]["error"] == "Tool arguments must be a JSON object"
+    tool_messages = [m for m in client.chat_completion.await_args.args[0] if m["role"] == "tool"]
+    assert [m["tool_call_id"] for m in tool_messages] == ["call_1", "call_2"]
@@ -0,0 +1,203 @@
+# backend/test_mcp_client.py
+"""
+Test script for the pooled WebSocket client of a remote MCP server
+"""
+
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+import uvicorn
+from sqlmodel import SQLModel
+
+import agents
+import mcp_server
+from agent_cache import task_versions
+from database import EngineRouter, create_sqlite_engines
+from mcp_client import CircuitBreaker, MCPClientPool, MCPUnavailable
+from models import settings
+
+
+class LocalServer:
+    """mcp_server.app served by uvicorn on a local port, in a background thread"""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        self.server = uvicorn.Server(uvicorn.Config(mcp_server.app, host="127.0.0.1", port=self.port,
+                                                    log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.02)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """A running MCP server on a temporary database, with a "slow" tool that sleeps"""
+    reader, writer = create_sqlite_engines(f"sqlite:///{tmp_path / 'test.db'}", settings)
+    SQLModel.metadata.create_all(bind=writer)
+    monkeypatch.setattr(mcp_server, "db_router", EngineRouter(reader, writer=writer))
+
+    execute_tool = mcp_server.mcp_server.execute_tool
+
+    async def with_slow_tool(tool_name, params):
+        if tool_name == "slow":
+            await asyncio.sleep(params["seconds"])
+            return mcp_server.ToolResult(tool_name=tool_name, output={"slept": params["seconds"]})
+        return await execute_tool(tool_name, params)
+
+    monkeypatch.setattr(mcp_server.mcp_server, "execute_tool", with_slow_tool)
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    local = LocalServer(port)
+    local.start()
+    yield local
+    if not local.server.should_exit:
+        local.stop()
+    reader.dispose()
+    writer.dispose()
+
+
+def make_pool(server, **options):
+    options = {"size": 2, "call_timeout_seconds": 2.0, "reconnect_min_seconds": 0.05,
+               "reconnect_max_seconds": 0.2, **options}
+    return MCPClientPool(f"ws://127.0.0.1:{server.port}/ws", **options)
+
+
+def test_concurrent_calls_share_pooled_connections(server):
+    """Concurrent calls are multiplexed over the pool's connections and each gets its own answer"""
+    async def go():
+        pool = make_pool(server)
+        try:
+            added = await asyncio.gather(*[
+                pool.call("add_task", {"user_id": 1, "title": f"task {n}"}) for n in range(30)
+            ])
+            listed = await pool.call("list_tasks", {"user_id": 1})
+            return added, listed, pool.open_connections
+        finally:
+            await pool.close()
+
+    added, listed, open_connections = asyncio.run(go())
+    assert [response["result"]["title"] for response in added] == [f"task {n}" for n in range(30)]
+    assert len({response["id"] for response in added}) == 30
+    assert sorted(task["title"] for task in listed["result"]) == sorted(f"task {n}" for n in range(30))
+    assert open_connections == 2
+
+
+def test_slow_call_times_out_without_blocking_others(server):
+    """On one connection a slow call does not hold back a fast one, and gives up at the timeout"""
+    async def go():
+        pool = make_pool(server, size=1, call_timeout_seconds=0.3)
+        try:
+            slow = asyncio.create_task(pool.call("slow", {"seconds": 1.0}))
+            await asyncio.sleep(0.05)
+            started = time.perf_counter()
+            fast = await pool.call("list_tasks", {"user_id": 1})
+            fast_seconds = time.perf_counter() - started
+            with pytest.raises(MCPUnavailable):
+                await slow
+            return fast, fast_seconds
+        finally:
+            await pool.close()
+
+    fast, fast_seconds = asyncio.run(go())
+    assert fast["result"] == [] and fast_seconds < 0.2
+
+
+def test_circuit_opens_on_timeouts_and_recovers(server):
+    """Repeated timeouts open the circuit so calls fail fast; a trial call after the reset closes it"""
+    async def go():
+        pool = make_pool(server, call_timeout_seconds=0.1, breaker_failures=2, breaker_reset_seconds=0.3)
+        try:
+            for _ in range(2):
+                with pytest.raises(MCPUnavailable):
+                    await pool.call("slow", {"seconds": 0.5})
+            assert pool.breaker.state == "open"
+
+            started = time.perf_counter()
+            with pytest.raises(MCPUnavailable, match="circuit open"):
+                await pool.call("list_tasks", {"user_id": 1})
+            assert time.perf_counter() - started < 0.01
+
+            await asyncio.sleep(0.3)
+            assert (await pool.call("list_tasks", {"user_id": 1}))["error"] is None
+            assert pool.breaker.state == "closed"
+        finally:
+            await pool.close()
+
+    asyncio.run(go())
+
+
+def test_half_open_circuit_lets_one_trial_through():
+    """While half open only one call is let through, and a failed trial re-opens the circuit"""
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=10, clock=lambda: now[0])
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] = 10
+    assert breaker.state == "half-open"
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    now[0] = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow() and breaker.allow()
+
+
+def test_pool_reconnects_after_server_restart(server):
+    """Calls fail while the server is down and succeed again once it is back"""
+    async def go():
+        pool = make_pool(server, call_timeout_seconds=0.5, breaker_failures=100)
+        try:
+            assert (await pool.call("list_tasks", {"user_id": 1}))["error"] is None
+            await asyncio.to_thread(server.stop)
+            with pytest.raises(MCPUnavailable):
+                await pool.call("list_tasks", {"user_id": 1})
+
+            await asyncio.to_thread(server.start)
+            for _ in range(20):
+                try:
+                    return await pool.call("list_tasks", {"user_id": 1})
+                except MCPUnavailable:
+                    await asyncio.sleep(0.1)
+        finally:
+            await pool.close()
+
+    assert asyncio.run(go())["error"] is None
+
+
+def test_agent_calls_remote_server(server, monkeypatch):
+    """With a pool configured the agent's tool calls go over it, and writes still invalidate cached turns"""
+    async def go():
+        pool = make_pool(server)
+        monkeypatch.setattr(agents, "mcp_pool", pool)
+        try:
+            version = task_versions.get(1)
+            added = await agents.run_rules_agent(1, "add task buy milk")
+            bumped = task_versions.get(1) > version
+            listed = await agents.run_rules_agent(1, "show my tasks")
+            return added, bumped, listed
+        finally:
+            await pool.close()
+
+    added, bumped, listed = asyncio.run(go())
+    assert added["tool_calls"] == [{"name": "add_task", "arguments": {"user_id": 1, "title": "buy milk"}}]
+    assert bumped
+    assert "buy milk" in listed["response"]
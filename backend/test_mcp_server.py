@@ -7,7 +7,13 @@ import pytest
 import asyncio
 from unittest import mock
 from unittest.mock import AsyncMock, MagicMock
-from mcp_server import MCPServer, AddTaskParams, ListTasksParams, CompleteTaskParams, DeleteTaskParams, UpdateTaskParams
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel
+import mcp_server as mcp_server_module
+from database import EngineRouter, create_sqlite_engines
+from mcp_server import (MCPServer, AddTaskParams, ListTasksParams, CompleteTaskParams, DeleteTaskParams,
+                        GetTaskStatsParams, UpdateTaskParams)
+from models import Task, TaskSequence, settings
 
 
 @pytest.fixture
@@ -16,11 +22,23 @@ def mcp_server():
     return MCPServer()
 
 
+@pytest.fixture
+def router(tmp_path, monkeypatch):
+    """Point the tools at a temporary database"""
+    reader, writer = create_sqlite_engines(f"sqlite:///{tmp_path / 'test.db'}", settings)
+    SQLModel.metadata.create_all(bind=writer)
+    db_router = EngineRouter(reader, writer=writer)
+    monkeypatch.setattr(mcp_server_module, "db_router", db_router)
+    yield db_router
+    reader.dispose()
+    writer.dispose()
+
+
 @pytest.mark.asyncio
 async def test_add_task(mcp_server):
     """Test the add_task functionality"""
     params = AddTaskParams(
-        user_id="test_user",
+        user_id=1,
         title="Test task",
         description="Test description"
     )
@@ -48,7 +66,7 @@ async def test_add_task(mcp_server):
 async def test_list_tasks(mcp_server):
     """Test the list_tasks functionality"""
     params = ListTasksParams(
-        user_id="test_user",
+        user_id=1,
         status="all"
     )
 
@@ -68,86 +86,109 @@ async def test_list_tasks(mcp_server):
         assert len(result) >= 0  # May be empty depending on mock data
 
 
+async def add(server, title, user_id=1):
+    return (await server.add_task(AddTaskParams(user_id=user_id, title=title)))["task_id"]
+
+
 @pytest.mark.asyncio
-async def test_complete_task(mcp_server):
+async def test_complete_task(mcp_server, router):
     """Test the complete_task functionality"""
-    params = CompleteTaskParams(
-        user_id="test_user",
-        task_id=1
-    )
-
-    # Mock the database session
-    with mock.patch('mcp_server.Session') as mock_session:
-        mock_session_instance = MagicMock()
-        mock_session.return_value.__enter__.return_value = mock_session_instance
-        mock_task = MagicMock()
-        mock_task.id = 1
-        mock_task.title = "Test task"
-        mock_task.completed = False
-        mock_session_instance.get.return_value = mock_task
-        mock_session_instance.add.return_value = None
-        mock_session_instance.commit.return_value = None
-        mock_session_instance.refresh.return_value = None
+    task_id = await add(mcp_server, "Test task")
 
-        result = await mcp_server.complete_task(params)
+    result = await mcp_server.complete_task(CompleteTaskParams(user_id=1, task_id=task_id))
 
-        assert result["status"] == "completed"
-        assert result["title"] == "Test task"
-        assert result["task_id"] == 1
+    assert result == {"task_id": task_id, "status": "completed", "title": "Test task", "version": 1}
+    # Completing it again changes no counts
+    assert (await mcp_server.complete_task(CompleteTaskParams(user_id=1, task_id=task_id)))["version"] == 2
+    stats = await mcp_server.get_task_stats(GetTaskStatsParams(user_id=1))
+    assert stats == {"total": 1, "pending": 0, "completed": 1, "completed_today": 1}
+    assert "not found" in (await mcp_server.complete_task(CompleteTaskParams(user_id=2, task_id=task_id)))["error"]
 
 
 @pytest.mark.asyncio
-async def test_delete_task(mcp_server):
+async def test_delete_task(mcp_server, router):
     """Test the delete_task functionality"""
-    params = DeleteTaskParams(
-        user_id="test_user",
-        task_id=1
-    )
+    task_id = await add(mcp_server, "Test task")
+    await add(mcp_server, "Other task")
+    await mcp_server.complete_task(CompleteTaskParams(user_id=1, task_id=task_id))
 
-    # Mock the database session
-    with mock.patch('mcp_server.Session') as mock_session:
-        mock_session_instance = MagicMock()
-        mock_session.return_value.__enter__.return_value = mock_session_instance
-        mock_task = MagicMock()
-        mock_task.id = 1
-        mock_task.title = "Test task"
-        mock_session_instance.get.return_value = mock_task
-        mock_session_instance.delete.return_value = None
-        mock_session_instance.commit.return_value = None
+    result = await mcp_server.delete_task(DeleteTaskParams(user_id=1, task_id=task_id))
 
-        result = await mcp_server.delete_task(params)
-
-        assert result["status"] == "deleted"
-        assert result["title"] == "Test task"
-        assert result["task_id"] == 1
+    assert result == {"task_id": task_id, "status": "deleted", "title": "Test task", "version": 2}
+    stats = await mcp_server.get_task_stats(GetTaskStatsParams(user_id=1))
+    assert stats == {"total": 1, "pending": 1, "completed": 0, "completed_today": 0}
+    assert "not found" in (await mcp_server.delete_task(DeleteTaskParams(user_id=1, task_id=task_id)))["error"]
+    with Session(router.reader()) as session:
+        tombstone = session.get(Task, task_id)
+    assert (tombstone.deleted, tombstone.title) == (True, "")
 
 
 @pytest.mark.asyncio
-async def test_update_task(mcp_server):
+async def test_update_task(mcp_server, router):
     """Test the update_task functionality"""
-    params = UpdateTaskParams(
-        user_id="test_user",
-        task_id=1,
-        title="Updated task title"
+    task_id = await add(mcp_server, "Test task")
+
+    result = await mcp_server.update_task(UpdateTaskParams(user_id=1, task_id=task_id, title="Updated task title"))
+
+    assert result == {"task_id": task_id, "status": "updated", "title": "Updated task title", "version": 1}
+    assert "not found" in (await mcp_server.update_task(UpdateTaskParams(user_id=2, task_id=task_id, title="x")))["error"]
+
+
+@pytest.mark.asyncio
+async def test_stale_version_is_a_conflict(mcp_server, router):
+    """A change against an older version fails with the current one and leaves the task and counters alone"""
+    task_id = await add(mcp_server, "Test task")
+    first = await mcp_server.update_task(UpdateTaskParams(user_id=1, task_id=task_id, title="mine", expected_version=0))
+    assert first["version"] == 1
+
+    for call in (
+        mcp_server.update_task(UpdateTaskParams(user_id=1, task_id=task_id, title="theirs", expected_version=0)),
+        mcp_server.complete_task(CompleteTaskParams(user_id=1, task_id=task_id, expected_version=0)),
+        mcp_server.delete_task(DeleteTaskParams(user_id=1, task_id=task_id, expected_version=0)),
+    ):
+        result = await call
+        assert (result["conflict"], result["task_id"], result["version"]) == (True, task_id, 1)
+
+    with Session(router.reader()) as session:
+        task = session.get(Task, task_id)
+        sequence = session.get(TaskSequence, 1)
+    assert (task.title, task.completed, task.deleted, task.version) == ("mine", False, False, 1)
+    assert (sequence.last_seq, sequence.total, sequence.completed) == (2, 1, 0)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_edits_are_not_lost(mcp_server, router):
+    """Concurrent changes of one task each take effect once, in a single sequence"""
+    task_id = await add(mcp_server, "Test task")
+
+    await asyncio.gather(
+        *(mcp_server.update_task(UpdateTaskParams(user_id=1, task_id=task_id, description=f"note {n}"))
+          for n in range(10)),
+        mcp_server.complete_task(CompleteTaskParams(user_id=1, task_id=task_id)),
+        mcp_server.complete_task(CompleteTaskParams(user_id=1, task_id=task_id)),
     )
 
-    # Mock the database session
-    with mock.patch('mcp_server.Session') as mock_session:
-        mock_session_instance = MagicMock()
-        mock_session.return_value.__enter__.return_value = mock_session_instance
-        mock_task = MagicMock()
-        mock_task.id = 1
-        mock_task.title = "Updated task title"
-        mock_session_instance.get.return_value = mock_task
-        mock_session_instance.add.return_value = None
-        mock_session_instance.commit.return_value = None
-        mock_session_instance.refresh.return_value = None
+    with Session(router.reader()) as session:
+        task = session.get(Task, task_id)
+        sequence = session.get(TaskSequence, 1)
+    assert (task.completed, task.version, task.seq) == (True, 12, 13)
+    assert (sequence.last_seq, sequence.completed, sequence.completed_today) == (13, 1, 1)
 
-        result = await mcp_server.update_task(params)
 
-        assert result["status"] == "updated"
-        assert result["title"] == "Updated task title"
-        assert result["task_id"] == 1
+@pytest.mark.asyncio
+async def test_mutation_round_trips(mcp_server, router):
+    """Each task change is the counter UPDATE, the task UPDATE ... RETURNING and the commit"""
+    task_id = await add(mcp_server, "Test task")
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement.split()[0])
+    event.listen(router.writer_engine, "before_cursor_execute", listener)
+    try:
+        await mcp_server.update_task(UpdateTaskParams(user_id=1, task_id=task_id, title="renamed"))
+        await mcp_server.complete_task(CompleteTaskParams(user_id=1, task_id=task_id))
+        await mcp_server.delete_task(DeleteTaskParams(user_id=1, task_id=task_id))
+    finally:
+        event.remove(router.writer_engine, "before_cursor_execute", listener)
+    assert statements == ["UPDATE", "UPDATE"] * 3
 
 
 @pytest.mark.asyncio
@@ -155,7 +196,7 @@ async def test_execute_tool(mcp_server):
     """Test the execute_tool functionality"""
     # Test valid tool
     result = await mcp_server.execute_tool("add_task", {
-        "user_id": "test_user",
+        "user_id": 1,
         "title": "Test task"
     })
 
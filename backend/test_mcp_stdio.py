@@ -0,0 +1,96 @@
+# backend/test_mcp_stdio.py
+"""
+Test script for the MCP stdio transport
+"""
+
+import asyncio
+import json
+import os
+
+from sqlmodel import Session, SQLModel
+
+import mcp_stdio
+from database import create_sqlite_engines
+from mcp_stdio import StdioMCPClient, serve
+from models import User, settings
+
+
+class CollectingWriter:
+    """Stands in for the stdout StreamWriter"""
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, data: bytes):
+        self.lines.extend(json.loads(line) for line in data.splitlines())
+
+    async def drain(self):
+        pass
+
+
+def run_serve(payload: bytes, limit: int = 64 * 1024, max_in_flight: int = 8):
+    async def go():
+        reader = asyncio.StreamReader(limit=limit)
+        reader.feed_data(payload)
+        reader.feed_eof()
+        writer = CollectingWriter()
+        await serve(reader, writer, max_in_flight)
+        return writer.lines
+
+    return asyncio.run(go())
+
+
+def test_child_process_round_trip(tmp_path):
+    """A child process serves tool calls over its pipes, concurrently, and survives bad input"""
+    url = f"sqlite:///{tmp_path / 'stdio.db'}"
+    reader, writer = create_sqlite_engines(url, settings)
+    SQLModel.metadata.create_all(bind=writer)
+    with Session(writer) as session:
+        session.add(User(email="stdio@example.com", username="stdio", hashed_password="x"))
+        session.commit()
+    reader.dispose()
+    writer.dispose()
+
+    async def go():
+        async with StdioMCPClient(env={**os.environ, "DATABASE_URL": url}) as client:
+            added = await client.call("add_task", {"user_id": 1, "title": "buy milk"})
+            client._process.stdin.write(b"not json\n")
+            listed = await asyncio.gather(*[client.call("list_tasks", {"user_id": 1}) for _ in range(10)])
+            missing = await client.call("no_such_tool", {})
+        return added, listed, missing
+
+    added, listed, missing = asyncio.run(go())
+    assert added["error"] is None and added["result"]["title"] == "buy milk"
+    assert all(response["result"] == [{"id": added["result"]["task_id"], "title": "buy milk", "completed": False}]
+               for response in listed)
+    assert len({response["id"] for response in listed}) == 10
+    assert missing["error"] is not None
+
+
+def test_requests_run_concurrently(monkeypatch):
+    """A slow call does not hold back the calls after it; responses come back as they finish"""
+    async def handle_request(request):
+        await asyncio.sleep(request["params"]["sleep"])
+        return {"id": request["id"], "result": request["params"]["sleep"], "error": None}
+
+    monkeypatch.setattr(mcp_stdio, "handle_request", handle_request)
+    payload = b"".join(
+        json.dumps({"id": n, "method": "sleep", "params": {"sleep": sleep}}).encode() + b"\n"
+        for n, sleep in enumerate([0.2, 0.0, 0.1])
+    )
+    assert [response["id"] for response in run_serve(payload)] == [1, 2, 0]
+
+
+def test_bad_lines_are_answered_and_skipped():
+    """Invalid JSON, oversized lines and malformed requests get errors without ending the stream"""
+    good = json.dumps({"id": 7, "method": "no_such_tool", "params": {}}).encode()
+    payload = b"{oops\n" + b"x" * 300 + b"\n\n[1, 2]\n" + json.dumps({"id": 3}).encode() + b"\n" + good
+    responses = run_serve(payload, limit=256)
+    assert [(response["id"], response["error"]["message"]) for response in responses[:4]] == [
+        (None, "Invalid JSON"),
+        (None, "Request line too long"),
+        (None, "Invalid request format"),
+        (3, "Invalid request format"),
+    ]
+    # The last line has no newline and is still answered
+    assert responses[4]["id"] == 7 and "not found" in responses[4]["error"]["message"]
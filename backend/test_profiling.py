@@ -0,0 +1,121 @@
+# backend/test_profiling.py
+"""
+Test script for opt-in per-request profiling
+"""
+
+import asyncio
+import os
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+import profiling
+from profiling import ProfilerMiddleware, rotate_profiles, to_thread
+
+
+def spin_in_thread(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def spin_on_loop(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def create_app(directory):
+    app = FastAPI()
+
+    @app.get("/profiled")
+    async def profiled():
+        await to_thread(spin_in_thread, 0.1)
+        # Child tasks of the request are sampled as well
+        await asyncio.gather(asyncio.sleep(0.05), asyncio.to_thread(time.sleep, 0.01))
+        spin_on_loop(0.1)
+        return {"ok": True}
+
+    @app.get("/other")
+    async def other():
+        await asyncio.sleep(0.01)
+        spin_on_loop(0.15)
+        return {"ok": True}
+
+    app.add_middleware(ProfilerMiddleware, token="secret", directory=str(directory), interval=0.002)
+    return app
+
+
+def client(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def read_profile(directory):
+    (name,) = os.listdir(directory)
+    with open(os.path.join(directory, name)) as f:
+        return name, f.read()
+
+
+@pytest.mark.asyncio
+async def test_profile_written_for_token(tmp_path):
+    """A request with the token gets a folded-stack profile covering loop and worker threads"""
+    async with client(create_app(tmp_path)) as http:
+        response = await http.get("/profiled", headers={"X-Profile-Token": "secret"})
+
+    assert response.status_code == 200
+    name, folded = read_profile(tmp_path)
+    assert name == f"{response.headers['x-profile-id']}.folded"
+    lines = folded.splitlines()
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any(line.startswith("event loop;") and "spin_on_loop" in line for line in lines)
+    assert any(line.startswith("worker thread;") and "spin_in_thread" in line for line in lines)
+    assert asyncio.get_running_loop().get_task_factory() is None
+
+
+@pytest.mark.asyncio
+async def test_no_profile_without_valid_token(tmp_path):
+    """Requests without the header, or with a wrong token, are not profiled"""
+    async with client(create_app(tmp_path)) as http:
+        plain = await http.get("/profiled")
+        wrong = await http.get("/profiled", headers={"X-Profile-Token": "guess"})
+
+    assert plain.status_code == wrong.status_code == 200
+    assert "x-profile-id" not in plain.headers and "x-profile-id" not in wrong.headers
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_stay_out_of_profile(tmp_path):
+    """Another request running on the same loop is not sampled into the profile"""
+    async with client(create_app(tmp_path)) as http:
+        await asyncio.gather(
+            http.get("/profiled", headers={"X-Profile-Token": "secret"}),
+            http.get("/other"),
+        )
+
+    _, folded = read_profile(tmp_path)
+    assert "spin_on_loop" in folded
+    assert "other" not in folded
+
+
+def test_to_thread_without_capture():
+    """Outside a profiled request to_thread is plain asyncio.to_thread"""
+    assert profiling._current_capture.get() is None
+    assert asyncio.run(to_thread(sum, [1, 2, 3])) == 6
+
+
+def test_rotation_keeps_directory_under_limit(tmp_path):
+    """The oldest profiles go first, and the newest is always kept"""
+    for n in range(5):
+        path = tmp_path / f"{n}.folded"
+        path.write_text("x" * 100)
+        os.utime(path, (n, n))
+    (tmp_path / "notes.txt").write_text("y" * 1000)
+
+    rotate_profiles(str(tmp_path), 250)
+    assert sorted(os.listdir(tmp_path)) == ["3.folded", "4.folded", "notes.txt"]
+
+    rotate_profiles(str(tmp_path), 10)
+    assert sorted(os.listdir(tmp_path)) == ["4.folded", "notes.txt"]
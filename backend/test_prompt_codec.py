@@ -0,0 +1,61 @@
+# backend/test_prompt_codec.py
+"""
+Test script for the compact task-list encoding used in model prompts
+"""
+
+from prompt_codec import (
+    TaskContext, encode_delta, encode_tasks, estimate_tokens, snapshot, trim_history
+)
+
+
+TASKS = [
+    {"id": 3, "title": "call mom", "completed": True},
+    {"id": 1, "title": "buy milk | eggs", "completed": False},
+]
+
+
+def test_stable_order_and_escaping():
+    """Rows are sorted by id and titles cannot break the row format"""
+    assert encode_tasks(TASKS) == "tasks id|done|title\n1|0|buy milk \\| eggs\n3|1|call mom"
+    assert encode_tasks(list(reversed(TASKS))) == encode_tasks(TASKS)
+
+
+def test_truncation_by_budget():
+    """Lists that exceed the budget are cut with a note of what was left out"""
+    tasks = [{"id": i, "title": f"task number {i}", "completed": False} for i in range(1000)]
+    encoded = encode_tasks(tasks, budget=200)
+    assert estimate_tokens(encoded) <= 220
+    assert encoded.endswith("more not shown")
+
+
+def test_delta():
+    """Only added, changed and removed rows appear in a delta"""
+    before = snapshot(TASKS)
+    after = snapshot([
+        {"id": 1, "title": "buy milk | eggs", "completed": True},
+        {"id": 4, "title": "walk dog", "completed": False},
+    ])
+    lines = encode_delta(before, after).splitlines()[1:]
+    assert lines == ["+1|1|buy milk \\| eggs", "-3", "+4|0|walk dog"]
+    assert encode_delta(before, before) == ""
+
+
+def test_task_context_keeps_base_stable():
+    """Small changes are sent as a delta on top of an unchanged base"""
+    tasks = [{"id": i, "title": f"task {i}", "completed": False} for i in range(20)]
+    context = TaskContext()
+    base, delta = context.render("1", tasks)
+    assert delta == ""
+
+    tasks[0] = dict(tasks[0], completed=True)
+    next_base, delta = context.render("1", tasks)
+    assert next_base == base
+    assert "+0|1|task 0" in delta
+
+
+def test_trim_history_keeps_latest():
+    """History is trimmed from the oldest end"""
+    messages = [{"role": "user", "content": f"message number {i}"} for i in range(100)]
+    trimmed = trim_history(messages, budget=50)
+    assert trimmed[-1] == messages[-1]
+    assert len(trimmed) < 100
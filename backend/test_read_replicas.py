@@ -0,0 +1,76 @@
+# backend/test_read_replicas.py
+"""
+Test script for read-replica routing, using two local SQLite databases
+"""
+
+import pytest
+from sqlmodel import SQLModel, Session, select
+
+from database import EngineRouter, create_sqlite_engine, create_sqlite_engines
+from models import Task, settings
+
+
+@pytest.fixture
+def router(tmp_path):
+    """A router over a primary database and one replica database"""
+    primary, writer = create_sqlite_engines(f"sqlite:///{tmp_path / 'primary.db'}", settings)
+    replica = create_sqlite_engine(f"sqlite:///{tmp_path / 'replica.db'}", settings)
+    SQLModel.metadata.create_all(bind=writer)
+    SQLModel.metadata.create_all(bind=replica)
+
+    # Tag each database so tests can tell where a read landed
+    with Session(writer) as session:
+        session.add(Task(user_id=1, title="from primary"))
+        session.commit()
+    with Session(replica) as session:
+        session.add(Task(user_id=1, title="from replica"))
+        session.commit()
+
+    yield EngineRouter(primary, writer=writer, replicas=[replica], read_your_writes_seconds=60)
+    for engine in (primary, writer, replica):
+        engine.dispose()
+
+
+def read_title(engine):
+    with Session(engine) as session:
+        return session.exec(select(Task.title)).first()
+
+
+def test_reads_go_to_replica(router):
+    """Reads without a recent write should be served by the replica"""
+    assert read_title(router.reader("1")) == "from replica"
+    assert read_title(router.reader()) == "from replica"
+
+
+def test_writes_go_to_primary(router):
+    """Writes always use the primary writer engine"""
+    assert router.writer("1") is router.writer_engine
+
+
+def test_read_your_writes(router):
+    """A user reads from the primary right after their own write"""
+    router.writer("1")
+    assert read_title(router.reader("1")) == "from primary"
+    # Other users are unaffected
+    assert read_title(router.reader("2")) == "from replica"
+
+
+def test_failover_to_primary(tmp_path):
+    """An unreachable replica is skipped and reads fail over to the primary"""
+    primary, writer = create_sqlite_engines(f"sqlite:///{tmp_path / 'primary.db'}", settings)
+    broken = create_sqlite_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}", settings)
+    router = EngineRouter(primary, writer=writer, replicas=[broken])
+
+    assert router.check_replicas() == {0: False}
+    assert router.reader("1") is primary
+
+
+def test_reader_leaves_down_replicas_to_the_health_check(router, monkeypatch):
+    """reader() never connects to a down replica; only check_replicas() brings it back"""
+    router.mark_down(0)
+    monkeypatch.setattr(router.replicas[0], "connect", lambda: pytest.fail("reader() connected to the replica"))
+    assert router.reader("2") is router.primary
+
+    monkeypatch.undo()
+    assert router.check_replicas() == {0: True}
+    assert read_title(router.reader("2")) == "from replica"
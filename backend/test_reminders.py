@@ -0,0 +1,179 @@
+# backend/test_reminders.py
+"""
+Test script for due dates, reminders and the reminder scheduler
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+from sqlmodel import Session, SQLModel
+
+import mcp_server
+import reminders
+from database import EngineRouter, create_sqlite_engines
+from events import task_events
+from mcp_server import AddTaskParams, CompleteTaskParams, MCPServer, SetDueDateParams, SetReminderParams
+from models import Task, TaskSequence, settings
+from reminders import ReminderScheduler
+from task_sync import changes_since
+
+
+@pytest.fixture
+def router(tmp_path, monkeypatch):
+    """Point the tools and the scheduler at a temporary database"""
+    reader, writer = create_sqlite_engines(f"sqlite:///{tmp_path / 'test.db'}", settings)
+    SQLModel.metadata.create_all(bind=writer)
+    db_router = EngineRouter(reader, writer=writer)
+    monkeypatch.setattr(mcp_server, "db_router", db_router)
+    monkeypatch.setattr(reminders, "db_router", db_router)
+    yield db_router
+    reader.dispose()
+    writer.dispose()
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    """A fresh scheduler in place of the process-wide one"""
+    scheduler = ReminderScheduler(window_seconds=60, refresh_seconds=30)
+    monkeypatch.setattr(mcp_server, "reminder_scheduler", scheduler)
+    return scheduler
+
+
+async def add(server, title, user_id=1):
+    return (await server.add_task(AddTaskParams(user_id=user_id, title=title)))["task_id"]
+
+
+async def next_reminder(subscription):
+    """Skip the tools' change events up to the next reminder"""
+    while True:
+        for event in await asyncio.wait_for(subscription.get(), 2):
+            if event["op"] == "reminder":
+                return event
+
+
+async def remind(server, task_id, remind_at, user_id=1):
+    return await server.set_reminder(SetReminderParams(user_id=user_id, task_id=task_id, remind_at=remind_at))
+
+
+@pytest.mark.asyncio
+async def test_tools_set_and_clear_times(router, scheduler):
+    """The tools store UTC times as task changes; completing a task cancels its reminder"""
+    server = MCPServer()
+    task_id = await add(server, "file taxes")
+
+    result = await server.set_due_date(SetDueDateParams(user_id=1, task_id=task_id, due_at="2030-04-15T17:00:00+02:00"))
+    assert result == {"task_id": task_id, "status": "updated", "title": "file taxes", "version": 1,
+                      "due_at": "2030-04-15T15:00:00"}
+    assert (await remind(server, task_id, "2030-04-14T09:00:00"))["remind_at"] == "2030-04-14T09:00:00"
+    assert "error" in await remind(server, task_id + 1, "2030-04-14T09:00:00")
+    assert "error" in await server.set_due_date(SetDueDateParams(user_id=2, task_id=task_id, due_at=None))
+
+    with Session(router.reader()) as session:
+        change = changes_since(session, 1, 1, 10)["changes"][-1]
+    assert (change["due_at"], change["remind_at"]) == (datetime(2030, 4, 15, 15), datetime(2030, 4, 14, 9))
+
+    await server.complete_task(CompleteTaskParams(user_id=1, task_id=task_id))
+    assert "error" in await remind(server, task_id, "2030-04-14T10:00:00")
+    with Session(router.reader()) as session:
+        task = session.get(Task, task_id)
+        assert task.remind_at is None and task.due_at == datetime(2030, 4, 15, 15)
+
+
+@pytest.mark.asyncio
+async def test_window_load_and_fire(router, scheduler):
+    """Only the window is loaded; firing clears the reminder, stamps a change and notifies"""
+    server = MCPServer()
+    now = datetime.utcnow()
+    overdue, soon, later = [await add(server, title) for title in ("overdue", "soon", "later")]
+    await remind(server, overdue, now - timedelta(hours=1))
+    await remind(server, soon, now + timedelta(seconds=30))
+    await remind(server, later, now + timedelta(days=3))
+
+    assert scheduler.load_window(now) == 2
+    assert scheduler.load_window(now) == 0
+    assert scheduler.next_due() == now - timedelta(hours=1)
+    subscription = task_events.subscribe(1)
+    try:
+        due = scheduler.pop_due(now)
+        assert due == [(overdue, 1)]
+        assert scheduler.fire(due, now) == 1
+        assert scheduler.fire(due, now) == 0
+        events = await asyncio.wait_for(subscription.get(), 1)
+    finally:
+        task_events.unsubscribe(subscription)
+    assert events == [{"op": "reminder", "task": {"id": overdue, "title": "overdue", "due_at": None}}]
+
+    with Session(router.reader()) as session:
+        task = session.get(Task, overdue)
+        assert task.remind_at is None
+        assert task.seq == session.get(TaskSequence, 1).last_seq
+        # Set by the tool, then fired
+        assert task.version == 2
+    assert scheduler.pop_due(now + timedelta(seconds=30)) == [(soon, 1)]
+    assert len(scheduler) == 0
+
+
+@pytest.mark.asyncio
+async def test_moved_reminders_are_skipped(router, scheduler):
+    """A reminder moved after loading fires at its new time only, wherever it was moved"""
+    server = MCPServer()
+    now = datetime.utcnow()
+    here, elsewhere = await add(server, "moved here"), await add(server, "moved elsewhere")
+    for task_id in (here, elsewhere):
+        await remind(server, task_id, now + timedelta(seconds=10))
+    scheduler.load_window(now)
+
+    # Moved by this process: the heap entry is superseded
+    await remind(server, here, now + timedelta(days=1))
+    # Moved by another worker: only the conditional UPDATE notices
+    with Session(router.writer()) as session:
+        session.execute(update(Task).where(Task.id == elsewhere).values(remind_at=now + timedelta(days=1)))
+        session.commit()
+
+    due = scheduler.pop_due(now + timedelta(seconds=10))
+    assert due == [(elsewhere, 1)]
+    assert scheduler.fire(due, now + timedelta(seconds=10)) == 0
+    with Session(router.reader()) as session:
+        assert session.get(Task, elsewhere).remind_at == now + timedelta(days=1)
+
+
+@pytest.mark.asyncio
+async def test_full_window_shrinks(router, scheduler):
+    """With more due reminders than it may hold, the window ends at the last one loaded"""
+    server = MCPServer()
+    now = datetime.utcnow()
+    for n in range(5):
+        await remind(server, await add(server, f"task {n}"), now + timedelta(seconds=n))
+    scheduler.max_loaded = 3
+    scheduler.load_window(now)
+    assert len(scheduler) == 3
+    assert scheduler.horizon == now + timedelta(seconds=2)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_fires_on_time_and_after_restart(router, scheduler):
+    """A running scheduler fires new reminders when due, and a restarted one fires what it missed"""
+    server = MCPServer()
+    subscription = task_events.subscribe(1)
+    runner = asyncio.create_task(scheduler.run())
+    try:
+        await asyncio.sleep(0.05)
+        task_id = await add(server, "stretch")
+        await remind(server, task_id, datetime.utcnow() + timedelta(milliseconds=200))
+        assert await next_reminder(subscription) == {
+            "op": "reminder", "task": {"id": task_id, "title": "stretch", "due_at": None}
+        }
+
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+        missed = await add(server, "missed while down")
+        await remind(server, missed, datetime.utcnow() - timedelta(minutes=5))
+
+        runner = asyncio.create_task(ReminderScheduler(window_seconds=60).run())
+        assert (await next_reminder(subscription))["task"]["id"] == missed
+    finally:
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+        task_events.unsubscribe(subscription)
@@ -0,0 +1,292 @@
+# backend/test_sharding.py
+"""
+Test script for sharding users' data over several databases, using local SQLite files as shards
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import BigInteger, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, SQLModel, select
+
+import archive
+import mcp_server
+import reminders
+import sharding
+import task_sync
+from archive import archive_conversation, load_history
+from auth import UserCreate
+from database import SHARD_ID_BITS, EngineRouter, ShardRouter, create_sqlite_engines
+from mcp_server import AddTaskParams, CompleteTaskParams, DeleteTaskParams, ListTasksParams, MCPServer
+from models import Conversation, Message, MessageArchive, ShardAssignment, Task, TaskSequence, User, settings
+from reminders import ReminderScheduler
+from routes import auth_routes
+from sharding import SHARDED_TABLES, ShardMoveError, create_tables, move_user, pin_users, place_user
+from task_sync import changes_since, compact_tombstones
+
+
+def make_router(tmp_path, count, directory_seconds=0.0):
+    shards = []
+    for index in range(count):
+        reader, writer = create_sqlite_engines(f"sqlite:///{tmp_path / f'shard{index}.db'}", settings)
+        shards.append(EngineRouter(reader, writer=writer))
+    return ShardRouter(shards, directory_seconds=directory_seconds)
+
+
+def use_router(monkeypatch, router):
+    for module in (mcp_server, sharding, archive, task_sync, reminders):
+        monkeypatch.setattr(module, "db_router", router)
+
+
+@pytest.fixture
+def router(tmp_path, monkeypatch):
+    """Three SQLite shards with their tables, and 30 accounts on shard 0"""
+    router = make_router(tmp_path, 3)
+    use_router(monkeypatch, router)
+    create_tables()
+    with Session(router.shards[0].writer()) as session:
+        for n in range(1, 31):
+            session.add(User(id=n, email=f"user{n}@example.com", username=f"user{n}", hashed_password="x"))
+        session.commit()
+    for n in range(1, 31):
+        place_user(n)
+    yield router
+    for engine in router.engines():
+        engine.dispose()
+
+
+def rows_on(shard, model, user_id):
+    with Session(shard.reader()) as session:
+        return session.exec(select(model).where(model.user_id == user_id)).all()
+
+
+def tasks_of(router, user_id):
+    return rows_on(router.shards[router.shard_for(user_id)], Task, user_id)
+
+
+def other_shard(router, user_id):
+    return (router.shard_for(user_id) + 1) % len(router.shards)
+
+
+@pytest.mark.asyncio
+async def test_tools_route_each_user_to_one_shard(router):
+    """Every user's tasks land on their shard only, with ids from that shard's range"""
+    server = MCPServer()
+    for user_id in range(1, 31):
+        await server.add_task(AddTaskParams(user_id=user_id, title=f"task of {user_id}"))
+
+    assert {router.shard_for(user_id) for user_id in range(1, 31)} == {0, 1, 2}
+    for user_id in range(1, 31):
+        home = router.shard_for(user_id)
+        assert [len(rows_on(shard, Task, user_id)) for shard in router.shards] == [
+            1 if index == home else 0 for index in range(3)
+        ]
+        assert tasks_of(router, user_id)[0].id >> SHARD_ID_BITS == home
+        with Session(router.shards[home].reader()) as session:
+            assert session.get(User, user_id) is not None  # the account row, for the foreign keys
+        listed = await server.list_tasks(ListTasksParams(user_id=user_id))
+        assert [task["title"] for task in listed] == [f"task of {user_id}"]
+
+
+@pytest.mark.asyncio
+async def test_move_keeps_ids_history_and_sync_cursor(router):
+    """A moved user keeps their task ids, conversation history and delta sync cursor; the old shard is emptied"""
+    server = MCPServer()
+    user_id = 7
+    source = router.shard_for(user_id)
+    first = await server.add_task(AddTaskParams(user_id=user_id, title="buy milk"))
+    second = await server.add_task(AddTaskParams(user_id=user_id, title="walk the dog"))
+    await server.complete_task(CompleteTaskParams(user_id=user_id, task_id=first["task_id"]))
+    await server.delete_task(DeleteTaskParams(user_id=user_id, task_id=second["task_id"]))
+
+    with Session(router.writer(user_id)) as session:
+        conversation = Conversation(user_id=user_id)
+        session.add(conversation)
+        session.commit()
+        conversation_id = conversation.id
+        for n in range(6):
+            session.add(Message(user_id=user_id, conversation_id=conversation_id, role="user",
+                                content=f"message {n}", created_at=datetime.utcnow() - timedelta(minutes=10 - n)))
+        session.commit()
+        boundary = max(session.exec(select(Message.id).where(Message.user_id == user_id)).all()) - 2
+    archive_conversation(conversation_id, boundary, 10, "zlib",
+                         {"messages": 0, "blocks": 0, "raw_bytes": 0, "archived_bytes": 0}, router.shards[source])
+
+    with Session(router.reader(user_id)) as session:
+        history = load_history(session, conversation_id)
+        cursor = changes_since(session, user_id, 0, 100)["next"]
+    listed = await server.list_tasks(ListTasksParams(user_id=user_id))
+
+    target = other_shard(router, user_id)
+    moved = move_user(user_id, target, drain_seconds=0)
+    # Two tasks, their counter row, the conversation, two hot messages and one archive block
+    assert moved == {"user_id": user_id, "from": source, "to": target, "rows": 2 + 1 + 1 + 2 + 1}
+    assert router.shard_for(user_id) == target
+
+    assert await server.list_tasks(ListTasksParams(user_id=user_id)) == listed
+    with Session(router.reader(user_id)) as session:
+        assert load_history(session, conversation_id) == history
+        assert changes_since(session, user_id, cursor, 100)["changes"] == []
+        assert session.get(TaskSequence, user_id).completed == 1
+    for model in (Task, TaskSequence, Conversation, Message):
+        assert rows_on(router.shards[source], model, user_id) == []
+    with Session(router.shards[target].reader()) as session:
+        assert session.get(User, user_id) is not None
+
+    added = await server.add_task(AddTaskParams(user_id=user_id, title="after the move"))
+    assert added["task_id"] >> SHARD_ID_BITS == target
+    assert {task.title for task in tasks_of(router, user_id)} == {"buy milk", "", "after the move"}
+
+    # Moving back to the hash-ring shard drops the directory entry
+    move_user(user_id, source, drain_seconds=0)
+    with Session(router.shards[0].reader()) as session:
+        assert session.get(ShardAssignment, user_id) is None
+    assert len(tasks_of(router, user_id)) == 3
+
+
+@pytest.mark.asyncio
+async def test_writes_wait_while_user_moves(router):
+    """During a move the user's writes fail with a retryable error while reads still work"""
+    server = MCPServer()
+    await server.add_task(AddTaskParams(user_id=3, title="before"))
+    target = other_shard(router, 3)
+
+    mover = threading.Thread(target=move_user, args=(3, target), kwargs={"drain_seconds": 0.5})
+    mover.start()
+    time.sleep(0.2)
+    try:
+        during = await server.add_task(AddTaskParams(user_id=3, title="during"))
+        assert "moving" in during["error"]
+        assert [task["title"] for task in await server.list_tasks(ListTasksParams(user_id=3))] == ["before"]
+        # Other users on the same shards are unaffected
+        assert "error" not in await server.add_task(AddTaskParams(user_id=4, title="other user"))
+    finally:
+        mover.join()
+
+    assert "error" not in await server.add_task(AddTaskParams(user_id=3, title="after"))
+    assert sorted(task.title for task in rows_on(router.shards[target], Task, 3)) == ["after", "before"]
+
+
+@pytest.mark.asyncio
+async def test_failed_copy_leaves_user_in_place(router):
+    """A copy that hits an id already taken on the target rolls back; the user stays on their shard"""
+    server = MCPServer()
+    added = await server.add_task(AddTaskParams(user_id=5, title="mine"))
+    source = router.shard_for(5)
+    target = other_shard(router, 5)
+    with Session(router.shards[target].writer()) as session:
+        session.add(Task(id=added["task_id"], user_id=9999, title="squatter"))
+        session.commit()
+
+    with pytest.raises(ShardMoveError, match="failed"):
+        move_user(5, target, drain_seconds=0)
+
+    assert router.shard_for(5) == source
+    assert rows_on(router.shards[target], Task, 5) == []
+    assert rows_on(router.shards[target], TaskSequence, 5) == []
+    assert "error" not in await server.add_task(AddTaskParams(user_id=5, title="still writable"))
+    assert len(rows_on(router.shards[source], Task, 5)) == 2
+
+
+def test_pin_users_before_adding_a_shard(tmp_path, monkeypatch, router):
+    """After pinning, adding a shard to the ring leaves every existing user on the shard holding their data"""
+    before = {user_id: router.shard_for(user_id) for user_id in range(1, 31)}
+
+    reader, writer = create_sqlite_engines(f"sqlite:///{tmp_path / 'shard3.db'}", settings)
+    grown = ShardRouter(router.shards + [EngineRouter(reader, writer=writer)], directory_seconds=0)
+    use_router(monkeypatch, grown)
+    create_tables()
+
+    changed = [user_id for user_id in range(1, 31) if grown.ring.shard_for(user_id) != before[user_id]]
+    assert changed and all(grown.ring.shard_for(user_id) == 3 for user_id in changed)
+    assert pin_users(3) == len(changed)
+    assert {user_id: grown.shard_for(user_id) for user_id in range(1, 31)} == before
+    assert pin_users(3) == 0
+
+    move_user(changed[0], 3, drain_seconds=0)
+    assert grown.shard_for(changed[0]) == 3
+    reader.dispose()
+    writer.dispose()
+
+
+@pytest.mark.asyncio
+async def test_jobs_run_on_every_shard(router):
+    """Background passes such as tombstone compaction go over all shards"""
+    server = MCPServer()
+    for user_id in range(1, 31):
+        added = await server.add_task(AddTaskParams(user_id=user_id, title="gone"))
+        await server.delete_task(DeleteTaskParams(user_id=user_id, task_id=added["task_id"]))
+
+    assert compact_tombstones(retention_days=0)["tombstones"] == 30
+    for shard in router.shards:
+        with Session(shard.reader()) as session:
+            assert session.exec(select(Task)).all() == []
+
+
+@pytest.mark.asyncio
+async def test_reminders_wait_for_a_move(router):
+    """A reminder due while its user moves fires once, from the new shard, after the move"""
+    server = MCPServer()
+    added = await server.add_task(AddTaskParams(user_id=8, title="call mum"))
+    source = router.shard_for(8)
+    target = other_shard(router, 8)
+    now = datetime.utcnow()
+    with Session(router.writer(8)) as session:
+        session.execute(update(Task).where(Task.id == added["task_id"]).values(remind_at=now - timedelta(seconds=1)))
+        session.commit()
+    scheduler = ReminderScheduler(window_seconds=60)
+    scheduler.load_window(now)
+
+    # Marked as moving, as move_user does before it copies the rows
+    sharding._assign(8, source, moving_to=target)
+    assert scheduler.fire(scheduler.pop_due(now), now) == 0
+    move_user(8, target, drain_seconds=0)
+
+    scheduler.load_window(now)
+    assert scheduler.fire(scheduler.pop_due(now), now) == 1
+    assert [task.remind_at for task in rows_on(router.shards[target], Task, 8)] == [None]
+    scheduler.load_window(now)
+    assert scheduler.pop_due(now) == []
+
+
+def test_failed_placement_undoes_registration(router, monkeypatch):
+    """An account whose copy to its shard fails is removed again, so the user can register once more"""
+    monkeypatch.setattr(auth_routes, "db_router", router)
+    account = UserCreate(email="new@example.com", username="newcomer", password="secret123")
+
+    def fail(user_id):
+        raise RuntimeError("shard unavailable")
+
+    monkeypatch.setattr(auth_routes, "place_user", fail)
+    with pytest.raises(HTTPException) as exc:
+        auth_routes.register(account)
+    assert exc.value.status_code == 500
+    with Session(router.shards[0].reader()) as session:
+        assert session.exec(select(User).where(User.username == "newcomer")).first() is None
+
+    monkeypatch.setattr(auth_routes, "place_user", place_user)
+    assert auth_routes.register(account)["token_type"] == "bearer"
+    with Session(router.shards[0].reader()) as session:
+        user_id = session.exec(select(User.id).where(User.username == "newcomer")).one()
+    with Session(router.shards[router.shard_for(user_id)].reader()) as session:
+        assert session.get(User, user_id) is not None
+
+
+def test_id_ranges_fit_the_id_columns():
+    """Every id column that holds shard-range ids is 64-bit on PostgreSQL, and a rowid alias on SQLite"""
+    ids = [table.c.id for table in SHARDED_TABLES[1:]] + [
+        Message.__table__.c.conversation_id,
+        MessageArchive.__table__.c.conversation_id,
+        MessageArchive.__table__.c.first_message_id,
+        MessageArchive.__table__.c.last_message_id,
+    ]
+    for column in ids:
+        assert isinstance(column.type.dialect_impl(postgresql.dialect()), BigInteger), column
+        assert column.type.compile(dialect=sqlite.dialect()) == "INTEGER", column
+    # Shard 1 already starts past int4; 64-bit ids leave room for millions of shards
+    assert 1 << SHARD_ID_BITS > 2 ** 31 - 1
+    assert (2 ** 63 - 1) >> SHARD_ID_BITS >= 1024
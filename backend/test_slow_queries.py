@@ -0,0 +1,104 @@
+# backend/test_slow_queries.py
+"""
+Test script for the slow-query log
+"""
+
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+import models
+from main import app
+from slow_queries import SlowQueryLog, normalize_statement, params_shape, query_origin, slow_query_log
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE task (id INTEGER PRIMARY KEY, user_id INTEGER, title VARCHAR)"))
+        conn.execute(text("CREATE INDEX ix_task_user_id ON task (user_id)"))
+    yield engine
+    engine.dispose()
+
+
+def test_normalize_statement():
+    """Literals, placeholders and IN lists collapse to one fingerprint"""
+    assert normalize_statement("SELECT * FROM task WHERE id = 7 AND title = 'it''s'") == \
+        "SELECT * FROM task WHERE id = ? AND title = ?"
+    assert normalize_statement("SELECT * FROM task\n  WHERE user_id IN (?, ?, ?)") == \
+        normalize_statement("SELECT * FROM task WHERE user_id IN (%(p1)s, %(p2)s)") == \
+        "SELECT * FROM task WHERE user_id IN (?+)"
+    assert normalize_statement("SELECT anon_1.id FROM t1 LIMIT :param_1") == "SELECT anon_1.id FROM t1 LIMIT ?"
+
+
+def test_params_shape_hides_values():
+    """Only parameter types are kept"""
+    assert params_shape({"title": "secret", "user_id": 3}, False) == {"title": "str", "user_id": "int"}
+    assert params_shape(("secret", None), False) == ["str", "NoneType"]
+    assert params_shape([("a", 1), ("b", 2)], True) == {"rows": 2, "row": ["str", "int"]}
+
+
+def test_slow_statements_aggregated_by_fingerprint(engine):
+    """Slow statements are grouped by shape with counts, origins and a plan"""
+    log = SlowQueryLog(threshold_ms=0, explain=True)
+    log.instrument(engine)
+    log.instrument(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO task (user_id, title) VALUES (:u, :t)"), [{"u": 1, "t": "a"}, {"u": 2, "t": "b"}])
+        with query_origin("tool:list_tasks"):
+            for user_id in (1, 2, 3):
+                conn.execute(text("SELECT id, title FROM task WHERE user_id = :u"), {"u": user_id})
+
+    top = log.top(10, order_by="count")
+    select = top[0]
+    assert select["statement"] == "SELECT id, title FROM task WHERE user_id = ?"
+    assert select["count"] == 3
+    assert select["origins"] == {"tool:list_tasks": 3}
+    assert select["params"] == ["int"]  # SQLite binds positionally
+    assert "ix_task_user_id" in select["plan"]
+    insert = next(entry for entry in top if entry["statement"].startswith("INSERT"))
+    assert insert["params"] == {"rows": 2, "row": ["int", "str"]}
+    assert insert["plan"] is None and insert["origins"] == {"-": 1}
+
+
+def test_fast_statements_not_recorded(engine):
+    """Statements under the threshold leave no trace, and the table is bounded"""
+    log = SlowQueryLog(threshold_ms=10_000)
+    log.instrument(engine)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    assert log.top() == []
+
+    log.configure(threshold_ms=0, max_fingerprints=2)
+    with engine.connect() as conn:
+        for n in range(5):
+            conn.execute(text(f"SELECT {n} AS c{n}"))
+    assert len(log.top()) == 2
+
+
+def test_admin_endpoint(monkeypatch):
+    """The report needs the admin token and attributes statements to routes and tools"""
+    monkeypatch.setattr(models.settings, "admin_token", "admin-secret")
+    monkeypatch.setattr(slow_query_log, "threshold", 0.0)
+    slow_query_log.reset()
+    with TestClient(app) as client:
+        name = f"slow_{uuid.uuid4().hex[:12]}"
+        token = client.post("/auth/register", json={
+            "email": f"{name}@example.com", "username": name, "password": "secret123"
+        }).json()["access_token"]
+        client.post("/api/chat", json={"message": "add task to buy milk"}, headers={"Authorization": f"Bearer {token}"})
+
+        assert client.get("/api/admin/slow-queries").status_code == 403
+        assert client.get("/api/admin/slow-queries", headers={"X-Admin-Token": "guess"}).status_code == 403
+        response = client.get("/api/admin/slow-queries", params={"limit": 500},
+                              headers={"X-Admin-Token": "admin-secret"})
+        assert response.status_code == 200
+        origins = {origin for entry in response.json()["queries"] for origin in entry["origins"]}
+        assert "POST /api/chat (chat)" in origins
+        assert "POST /api/chat (chat) > tool:add_task" in origins
+
+        assert client.delete("/api/admin/slow-queries", headers={"X-Admin-Token": "admin-secret"}).status_code == 200
+        assert slow_query_log.top() == []
@@ -0,0 +1,126 @@
+# backend/test_task_stats.py
+"""
+Test script for the incrementally maintained task statistics
+"""
+
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+from sqlmodel import Session, SQLModel
+
+import mcp_server
+import task_stats
+from database import EngineRouter, create_sqlite_engines
+from main import app
+from mcp_server import (
+    AddTaskParams, CompleteTaskParams, DeleteTaskParams, GetTaskStatsParams, MCPServer, UpdateTaskParams,
+)
+from models import TaskSequence, settings
+from task_stats import reconcile_task_stats
+from transfer import BulkImporter
+
+
+@pytest.fixture
+def router(tmp_path, monkeypatch):
+    """Point the tools and the stats module at a temporary database"""
+    reader, writer = create_sqlite_engines(f"sqlite:///{tmp_path / 'test.db'}", settings)
+    SQLModel.metadata.create_all(bind=writer)
+    db_router = EngineRouter(reader, writer=writer)
+    monkeypatch.setattr(mcp_server, "db_router", db_router)
+    monkeypatch.setattr(task_stats, "db_router", db_router)
+    yield db_router
+    reader.dispose()
+    writer.dispose()
+
+
+async def stats(server, user_id=1):
+    return await server.get_task_stats(GetTaskStatsParams(user_id=user_id))
+
+
+@pytest.mark.asyncio
+async def test_tools_maintain_stats(router):
+    """add, complete, update and delete keep the counts in step"""
+    server = MCPServer()
+    assert await stats(server) == {"total": 0, "pending": 0, "completed": 0, "completed_today": 0}
+
+    ids = [(await server.add_task(AddTaskParams(user_id=1, title=f"task {n}")))["task_id"] for n in range(3)]
+    await server.add_task(AddTaskParams(user_id=2, title="someone else"))
+    await server.complete_task(CompleteTaskParams(user_id=1, task_id=ids[0]))
+    await server.complete_task(CompleteTaskParams(user_id=1, task_id=ids[0]))
+    await server.update_task(UpdateTaskParams(user_id=1, task_id=ids[1], title="renamed"))
+    assert await stats(server) == {"total": 3, "pending": 2, "completed": 1, "completed_today": 1}
+
+    await server.delete_task(DeleteTaskParams(user_id=1, task_id=ids[0]))
+    await server.delete_task(DeleteTaskParams(user_id=1, task_id=ids[1]))
+    assert await stats(server) == {"total": 1, "pending": 1, "completed": 0, "completed_today": 0}
+    assert (await stats(server, user_id=2))["total"] == 1
+
+
+@pytest.mark.asyncio
+async def test_completed_today_starts_over_each_day(router):
+    """Yesterday's completions are not counted as today's"""
+    server = MCPServer()
+    first = await server.add_task(AddTaskParams(user_id=1, title="buy milk"))
+    second = await server.add_task(AddTaskParams(user_id=1, title="walk the dog"))
+    await server.complete_task(CompleteTaskParams(user_id=1, task_id=first["task_id"]))
+    with Session(router.writer()) as session:
+        session.execute(update(TaskSequence).values(completed_day=datetime.utcnow().date() - timedelta(days=1)))
+        session.commit()
+
+    assert (await stats(server))["completed_today"] == 0
+    await server.complete_task(CompleteTaskParams(user_id=1, task_id=second["task_id"]))
+    assert await stats(server) == {"total": 2, "pending": 0, "completed": 2, "completed_today": 1}
+
+
+@pytest.mark.asyncio
+async def test_reconcile_fixes_drift(router):
+    """The reconciliation pass recounts and rewrites only drifted rows"""
+    server = MCPServer()
+    for user_id in (1, 2, 3):
+        created = await server.add_task(AddTaskParams(user_id=user_id, title="buy milk"))
+        await server.add_task(AddTaskParams(user_id=user_id, title="walk the dog"))
+        await server.complete_task(CompleteTaskParams(user_id=user_id, task_id=created["task_id"]))
+    with Session(router.writer()) as session:
+        session.execute(update(TaskSequence).where(TaskSequence.user_id == 2).values(total=7, completed_today=0))
+        session.execute(update(TaskSequence).where(TaskSequence.user_id == 3).values(completed=0))
+        session.commit()
+
+    assert reconcile_task_stats(batch_size=2) == {"users": 3, "drifted": 2, "batches": 2}
+    for user_id in (1, 2, 3):
+        assert await stats(server, user_id) == {"total": 2, "pending": 1, "completed": 1, "completed_today": 1}
+    assert reconcile_task_stats(batch_size=2)["drifted"] == 0
+
+
+def test_import_counts_tasks(router):
+    """Bulk-imported tasks are added to the stats"""
+    importer = BulkImporter(router.writer(), 1)
+    importer.write_lines([
+        b'{"type": "task", "title": "one", "completed": true}',
+        b'{"type": "task", "title": "two"}',
+    ])
+    with Session(router.reader()) as session:
+        # With no times in the line the task is taken as completed on import, i.e. today
+        assert task_stats.task_stats(session, 1) == {"total": 2, "pending": 1, "completed": 1, "completed_today": 1}
+    assert reconcile_task_stats()["drifted"] == 0
+
+
+def test_stats_endpoint_and_chat():
+    """GET /api/tasks/stats and "how many" in chat both read the stats"""
+    with TestClient(app) as client:
+        name = f"stats_{uuid.uuid4().hex[:12]}"
+        token = client.post("/auth/register", json={
+            "email": f"{name}@example.com", "username": name, "password": "secret123"
+        }).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        client.post("/api/chat", json={"message": "add task to buy milk"}, headers=headers)
+        response = client.get("/api/tasks/stats", headers=headers)
+        assert response.status_code == 200
+        assert response.json() == {"total": 1, "pending": 1, "completed": 0, "completed_today": 0}
+
+        reply = client.post("/api/chat", json={"message": "how many tasks do I have left?"}, headers=headers)
+        assert reply.json()["response"].startswith("You have 1 tasks: 1 pending")
+        assert client.get("/api/tasks/stats").status_code in (401, 403)
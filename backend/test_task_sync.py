@@ -0,0 +1,162 @@
+# backend/test_task_sync.py
+"""
+Test script for delta sync of task changes
+"""
+
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+from sqlmodel import Session, SQLModel, select
+
+import mcp_server
+import task_sync
+from database import EngineRouter, create_sqlite_engines
+from main import app
+from mcp_server import AddTaskParams, CompleteTaskParams, DeleteTaskParams, ListTasksParams, MCPServer, UpdateTaskParams
+from models import Task, TaskSequence, settings
+from task_sync import SyncResetRequired, changes_since, compact_tombstones
+from transfer import BulkImporter
+
+
+@pytest.fixture
+def router(tmp_path, monkeypatch):
+    """Point the tools and the sync module at a temporary database"""
+    reader, writer = create_sqlite_engines(f"sqlite:///{tmp_path / 'test.db'}", settings)
+    SQLModel.metadata.create_all(bind=writer)
+    db_router = EngineRouter(reader, writer=writer)
+    monkeypatch.setattr(mcp_server, "db_router", db_router)
+    monkeypatch.setattr(task_sync, "db_router", db_router)
+    yield db_router
+    reader.dispose()
+    writer.dispose()
+
+
+def changes(router, user_id, since, limit=100):
+    with Session(router.reader()) as session:
+        return changes_since(session, user_id, since, limit)
+
+
+@pytest.mark.asyncio
+async def test_every_change_gets_next_seq(router):
+    """add, complete, update and delete each stamp the task with the next seq"""
+    server = MCPServer()
+    first = await server.add_task(AddTaskParams(user_id=1, title="buy milk"))
+    second = await server.add_task(AddTaskParams(user_id=1, title="walk the dog"))
+    await server.add_task(AddTaskParams(user_id=2, title="someone else"))
+    await server.complete_task(CompleteTaskParams(user_id=1, task_id=first["task_id"]))
+    await server.update_task(UpdateTaskParams(user_id=1, task_id=second["task_id"], title="walk the cat"))
+
+    with Session(router.reader()) as session:
+        seqs = {task.title: task.seq for task in session.exec(select(Task)).all()}
+        assert seqs == {"buy milk": 3, "walk the cat": 4, "someone else": 1}
+        assert session.get(TaskSequence, 1).last_seq == 4
+
+
+@pytest.mark.asyncio
+async def test_delete_leaves_tombstone(router):
+    """A deleted task disappears from lists but is reported as a change"""
+    server = MCPServer()
+    created = await server.add_task(AddTaskParams(user_id=1, title="buy milk"))
+    result = await server.delete_task(DeleteTaskParams(user_id=1, task_id=created["task_id"]))
+    assert result["title"] == "buy milk"
+
+    assert await server.list_tasks(ListTasksParams(user_id=1)) == []
+    again = await server.delete_task(DeleteTaskParams(user_id=1, task_id=created["task_id"]))
+    assert "error" in again
+
+    page = changes(router, 1, since=1)
+    assert page["changes"] == [{"id": created["task_id"], "seq": 2, "deleted": True}]
+    assert page["next"] == 2 and not page["has_more"]
+
+
+@pytest.mark.asyncio
+async def test_full_sync_skips_tombstones(router):
+    """since=0 returns only live tasks, and next still covers the deletes"""
+    server = MCPServer()
+    kept = await server.add_task(AddTaskParams(user_id=1, title="buy milk"))
+    gone = await server.add_task(AddTaskParams(user_id=1, title="walk the dog"))
+    await server.delete_task(DeleteTaskParams(user_id=1, task_id=gone["task_id"]))
+
+    page = changes(router, 1, since=0)
+    assert [change["id"] for change in page["changes"]] == [kept["task_id"]]
+    assert page["next"] == 3
+    assert changes(router, 1, since=page["next"])["changes"] == []
+
+
+@pytest.mark.asyncio
+async def test_paging_through_changes(router):
+    """Pages follow seq order and has_more stops on the last one"""
+    server = MCPServer()
+    for n in range(5):
+        await server.add_task(AddTaskParams(user_id=1, title=f"task {n}"))
+
+    seen, since = [], 0
+    while True:
+        page = changes(router, 1, since, limit=2)
+        seen.extend(change["title"] for change in page["changes"])
+        since = page["next"]
+        if not page["has_more"]:
+            break
+    assert seen == [f"task {n}" for n in range(5)]
+    assert since == 5
+
+
+@pytest.mark.asyncio
+async def test_compaction_forces_resync(router):
+    """Old tombstones are removed and cursors before them must start over"""
+    server = MCPServer()
+    kept = await server.add_task(AddTaskParams(user_id=1, title="buy milk"))
+    gone = await server.add_task(AddTaskParams(user_id=1, title="walk the dog"))
+    await server.delete_task(DeleteTaskParams(user_id=1, task_id=gone["task_id"]))
+    with Session(router.writer()) as session:
+        session.execute(update(Task).where(Task.deleted == True).values(updated_at=datetime.utcnow() - timedelta(days=40)))
+        session.commit()
+
+    assert compact_tombstones(retention_days=30, batch_size=1) == {"tombstones": 1, "batches": 1}
+    with Session(router.reader()) as session:
+        assert [task.id for task in session.exec(select(Task)).all()] == [kept["task_id"]]
+        assert session.get(TaskSequence, 1).compacted_seq == 3
+
+    with pytest.raises(SyncResetRequired):
+        changes(router, 1, since=1)
+    assert changes(router, 1, since=3)["changes"] == []
+    assert [change["id"] for change in changes(router, 1, since=0)["changes"]] == [kept["task_id"]]
+
+
+def test_import_reserves_seqs(router):
+    """Bulk-imported tasks take consecutive seqs after existing changes"""
+    with Session(router.writer()) as session:
+        task_sync.next_seq(session, 1, 3)
+        session.commit()
+
+    importer = BulkImporter(router.writer(), 1)
+    importer.write_lines([
+        b'{"type": "task", "title": "one"}',
+        b'{"type": "task", "title": "two"}',
+    ])
+    assert [change["seq"] for change in changes(router, 1, since=0)["changes"]] == [4, 5]
+
+
+def test_changes_endpoint():
+    """GET /api/tasks/changes returns the user's changes after the cursor"""
+    with TestClient(app) as client:
+        name = f"sync_{uuid.uuid4().hex[:12]}"
+        token = client.post("/auth/register", json={
+            "email": f"{name}@example.com", "username": name, "password": "secret123"
+        }).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        empty = client.get("/api/tasks/changes", headers=headers)
+        assert empty.status_code == 200
+        assert empty.json() == {"changes": [], "next": 0, "has_more": False}
+
+        client.post("/api/chat", json={"message": "add task to buy milk"}, headers=headers)
+        page = client.get("/api/tasks/changes", params={"since": 0}, headers=headers).json()
+        assert [change["title"] for change in page["changes"]] == ["buy milk"]
+        assert client.get("/api/tasks/changes", params={"since": page["next"]}, headers=headers).json()["changes"] == []
+
+        assert client.get("/api/tasks/changes", params={"since": -1}, headers=headers).status_code == 422
+        assert client.get("/api/tasks/changes").status_code in (401, 403)
@@ -0,0 +1,185 @@
+# backend/test_tracing.py
+"""
+Test script for in-process tracing
+"""
+
+import asyncio
+import json
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+import mcp_server
+import models
+import tracing
+from main import app
+from tracing import NOOP_SPAN, OTLPFileExporter, TracingMiddleware, instrument_engine, span, start_trace
+
+
+@pytest.fixture
+def exported(tmp_path, monkeypatch):
+    """Trace every request and return a function reading back the exported spans"""
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(models.settings, "tracing_enabled", True)
+    monkeypatch.setattr(models.settings, "tracing_sample_rate", 1.0)
+    monkeypatch.setattr(models.settings, "tracing_export_path", str(path))
+    monkeypatch.setattr(tracing.tracer, "enabled", True)
+    monkeypatch.setattr(tracing.tracer, "sample_rate", 1.0)
+    exporter = OTLPFileExporter(str(path), "test")
+    monkeypatch.setattr(tracing.tracer, "exporter", exporter)
+
+    def read():
+        exporter.flush()
+        spans = []
+        if path.exists():
+            for line in path.read_text().splitlines():
+                for resource in json.loads(line)["resourceSpans"]:
+                    for scope in resource["scopeSpans"]:
+                        spans.extend(scope["spans"])
+        return spans
+
+    yield read
+    tracing.tracer.exporter = tracing.NullExporter()
+
+
+def by_name(spans):
+    return {s["name"]: s for s in spans}
+
+
+def test_no_spans_outside_sampled_trace(exported, monkeypatch):
+    """Unsampled code gets the shared no-op span and exports nothing"""
+    assert span("anything") is NOOP_SPAN
+    monkeypatch.setattr(tracing.tracer, "sample_rate", 0.0)
+    with start_trace("request") as root:
+        assert root is NOOP_SPAN
+        assert span("child") is NOOP_SPAN
+    monkeypatch.setattr(tracing.tracer, "enabled", False)
+    assert start_trace("request", "00-" + "1" * 32 + "-" + "2" * 16 + "-01") is NOOP_SPAN
+    assert exported() == []
+
+
+@pytest.mark.asyncio
+async def test_spans_nest_across_tasks_and_threads(exported):
+    """Children opened in other tasks and worker threads keep their parent"""
+    def in_thread():
+        with span("thread work", rows=3):
+            pass
+
+    async def in_task(n):
+        with span(f"task {n}"):
+            await asyncio.to_thread(in_thread)
+
+    with start_trace("root"):
+        await asyncio.gather(in_task(1), in_task(2))
+
+    spans = exported()
+    root = by_name(spans)["root"]
+    tasks = [s for s in spans if s["name"].startswith("task")]
+    threads = [s for s in spans if s["name"] == "thread work"]
+    assert "parentSpanId" not in root
+    assert {s["parentSpanId"] for s in tasks} == {root["spanId"]}
+    assert sorted(s["parentSpanId"] for s in threads) == sorted(s["spanId"] for s in tasks)
+    assert {s["traceId"] for s in spans} == {root["traceId"]}
+    assert threads[0]["attributes"] == [{"key": "rows", "value": {"intValue": "3"}}]
+
+
+def test_traceparent_continues_caller_trace(exported):
+    """A sampled traceparent is joined, an unsampled one is respected, a bad one ignored"""
+    trace_id, parent_id = "a" * 32, "b" * 16
+    with start_trace("joined", f"00-{trace_id}-{parent_id}-01") as joined:
+        assert tracing.current_traceparent() == joined.traceparent
+    assert start_trace("dropped", f"00-{trace_id}-{parent_id}-00") is NOOP_SPAN
+    with start_trace("fresh", "garbage"):
+        pass
+
+    spans = by_name(exported())
+    assert (spans["joined"]["traceId"], spans["joined"]["parentSpanId"]) == (trace_id, parent_id)
+    assert spans["fresh"]["traceId"] != trace_id and "parentSpanId" not in spans["fresh"]
+
+
+def test_errors_and_db_queries_are_recorded(exported, tmp_path):
+    """Failed spans carry an error status; statements become db.query children"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'db.sqlite'}")
+    instrument_engine(engine)
+    instrument_engine(engine)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        with start_trace("root"):
+            conn.execute(text("SELECT 2"))
+            with pytest.raises(Exception):
+                conn.execute(text("SELECT * FROM missing"))
+    engine.dispose()
+
+    spans = exported()
+    queries = [s for s in spans if s["name"] == "db.query"]
+    assert len(queries) == 2
+    assert queries[0]["status"] == {"code": 1}
+    assert queries[1]["status"]["code"] == 2 and "missing" in queries[1]["status"]["message"]
+
+
+def test_export_file_rotates(tmp_path):
+    """The export file is moved aside once it passes max_bytes"""
+    path = tmp_path / "traces.jsonl"
+    exporter = OTLPFileExporter(str(path), "test", max_bytes=600)
+    for n in range(4):
+        exporter.export(tracing.Span(f"span {n}", "c" * 32, None))
+        exporter.flush()
+    assert (tmp_path / "traces.jsonl.1").exists()
+    assert path.stat().st_size <= 600
+
+
+def test_chat_turn_trace(exported):
+    """One HTTP chat turn yields a single trace covering auth, DB, agent and tool"""
+    instrument_engine(models.engine)
+    instrument_engine(models.write_engine)
+    with TestClient(TracingMiddleware(app)) as client:
+        # Keep the registration out of the trace under test
+        tracing.tracer.enabled, tracing.tracer.sample_rate = False, 0.0
+        name = f"trace_{uuid.uuid4().hex[:12]}"
+        token = client.post("/auth/register", json={
+            "email": f"{name}@example.com", "username": name, "password": "secret123"
+        }).json()["access_token"]
+        tracing.tracer.enabled, tracing.tracer.sample_rate = True, 1.0
+
+        response = client.post("/api/chat", json={"message": "add task to buy milk"},
+                               headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+        traceparent = response.headers["traceparent"]
+
+    spans = exported()
+    names = by_name(spans)
+    root = names["POST /api/chat"]
+    assert traceparent == f"00-{root['traceId']}-{root['spanId']}-01"
+    assert {s["traceId"] for s in spans} == {root["traceId"]}
+    for child, parent in [
+        ("auth.user_lookup", "POST /api/chat"),
+        ("chat.conversation_fetch", "POST /api/chat"),
+        ("chat.message_insert", "POST /api/chat"),
+        ("chat.history_load", "POST /api/chat"),
+        ("agent.run", "POST /api/chat"),
+        ("mcp.request", "agent.run"),
+        ("tool.add_task", "mcp.request"),
+        ("chat.response_insert", "POST /api/chat"),
+    ]:
+        assert names[child]["parentSpanId"] == names[parent]["spanId"], child
+    tool_queries = [s for s in spans if s["name"] == "db.query" and s["parentSpanId"] == names["tool.add_task"]["spanId"]]
+    assert any("INSERT INTO task" in a["value"]["stringValue"] for s in tool_queries for a in s["attributes"])
+
+
+def test_mcp_websocket_joins_trace(exported):
+    """A traceparent sent over the MCP WebSocket links the server's spans to the caller"""
+    trace_id, parent_id = "d" * 32, "e" * 16
+    with TestClient(mcp_server.app) as client:
+        with client.websocket_connect("/ws") as websocket:
+            websocket.send_text(json.dumps({
+                "id": 1, "method": "list_tasks", "params": {"user_id": 1},
+                "traceparent": f"00-{trace_id}-{parent_id}-01",
+            }))
+            assert json.loads(websocket.receive_text())["id"] == 1
+
+    names = by_name(exported())
+    call = names["mcp list_tasks"]
+    assert (call["traceId"], call["parentSpanId"]) == (trace_id, parent_id)
+    assert names["tool.list_tasks"]["parentSpanId"] == call["spanId"]
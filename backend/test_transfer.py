@@ -0,0 +1,243 @@
+# backend/test_transfer.py
+"""
+Test script for NDJSON export and bulk import
+"""
+
+import json
+import re
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, select
+
+from archive import archive_conversation
+from database import EngineRouter, create_sqlite_engines
+from main import app
+from models import Conversation, Message, Task, settings
+from task_stats import task_stats
+from transfer import (
+    BulkImportError, BulkImporter, copy_rows, export_conversations, export_tasks, read_line_batches,
+)
+import archive
+
+
+@pytest.fixture
+def engines(tmp_path, monkeypatch):
+    reader, writer = create_sqlite_engines(f"sqlite:///{tmp_path / 'test.db'}", settings)
+    SQLModel.metadata.create_all(bind=writer)
+    monkeypatch.setattr(archive, "db_router", EngineRouter(reader, writer=writer))
+    yield reader, writer
+    reader.dispose()
+    writer.dispose()
+
+
+def parse(chunks):
+    return [json.loads(line) for line in b"".join(chunks).decode("utf-8").splitlines()]
+
+
+async def to_stream(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def test_export_tasks_only_for_user(engines):
+    """Task export streams the user's tasks in id order"""
+    reader, writer = engines
+    with Session(writer) as session:
+        session.add(Task(user_id=1, title="buy milk", seq=1))
+        session.add(Task(user_id=2, title="not mine", seq=1))
+        session.add(Task(user_id=1, title="walk the dog", completed=True, seq=2))
+        session.commit()
+
+    records = parse(export_tasks(reader, 1, fetch_size=1))
+    assert [(r["type"], r["title"], r["completed"]) for r in records] == [
+        ("task", "buy milk", False), ("task", "walk the dog", True)
+    ]
+
+
+def test_export_conversations_includes_archived_messages(engines):
+    """Each conversation is followed by all of its messages, archived ones first"""
+    reader, writer = engines
+    with Session(writer) as session:
+        first, second = Conversation(user_id=1), Conversation(user_id=1)
+        session.add(first)
+        session.add(second)
+        session.commit()
+        for n in range(5):
+            session.add(Message(user_id=1, conversation_id=first.id, role="user", content=f"m{n}"))
+        session.add(Message(user_id=1, conversation_id=second.id, role="user", content="other"))
+        session.commit()
+        first_id, second_id = first.id, second.id
+        boundary = session.exec(select(Message.id).where(Message.content == "m2")).one()
+
+    archive_conversation(first_id, boundary, 2, "zlib", {"messages": 0, "blocks": 0, "raw_bytes": 0, "archived_bytes": 0})
+
+    records = parse(export_conversations(reader, 1))
+    assert [(r["type"], r.get("content")) for r in records] == [
+        ("conversation", None),
+        ("message", "m0"), ("message", "m1"), ("message", "m2"), ("message", "m3"), ("message", "m4"),
+        ("conversation", None),
+        ("message", "other"),
+    ]
+    assert records[0]["id"] == first_id and records[-1]["conversation_id"] == second_id
+
+
+@pytest.mark.asyncio
+async def test_read_line_batches_across_chunks():
+    """Lines split across chunk boundaries are reassembled"""
+    data = b"".join(b'{"n": %d}\n' % n for n in range(10))
+    batches = [batch async for batch in read_line_batches(to_stream(data, 7), 4, 1024)]
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert [json.loads(line)["n"] for batch in batches for line in batch] == list(range(10))
+
+
+@pytest.mark.asyncio
+async def test_read_line_batches_rejects_long_line():
+    """A line over the limit is rejected before it is buffered in full"""
+    with pytest.raises(BulkImportError):
+        async for _ in read_line_batches(to_stream(b"x" * 100, 10), 10, 50):
+            pass
+
+
+def test_round_trip(engines):
+    """Exported data imports into another user with messages re-pointed"""
+    reader, writer = engines
+    with Session(writer) as session:
+        session.add(Task(user_id=1, title="buy milk", description="", completed=True, seq=1))
+        conversation = Conversation(user_id=1)
+        session.add(conversation)
+        session.commit()
+        session.add(Message(user_id=1, conversation_id=conversation.id, role="user", content="hi"))
+        session.add(Message(user_id=1, conversation_id=conversation.id, role="assistant", content="hello"))
+        session.commit()
+
+    lines = b"".join(export_tasks(reader, 1)).splitlines() + b"".join(export_conversations(reader, 1)).splitlines()
+    importer = BulkImporter(writer, 2)
+    importer.write_lines(lines[:2])
+    importer.write_lines(lines[2:])
+    assert importer.counts == {"task": 1, "conversation": 1, "message": 2}
+
+    with Session(reader) as session:
+        task = session.exec(select(Task).where(Task.user_id == 2)).one()
+        assert (task.title, task.description, task.completed) == ("buy milk", "", True)
+        conversation = session.exec(select(Conversation).where(Conversation.user_id == 2)).one()
+        messages = session.exec(select(Message).where(Message.user_id == 2).order_by(Message.id)).all()
+        assert [(m.conversation_id, m.content) for m in messages] == [(conversation.id, "hi"), (conversation.id, "hello")]
+
+
+def test_import_keeps_completion_times_and_stats(engines):
+    """Imported completed tasks keep (or get) a completion time and count in the stats"""
+    reader, writer = engines
+    now = datetime.utcnow()
+    importer = BulkImporter(writer, 1)
+    importer.write_lines([
+        json.dumps({"type": "task", "title": "done today", "completed": True, "completed_at": now.isoformat()}).encode(),
+        json.dumps({"type": "task", "title": "done long ago", "completed": True,
+                    "completed_at": "2020-01-01T00:00:00", "updated_at": "2020-01-02T00:00:00"}).encode(),
+        json.dumps({"type": "task", "title": "old export", "completed": True, "updated_at": "2021-05-01T00:00:00"}).encode(),
+        b'{"type": "task", "title": "pending"}',
+    ])
+
+    with Session(reader) as session:
+        completed_at = {task.title: task.completed_at for task in session.exec(select(Task)).all()}
+        stats = task_stats(session, 1)
+    assert completed_at == {"done today": now, "done long ago": datetime(2020, 1, 1),
+                            "old export": datetime(2021, 5, 1), "pending": None}
+    assert stats == {"total": 4, "pending": 1, "completed": 3, "completed_today": 1}
+
+
+def test_import_reports_bad_line(engines):
+    """A bad line fails its batch and names the line"""
+    reader, writer = engines
+    importer = BulkImporter(writer, 1)
+    importer.write_lines([b'{"type": "task", "title": "ok"}'])
+    with pytest.raises(BulkImportError) as exc:
+        importer.write_lines([b'{"type": "task", "title": "fine"}', b"", b'{"type": "message", "conversation_id": 9, "role": "user", "content": "x"}'])
+    assert exc.value.line == 4
+    with pytest.raises(BulkImportError):
+        importer.write_lines([b"not json"])
+
+    with Session(reader) as session:
+        assert [t.title for t in session.exec(select(Task)).all()] == ["ok"]
+
+
+def test_failed_batch_keeps_no_conversations(engines):
+    """A batch that fails after inserting a conversation neither counts it nor maps messages to it"""
+    reader, writer = engines
+    importer = BulkImporter(writer, 1)
+    with pytest.raises(BulkImportError):
+        importer.write_lines([b'{"type": "conversation", "id": 5}', b"not json"])
+    assert importer.counts == {"task": 0, "conversation": 0, "message": 0}
+    with pytest.raises(BulkImportError, match="unknown conversation 5"):
+        importer.write_lines([b'{"type": "message", "conversation_id": 5, "role": "user", "content": "x"}'])
+
+
+class CopyCursor:
+    """Captures the input of copy_expert"""
+
+    def __init__(self, captured):
+        self.captured = captured
+
+    def copy_expert(self, sql, buffer):
+        self.captured.append(buffer.read())
+
+    def close(self):
+        pass
+
+
+def read_copy_csv(data: str):
+    """Parse COPY's CSV format: a bare empty field is NULL, a quoted one an empty string"""
+    field = re.compile(r'"((?:[^"]|"")*)"|([^,\n]*)')
+    rows = []
+    for line in data.splitlines():
+        values = []
+        for match in re.finditer(r'(?:^|(?<=,))(?:"(?:[^"]|"")*"|[^,]*)', line):
+            quoted, bare = field.fullmatch(match.group()).groups()
+            values.append(quoted.replace('""', '"') if quoted is not None else (bare or None))
+        rows.append(values)
+    return rows
+
+
+def test_copy_rows_keeps_nulls_apart_from_empty_strings():
+    """COPY input writes None as NULL and '' as an empty string, and fills in column defaults"""
+    captured = []
+    conn = SimpleNamespace(connection=SimpleNamespace(cursor=lambda: CopyCursor(captured)))
+    at = datetime(2030, 1, 2, 3, 4, 5)
+    rows = [
+        {"title": 'say "hi", then go', "description": None, "completed": True, "completed_at": None,
+         "created_at": at, "updated_at": at},
+        {"title": "", "description": "", "completed": False, "completed_at": at, "created_at": at, "updated_at": at},
+    ]
+    copy_rows(conn, Task.__table__, rows)
+
+    # Columns the rows leave out get the models' defaults: seq, deleted and version are NOT NULL
+    assert read_copy_csv(captured[0]) == [
+        ['say "hi", then go', None, "True", None, at.isoformat(), at.isoformat(), "0", "False", "0"],
+        ["", "", "False", at.isoformat(), at.isoformat(), at.isoformat(), "0", "False", "0"],
+    ]
+
+
+def test_export_and_import_endpoints():
+    """The HTTP endpoints stream and accept NDJSON"""
+    with TestClient(app) as client:
+        name = f"bulk_{uuid.uuid4().hex[:12]}"
+        token = client.post("/auth/register", json={
+            "email": f"{name}@example.com", "username": name, "password": "secret123"
+        }).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        body = "".join(json.dumps({"type": "task", "title": f"task {n}"}) + "\n" for n in range(25))
+        response = client.post("/api/import", content=body.encode(), headers=headers)
+        assert response.status_code == 200
+        assert response.json()["imported"]["task"] == 25
+
+        response = client.get("/api/export/tasks", headers=headers)
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert [json.loads(line)["title"] for line in response.text.splitlines()] == [f"task {n}" for n in range(25)]
+
+        response = client.post("/api/import", content=b'{"type": "bogus"}\n', headers=headers)
+        assert response.status_code == 400
+        assert response.json()["detail"]["line"] == 1
@@ -0,0 +1,159 @@
+# backend/test_warmup.py
+"""
+Test script for the startup warm-up and the readiness endpoint
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func
+from sqlmodel import Session, SQLModel, select
+
+import main
+from database import EngineRouter, create_sqlite_engines
+from models import Conversation, settings
+from warmup import Readiness, warm_up
+
+
+def wait_until_ready(client, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get("/ready")
+        if response.status_code == 200:
+            return response
+        time.sleep(0.02)
+    return response
+
+
+def test_ready_waits_for_warmup(monkeypatch):
+    """/ready answers 503 until warm-up finishes while /health answers at once"""
+    gate = threading.Event()
+    monkeypatch.setattr(main, "warmup_steps", lambda: [("gate", lambda: gate.wait(5))])
+    with TestClient(main.app) as client:
+        assert client.get("/health").json() == {"status": "healthy"}
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json() == {"status": "not ready", "warmup": "pending"}
+
+        gate.set()
+        response = wait_until_ready(client)
+        assert response.status_code == 200
+        assert response.json() == {"status": "ready", "warmup": "done", "database": "ok"}
+
+
+def count_conversations():
+    with Session(main.db_router.writer()) as session:
+        return session.exec(select(func.count()).select_from(Conversation)).one()
+
+
+def test_default_warmup_steps_run():
+    """The real warm-up completes, fills the caches it is for and leaves no rows behind"""
+    with TestClient(main.app) as client:
+        client.post("/auth/register", json={
+            "email": "warmup@example.com", "username": "warmup", "password": "secret123"
+        })
+    before = count_conversations()
+
+    with TestClient(main.app) as client:
+        assert wait_until_ready(client).status_code == 200
+        assert main.mcp_server_instance._tool_definitions is not None
+        assert main.app.openapi_schema is not None
+    assert count_conversations() == before
+
+
+def test_database_check_is_cached_and_reported():
+    """The database is pinged once per interval however often /ready is asked, and failures show"""
+    calls = []
+
+    def ping():
+        calls.append(time.monotonic())
+        if len(calls) > 1:
+            raise ConnectionError("database unreachable")
+
+    readiness = Readiness(ping, check_seconds=0.2, timeout_seconds=1.0)
+    readiness.warmed_up = True
+
+    async def go():
+        first = [await readiness.status() for _ in range(10)]
+        await asyncio.sleep(0.2)
+        second = await asyncio.gather(*[readiness.status() for _ in range(10)])
+        return first, second
+
+    first, second = asyncio.run(go())
+    assert all(ready for ready, _ in first)
+    assert len(calls) == 2
+    # Probes arriving during the second check get the previous answer instead of waiting
+    assert second[0] == (False, {"status": "not ready", "warmup": "done", "database": "database unreachable"})
+    assert all(ready for ready, _ in second[1:])
+
+
+def test_timed_out_check_is_not_repeated():
+    """While a timed-out ping still runs, later probes report the timeout instead of starting another"""
+    release = threading.Event()
+    calls = []
+
+    def ping():
+        calls.append(1)
+        release.wait(5)
+
+    readiness = Readiness(ping, check_seconds=0.0, timeout_seconds=0.05)
+    readiness.warmed_up = True
+
+    async def go():
+        results = []
+        for _ in range(5):
+            results.append(await readiness.status())
+            await asyncio.sleep(0.06)
+        release.set()
+        await asyncio.sleep(0.05)
+        results.append(await readiness.status())
+        return results
+
+    results = asyncio.run(go())
+    assert [ready for ready, _ in results] == [False] * 5 + [True]
+    assert results[0][1]["database"] == "TimeoutError"
+    assert len(calls) == 2
+
+
+def test_ping_does_not_wait_for_the_writer(tmp_path):
+    """The readiness ping answers while a long write holds SQLite's single writer connection"""
+    reader, writer = create_sqlite_engines(f"sqlite:///{tmp_path / 'test.db'}", settings)
+    router = EngineRouter(reader, writer=writer)
+    with writer.connect():
+        router.ping()
+    reader.dispose()
+    writer.dispose()
+
+
+def test_failed_step_is_retried():
+    """A step that fails (database not up yet) is retried until it passes; only then is the app ready"""
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("not yet")
+
+    readiness = Readiness(lambda: None)
+    asyncio.run(warm_up([("flaky", flaky)], readiness, retry_min_seconds=0.01))
+    assert len(attempts) == 3 and readiness.warmed_up
+
+
+def test_router_warm_up_fills_pools(tmp_path):
+    """Warm-up leaves connections idle in each pool, capped by pool size; a dead replica is marked down"""
+    reader, writer = create_sqlite_engines(f"sqlite:///{tmp_path / 'test.db'}", settings)
+    SQLModel.metadata.create_all(bind=writer)
+    replica, _ = create_sqlite_engines(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}", settings)
+    router = EngineRouter(reader, writer=writer, replicas=[replica])
+
+    router.warm_up(3)
+    assert reader.pool.checkedin() == 3
+    assert writer.pool.checkedin() == 1
+    assert router.reader() is reader  # the replica could not be opened
+    router.ping()
+
+    for engine in (reader, writer, replica):
+        engine.dispose()
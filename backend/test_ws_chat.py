@@ -0,0 +1,120 @@
+# backend/test_ws_chat.py
+"""
+Test script for the authenticated WebSocket chat channel
+"""
+
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from main import app
+from models import settings
+from routes.ws_chat import stream_chunks
+
+
+@pytest.fixture
+def client():
+    """Create a test client for the FastAPI app"""
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def token(client):
+    """Register a fresh user and return their bearer token"""
+    name = f"ws_{uuid.uuid4().hex[:12]}"
+    response = client.post("/auth/register", json={
+        "email": f"{name}@example.com", "username": name, "password": "secret123"
+    })
+    return response.json()["access_token"]
+
+
+def receive_turn(websocket):
+    frames = [websocket.receive_json()]
+    while frames[-1]["type"] not in ("done", "error"):
+        frames.append(websocket.receive_json())
+    return frames
+
+
+def test_stream_chunks_rebuild_response():
+    """Chunks concatenate back to the original response"""
+    text = "Here are your all tasks:\nTask #1: 'buy milk' (pending)\nTask #2: 'walk the dog' (completed)"
+    chunks = list(stream_chunks(text, 16))
+    assert "".join(chunks) == text
+    assert len(chunks) > 1
+
+
+def test_many_turns_on_one_connection(client, token):
+    """One authenticated connection carries several streamed turns"""
+    with client.websocket_connect(f"/ws/chat?token={token}") as websocket:
+        assert websocket.receive_json() == {"type": "ready"}
+
+        websocket.send_json({"type": "message", "id": 1, "message": "add task to buy milk"})
+        frames = receive_turn(websocket)
+        assert frames[0]["type"] == "start"
+        done = frames[-1]
+        assert done["type"] == "done"
+        assert "".join(f["content"] for f in frames if f["type"] == "delta") == done["response"]
+        assert done["tool_calls"][0]["name"] == "add_task"
+
+        websocket.send_json({
+            "type": "message", "id": 2, "message": "show my tasks", "conversation_id": done["conversation_id"]
+        })
+        second = receive_turn(websocket)[-1]
+        assert second["type"] == "done"
+        assert second["conversation_id"] == done["conversation_id"]
+        assert "buy milk" in second["response"]
+
+        websocket.send_json({"type": "ping", "id": 3})
+        assert websocket.receive_json() == {"type": "pong", "id": 3}
+
+
+def test_conversation_belongs_to_user(client, token):
+    """Continuing another user's conversation is refused"""
+    with client.websocket_connect(f"/ws/chat?token={token}") as websocket:
+        websocket.receive_json()
+        websocket.send_json({"type": "message", "id": 1, "message": "show my tasks"})
+        conversation_id = receive_turn(websocket)[-1]["conversation_id"]
+
+    name = f"ws_{uuid.uuid4().hex[:12]}"
+    other = client.post("/auth/register", json={
+        "email": f"{name}@example.com", "username": name, "password": "secret123"
+    }).json()["access_token"]
+    with client.websocket_connect(f"/ws/chat?token={other}") as websocket:
+        websocket.receive_json()
+        websocket.send_json({"type": "message", "id": 1, "message": "show my tasks", "conversation_id": conversation_id})
+        assert websocket.receive_json() == {"type": "error", "id": 1, "detail": "Conversation not found"}
+
+
+def test_bad_frames_keep_connection_open(client, token):
+    """Frames that are not JSON, or not JSON objects, get an error frame and the connection carries on"""
+    with client.websocket_connect(f"/ws/chat?token={token}") as websocket:
+        assert websocket.receive_json() == {"type": "ready"}
+        for frame in ("not json", "[1, 2]", '"message"'):
+            websocket.send_text(frame)
+            assert websocket.receive_json() == {"type": "error", "id": None, "detail": "Frames must be JSON objects"}
+
+        websocket.send_json({"type": "ping", "id": 1})
+        assert websocket.receive_json() == {"type": "pong", "id": 1}
+
+
+def test_rejects_bad_token(client):
+    """Connections without a valid token are closed"""
+    with client.websocket_connect("/ws/chat?token=not-a-token") as websocket:
+        assert websocket.receive_json()["type"] == "error"
+        with pytest.raises(WebSocketDisconnect) as exc:
+            websocket.receive_json()
+    assert exc.value.code == 4401
+
+
+def test_idle_timeout(client, token, monkeypatch):
+    """Idle connections are closed by the server"""
+    monkeypatch.setattr(settings, "ws_idle_timeout_seconds", 0.1)
+    with client.websocket_connect(f"/ws/chat?token={token}") as websocket:
+        assert websocket.receive_json() == {"type": "ready"}
+        assert websocket.receive_json()["detail"] == "Idle timeout"
+        with pytest.raises(WebSocketDisconnect) as exc:
+            websocket.receive_json()
+    assert exc.value.code == 4408
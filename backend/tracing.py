@@ -0,0 +1,329 @@
+"""
+Lightweight in-process tracing
+
+A trace is a tree of spans. start_trace() opens the root span for an
+incoming request (HTTP, a WebSocket chat turn, an MCP WebSocket call); it
+continues the caller's trace when given a W3C `traceparent`, and otherwise
+samples a new trace with probability TRACING_SAMPLE_RATE. span() opens a
+child of the current span. The current span lives in a context variable, so
+it follows the request into asyncio tasks and asyncio.to_thread workers
+without being passed around.
+
+When the request is not sampled there is no current span: span() is one
+context variable lookup returning a shared no-op span, and nothing is
+recorded. With TRACING_ENABLED off nothing is ever sampled, and the HTTP
+middleware and the SQLAlchemy hooks are not installed.
+
+Finished spans are batched and appended to TRACING_EXPORT_PATH as OTLP/JSON
+(one ExportTraceServiceRequest per line, the format of the OpenTelemetry
+collector's file exporter), rotated to `<path>.1` past TRACING_MAX_BYTES.
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_HEADER = b"traceparent"
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation; use as a context manager to make it the current span"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "attributes",
+                 "start_ns", "end_ns", "error", "_token")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: str = "internal",
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+        self._token = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def end(self, error: Optional[BaseException] = None):
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        tracer.exporter.export(self)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        self.end(exc)
+
+
+class NoopSpan:
+    """Stands in for a span when the request is not sampled"""
+
+    traceparent = None
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def end(self, error: Optional[BaseException] = None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+def span(name: str, kind: str = "internal", **attributes):
+    """A child of the current span, or the no-op span outside a sampled trace"""
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(name, parent.trace_id, parent.span_id, kind, attributes)
+
+
+def start_trace(name: str, traceparent: Optional[str] = None, kind: str = "server", **attributes):
+    """
+    The root span of a request: a continuation of the caller's trace when
+    `traceparent` is valid (sampled or not, as the caller decided),
+    otherwise a new trace if this one is sampled
+    """
+    if not tracer.enabled:
+        return NOOP_SPAN
+    match = _TRACEPARENT.match(traceparent) if traceparent else None
+    if match:
+        trace_id, parent_id, flags = match.groups()
+        if not int(flags, 16) & 1:
+            return NOOP_SPAN
+        return Span(name, trace_id, parent_id, kind, attributes)
+    if random.random() >= tracer.sample_rate:
+        return NOOP_SPAN
+    return Span(name, f"{random.getrandbits(128):032x}", None, kind, attributes)
+
+
+def current_traceparent() -> Optional[str]:
+    """traceparent to send with an outgoing call, so the callee joins the trace"""
+    current = _current_span.get()
+    return current.traceparent if current is not None else None
+
+
+def _attribute(key: str, value) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def otlp_span(finished: Span) -> Dict[str, Any]:
+    """A finished span in OTLP/JSON form"""
+    record = {
+        "traceId": finished.trace_id,
+        "spanId": finished.span_id,
+        "name": finished.name,
+        "kind": _SPAN_KINDS.get(finished.kind, 1),
+        "startTimeUnixNano": str(finished.start_ns),
+        "endTimeUnixNano": str(finished.end_ns),
+        "attributes": [_attribute(key, value) for key, value in finished.attributes.items()],
+        "status": {"code": 2, "message": finished.error} if finished.error else {"code": 1},
+    }
+    if finished.parent_id:
+        record["parentSpanId"] = finished.parent_id
+    return record
+
+
+class NullExporter:
+    def export(self, finished: Span):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class OTLPFileExporter:
+    """Batches finished spans and appends them to a file as OTLP/JSON lines"""
+
+    def __init__(self, path: str, service_name: str, max_bytes: int = 100 * 1024 * 1024,
+                 flush_interval: float = 1.0, max_batch: int = 512):
+        self.path = path
+        self.service_name = service_name
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending: List[Span] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def export(self, finished: Span):
+        with self._lock:
+            self._pending.append(finished)
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except OSError as e:
+                logger.error(f"Trace export failed: {str(e)}")
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        request = {"resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{"scope": {"name": "todo-chatbot"}, "spans": [otlp_span(s) for s in batch]}],
+        }]}
+        line = json.dumps(request, separators=(",", ":")) + "\n"
+        if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+            os.replace(self.path, f"{self.path}.1")
+        with open(self.path, "a") as f:
+            f.write(line)
+
+
+class Tracer:
+    """Process-wide tracing configuration"""
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.exporter = NullExporter()
+
+
+tracer = Tracer()
+
+
+def configure_tracing(settings, service_name: str):
+    """Set up tracing from settings; returns the exporter to start and stop with the app"""
+    tracer.enabled = settings.tracing_enabled
+    tracer.sample_rate = settings.tracing_sample_rate
+    if settings.tracing_enabled:
+        tracer.exporter = OTLPFileExporter(
+            settings.tracing_export_path,
+            service_name,
+            max_bytes=settings.tracing_max_bytes,
+            flush_interval=settings.tracing_flush_interval_seconds,
+        )
+    else:
+        tracer.exporter = NullExporter()
+    return tracer.exporter
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    parent = _current_span.get()
+    if parent is not None:
+        context._trace_span = Span("db.query", parent.trace_id, parent.span_id, "client", {
+            "db.system": conn.dialect.name,
+            "db.statement": statement[:500],
+        })
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    query_span = getattr(context, "_trace_span", None)
+    if query_span is not None:
+        query_span.set_attribute("db.rows", cursor.rowcount)
+        query_span.end()
+
+
+def _handle_error(exception_context):
+    context = exception_context.execution_context
+    query_span = getattr(context, "_trace_span", None) if context is not None else None
+    if query_span is not None:
+        query_span.end(exception_context.original_exception)
+
+
+def instrument_engine(engine):
+    """Record a db.query span for every statement run inside a sampled trace"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+
+
+class TracingMiddleware:
+    """ASGI middleware opening the root span of each HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == TRACEPARENT_HEADER:
+                traceparent = value.decode("latin-1")
+                break
+        root = start_trace(f"{scope['method']} {scope['path']}", traceparent,
+                           **{"http.method": scope["method"], "http.target": scope["path"]})
+        if root is NOOP_SPAN:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+                headers = list(message.get("headers", [])) + [(TRACEPARENT_HEADER, root.traceparent.encode())]
+                message = dict(message, headers=headers)
+            await send(message)
+
+        with root:
+            await self.app(scope, receive, send_with_trace)
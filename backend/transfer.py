@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Streaming NDJSON export and bulk import of a user's data
+
+Export walks server-side cursors (`stream_results` + `yield_per`) and emits
+one JSON object per line in ~64 KiB chunks, so memory stays flat however
+many rows a user has. Lines are typed:
+
+    {"type": "task", "id": 1, "title": ..., "description": ..., "completed": false, "completed_at": ..., "created_at": ..., "updated_at": ...}
+    {"type": "conversation", "id": 3, "created_at": ..., "updated_at": ...}
+    {"type": "message", "id": 9, "conversation_id": 3, "role": "user", "content": ..., "created_at": ...}
+
+Each conversation line is followed by its messages, archived ones included.
+Import takes the same lines in batches: tasks and messages are written with
+one executemany INSERT per batch (COPY on PostgreSQL with psycopg2),
+conversations get new ids and their messages are re-pointed to them.
+"""
+
+import io
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import bindparam, insert, select, update
+
+from archive import decode_block
+from conversations import preview
+from models import Conversation, Message, MessageArchive, Task
+from task_sync import next_seq
+
+
+CHUNK_BYTES = 64 * 1024
+
+
+class BulkImportError(Exception):
+    """A line of an import stream could not be imported"""
+
+    def __init__(self, line: int, message: str):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+        self.message = message
+
+
+class TaskRecord(BaseModel):
+    title: str
+    description: Optional[str] = None
+    completed: bool = False
+    completed_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+class ConversationRecord(BaseModel):
+    id: int
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+class MessageRecord(BaseModel):
+    conversation_id: int
+    role: str
+    content: str
+    created_at: Optional[datetime] = None
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _ndjson_chunks(records: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """Serialize records one per line, grouped into chunks of about CHUNK_BYTES"""
+    lines = []
+    size = 0
+    for record in records:
+        line = json.dumps(record, separators=(",", ":"), default=_default) + "\n"
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield "".join(lines).encode("utf-8")
+            lines = []
+            size = 0
+    if lines:
+        yield "".join(lines).encode("utf-8")
+
+
+def export_tasks(engine, user_id, fetch_size: int = 1000) -> Iterator[bytes]:
+    """Stream the user's tasks as NDJSON chunks"""
+    statement = (
+        select(Task.id, Task.title, Task.description, Task.completed, Task.completed_at, Task.created_at,
+               Task.updated_at)
+        .where(Task.user_id == user_id, Task.deleted == False)
+        .order_by(Task.id)
+    )
+    with engine.connect() as conn:
+        rows = conn.execute(statement, execution_options={"stream_results": True, "yield_per": fetch_size})
+        yield from _ndjson_chunks(
+            {
+                "type": "task",
+                "id": task_id,
+                "title": title,
+                "description": description,
+                "completed": completed,
+                "completed_at": completed_at,
+                "created_at": created_at,
+                "updated_at": updated_at,
+            }
+            for task_id, title, description, completed, completed_at, created_at, updated_at in rows
+        )
+
+
+class _Peekable:
+    def __init__(self, iterator):
+        self._iterator = iter(iterator)
+        self.head = next(self._iterator, None)
+
+    def advance(self):
+        self.head = next(self._iterator, None)
+
+
+def _conversation_records(conversations, blocks, messages) -> Iterator[Dict[str, Any]]:
+    """Merge three cursors ordered by conversation id into conversation + message lines"""
+    blocks = _Peekable(blocks)
+    messages = _Peekable(messages)
+    for conversation_id, created_at, updated_at in conversations:
+        yield {"type": "conversation", "id": conversation_id, "created_at": created_at, "updated_at": updated_at}
+
+        # Skip rows of conversations that are not in the export (none, normally)
+        while blocks.head is not None and blocks.head.conversation_id < conversation_id:
+            blocks.advance()
+        while blocks.head is not None and blocks.head.conversation_id == conversation_id:
+            for message in decode_block(blocks.head):
+                yield {"type": "message", "conversation_id": conversation_id, **message}
+            blocks.advance()
+
+        while messages.head is not None and messages.head[1] < conversation_id:
+            messages.advance()
+        while messages.head is not None and messages.head[1] == conversation_id:
+            message_id, _, role, content, message_created_at = messages.head
+            yield {
+                "type": "message",
+                "id": message_id,
+                "conversation_id": conversation_id,
+                "role": role,
+                "content": content,
+                "created_at": message_created_at,
+            }
+            messages.advance()
+
+
+def export_conversations(engine, user_id, fetch_size: int = 1000) -> Iterator[bytes]:
+    """Stream the user's conversations, each followed by its messages, as NDJSON chunks"""
+    streaming = {"stream_results": True, "yield_per": fetch_size}
+    with engine.connect() as conn:
+        conversations = conn.execute(
+            select(Conversation.id, Conversation.created_at, Conversation.updated_at)
+            .where(Conversation.user_id == user_id)
+            .order_by(Conversation.id),
+            execution_options=streaming,
+        )
+        # Archive blocks hold up to ARCHIVE_BATCH_SIZE messages each, so fetch few at a time
+        blocks = conn.execute(
+            select(MessageArchive.conversation_id, MessageArchive.codec, MessageArchive.payload)
+            .where(MessageArchive.user_id == user_id)
+            .order_by(MessageArchive.conversation_id, MessageArchive.first_message_id),
+            execution_options={"stream_results": True, "yield_per": 16},
+        )
+        messages = conn.execute(
+            select(Message.id, Message.conversation_id, Message.role, Message.content, Message.created_at)
+            .where(Message.user_id == user_id)
+            .order_by(Message.conversation_id, Message.id),
+            execution_options=streaming,
+        )
+        yield from _ndjson_chunks(_conversation_records(conversations, blocks, messages))
+
+
+async def read_line_batches(chunks: AsyncIterator[bytes], batch_size: int,
+                            max_line_bytes: int) -> AsyncIterator[List[bytes]]:
+    """Split a byte stream into batches of complete lines (blank lines are kept, for line numbers)"""
+    buffer = b""
+    batch = []
+    lines_read = 0
+    async for chunk in chunks:
+        buffer += chunk
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        batch.extend(lines)
+        if len(buffer) > max_line_bytes:
+            raise BulkImportError(lines_read + len(batch) + 1, f"Line longer than {max_line_bytes} bytes")
+        if len(batch) >= batch_size:
+            lines_read += len(batch)
+            yield batch
+            batch = []
+    if buffer:
+        batch.append(buffer)
+    if batch:
+        yield batch
+
+
+class BulkImporter:
+    """Writes batches of NDJSON lines for one user"""
+
+    def __init__(self, engine, user_id):
+        self.engine = engine
+        self.user_id = user_id
+        self.counts = {"task": 0, "conversation": 0, "message": 0}
+        self.lines_read = 0
+        # Exported conversation id -> id of the imported copy
+        self._conversation_ids: Dict[int, int] = {}
+
+    def write_lines(self, lines: List[bytes]):
+        """Parse a batch and write it in one transaction"""
+        first_line = self.lines_read + 1
+        self.lines_read += len(lines)
+        tasks = []
+        messages = []
+        # Conversations of this batch; kept apart until the batch commits
+        conversation_ids: Dict[int, int] = {}
+        now = datetime.utcnow()
+
+        with self.engine.begin() as conn:
+            for offset, line in enumerate(lines):
+                if not line.strip():
+                    continue
+                line_number = first_line + offset
+                try:
+                    record = json.loads(line)
+                    record_type = record.get("type")
+                    if record_type == "task":
+                        task = TaskRecord.model_validate(record)
+                        updated_at = task.updated_at or task.created_at or now
+                        tasks.append({
+                            "user_id": self.user_id,
+                            "title": task.title,
+                            "description": task.description,
+                            "completed": task.completed,
+                            # Older exports have no completion time; the last update is the best guess
+                            "completed_at": (task.completed_at or updated_at) if task.completed else None,
+                            "created_at": task.created_at or now,
+                            "updated_at": updated_at,
+                        })
+                    elif record_type == "message":
+                        message = MessageRecord.model_validate(record)
+                        conversation_id = conversation_ids.get(message.conversation_id,
+                                                               self._conversation_ids.get(message.conversation_id))
+                        if conversation_id is None:
+                            raise BulkImportError(line_number, f"Message for unknown conversation {message.conversation_id}")
+                        messages.append({
+                            "user_id": self.user_id,
+                            "conversation_id": conversation_id,
+                            "role": message.role,
+                            "content": message.content,
+                            "created_at": message.created_at or now,
+                        })
+                    elif record_type == "conversation":
+                        conversation = ConversationRecord.model_validate(record)
+                        # Conversations are rare next to messages; insert one by one to learn the new id
+                        created = conn.execute(insert(Conversation).values(
+                            user_id=self.user_id,
+                            created_at=conversation.created_at or now,
+                            updated_at=conversation.updated_at or conversation.created_at or now,
+                        ))
+                        conversation_ids[conversation.id] = created.inserted_primary_key[0]
+                    else:
+                        raise BulkImportError(line_number, f"Unknown record type: {record_type}")
+                except (ValueError, AttributeError, ValidationError) as e:
+                    raise BulkImportError(line_number, str(e))
+
+            if tasks:
+                # Reserve one block of change sequence numbers for the batch, and count it in the stats
+                completed = sum(1 for task in tasks if task["completed"])
+                completed_today = sum(
+                    1 for task in tasks if task["completed"] and task["completed_at"].date() == now.date()
+                )
+                first_seq = next_seq(conn, self.user_id, len(tasks), total=len(tasks), completed=completed,
+                                     completed_today=completed_today) - len(tasks) + 1
+                for offset, task in enumerate(tasks):
+                    task["seq"] = first_seq + offset
+            self._insert_rows(conn, Task, tasks)
+            self._insert_rows(conn, Message, messages)
+            self._count_messages(conn, messages)
+
+        self._conversation_ids.update(conversation_ids)
+        self.counts["task"] += len(tasks)
+        self.counts["conversation"] += len(conversation_ids)
+        self.counts["message"] += len(messages)
+
+    def _count_messages(self, conn, messages: List[Dict[str, Any]]):
+        """Add the batch's messages to their conversations' counts and previews"""
+        latest: Dict[int, Dict[str, Any]] = {}
+        counts: Dict[int, int] = {}
+        for message in messages:
+            conversation_id = message["conversation_id"]
+            counts[conversation_id] = counts.get(conversation_id, 0) + 1
+            latest[conversation_id] = message
+        if not counts:
+            return
+        conn.execute(
+            update(Conversation)
+            .where(Conversation.id == bindparam("conversation_id"))
+            .values(message_count=Conversation.message_count + bindparam("count"),
+                    last_message_preview=bindparam("preview")),
+            [
+                {"conversation_id": conversation_id, "count": count,
+                 "preview": preview(latest[conversation_id]["content"])}
+                for conversation_id, count in counts.items()
+            ],
+        )
+
+    def _insert_rows(self, conn, model, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        if conn.dialect.name == "postgresql" and conn.dialect.driver == "psycopg2":
+            copy_rows(conn, model.__table__, rows)
+        else:
+            # executemany: one prepared INSERT for the whole batch, inside one transaction
+            conn.execute(insert(model), rows)
+
+
+def copy_csv_field(value: Any) -> str:
+    """
+    One field of COPY's CSV format. Strings are quoted so '' stays an empty
+    string; None is written as a bare empty field, which COPY reads as NULL
+    (csv.QUOTE_NONNUMERIC would quote it as "", an empty string).
+    """
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def copy_csv(rows: List[Dict[str, Any]], columns: List[str]) -> io.StringIO:
+    """The rows as a COPY ... FROM STDIN WITH (FORMAT csv) input"""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(",".join(copy_csv_field(row[column]) for column in columns))
+        buffer.write("\n")
+    buffer.seek(0)
+    return buffer
+
+
+def copy_rows(conn, table, rows: List[Dict[str, Any]]):
+    """
+    Load rows into a Table with COPY FROM STDIN on the connection's current
+    transaction. COPY applies no client-side defaults, and the models' live
+    only there (create_all emits no DEFAULT), so columns the rows leave out
+    get them here.
+    """
+    defaults = {
+        column.name: column.default.arg(None) if column.default.is_callable else column.default.arg
+        for column in table.columns
+        if column.name not in rows[0] and column.default is not None
+    }
+    if defaults:
+        rows = [{**row, **defaults} for row in rows]
+    columns = list(rows[0])
+    buffer = copy_csv(rows, columns)
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
@@ -0,0 +1,87 @@
+"""
+Startup warm-up and readiness
+
+Right after a cold start the first requests pay for work that is only
+done once: connecting to the database (and applying the SQLite pragmas to
+each connection), generating the tools' JSON schemas, compiling the rule
+agent's regular expressions, building the OpenAPI document and reading the
+frontend's HTML from disk. warm_up() does all of it in the background as
+soon as the app starts, step by step in a worker thread, retrying a failed
+step (typically: the database is not reachable yet) with backoff.
+
+/ready reports not ready until warm-up has finished and while the
+database does not answer, so a load balancer only routes to warm workers.
+The database check is cached for READY_DB_CHECK_SECONDS and never runs
+twice at once, not even after one timed out: probes arriving during a
+check get the previous result, so any number of probes costs one trivial
+query per interval. /health stays
+a pure liveness probe that answers as long as the process serves requests.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    """Warm-up state plus a cached, single-flight database check"""
+
+    def __init__(self, ping: Callable[[], Any], check_seconds: float = 2.0, timeout_seconds: float = 1.0):
+        self.ping = ping
+        self.check_seconds = check_seconds
+        self.timeout_seconds = timeout_seconds
+        self.reset()
+
+    def reset(self):
+        self.warmed_up = False
+        self._checked_at: Optional[float] = None
+        self._database_error: Optional[str] = None
+        # The running check; one that timed out keeps its thread until the query returns
+        self._probe: Optional[asyncio.Future] = None
+
+    async def status(self) -> Tuple[bool, Dict[str, str]]:
+        """(ready, details) for the /ready endpoint"""
+        if not self.warmed_up:
+            return False, {"status": "not ready", "warmup": "pending"}
+
+        now = time.monotonic()
+        idle = self._probe is None or self._probe.done()
+        if idle and (self._checked_at is None or now - self._checked_at >= self.check_seconds):
+            self._probe = asyncio.ensure_future(asyncio.to_thread(self.ping))
+            self._probe.add_done_callback(lambda probe: probe.cancelled() or probe.exception())
+            try:
+                await asyncio.wait_for(asyncio.shield(self._probe), self.timeout_seconds)
+                self._database_error = None
+            except Exception as e:
+                self._database_error = str(e) or type(e).__name__
+            finally:
+                self._checked_at = time.monotonic()
+
+        if self._checked_at is None:
+            database = "checking"
+        else:
+            database = "ok" if self._database_error is None else self._database_error
+        ready = database == "ok"
+        return ready, {"status": "ready" if ready else "not ready", "warmup": "done", "database": database}
+
+
+async def warm_up(steps: List[Tuple[str, Callable[[], Any]]], readiness: Readiness,
+                  retry_min_seconds: float = 0.5, retry_max_seconds: float = 30.0):
+    """Run each (name, blocking function) step in a worker thread, then mark the app ready"""
+    for name, step in steps:
+        delay = retry_min_seconds
+        while True:
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(step)
+                break
+            except Exception as e:
+                logger.warning(f"Warm-up step {name} failed, retrying in {delay:.1f}s: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, retry_max_seconds)
+        logger.info(f"Warm-up step {name} took {(time.perf_counter() - started) * 1e3:.1f} ms")
+    readiness.warmed_up = True
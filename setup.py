@@ -18,6 +18,7 @@ setup(
         "python-jose[cryptography]==3.3.0",
         "passlib[bcrypt]==1.7.4",
         "websockets==12.0",
+        "httpx==0.25.2",
         "bcrypt==4.0.1",
         "psycopg2-binary",
         "pg8000==1.29.8",